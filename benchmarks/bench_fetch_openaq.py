@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pandas as pd
+import requests
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "etl"))
+import fetch_openaq  # noqa: E402
+from fetch_openaq import Config  # noqa: E402
+class MockOpenAQ(BaseHTTPRequestHandler):
+    records_per_interval = 5000
+    latency = 0.05
+    throttle_every = 0
+    requests_seen = 0
+    lock = threading.Lock()
+    def log_message(self, *args):
+        pass
+    def do_GET(self):
+        with MockOpenAQ.lock:
+            MockOpenAQ.requests_seen += 1
+            seen = MockOpenAQ.requests_seen
+        time.sleep(self.latency)
+        if self.throttle_every and seen % self.throttle_every == 0:
+            self.send_response(429)
+            self.send_header("Retry-After", "0.2")
+            self.end_headers()
+            return
+        qs = parse_qs(urlparse(self.path).query)
+        limit = int(qs["limit"][0])
+        page = int(qs["page"][0])
+        start = (page - 1) * limit
+        n = max(0, min(limit, self.records_per_interval - start))
+        ts = pd.Timestamp(qs["date_from"][0])
+        results = [
+            {
+                "locationId": i % 40,
+                "location": f"site {i % 40}",
+                "parameter": qs["parameter"][0],
+                "value": float(i % 50),
+                "unit": "µg/m³",
+                "date": {"utc": (ts + pd.Timedelta(minutes=start + i)).isoformat(), "local": None},
+                "coordinates": {"latitude": 40.7, "longitude": -74.0},
+                "country": "US",
+                "city": None,
+            }
+            for i in range(n)
+        ]
+        body = json.dumps({"meta": {"found": self.records_per_interval}, "results": results}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+def serial_baseline(url: str):
+    total = 0
+    for start_date in Config.DATE_RANGE:
+        end_date = start_date + pd.DateOffset(months=1) - pd.Timedelta(seconds=1)
+        for param in Config.PARAMETERS:
+            page = 1
+            records = []
+            while True:
+                params = fetch_openaq.get_api_params(
+                    param,
+                    start_date.strftime("%Y-%m-%dT%H:%M:%S+00:00"),
+                    end_date.strftime("%Y-%m-%dT%H:%M:%S+00:00"),
+                    page,
+                )
+                resp = requests.get(url, params=params)
+                if resp.status_code == 429:
+                    time.sleep(60)
+                    continue
+                data = resp.json()
+                results = data["results"]
+                if not results:
+                    break
+                records.extend(results)
+                if len(records) >= data["meta"]["found"] or len(results) < Config.LIMIT:
+                    break
+                page += 1
+                time.sleep(0.5)
+            total += len(records)
+    return total
+def run(months: int, records: int, limit: int, workers: int, rate: float, skip_serial: bool):
+    MockOpenAQ.records_per_interval = records
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockOpenAQ)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/v2/measurements"
+    Config.LIMIT = limit
+    Config.DATE_RANGE = pd.date_range("2023-01-01", periods=months, freq="MS")
+    pages = months * len(Config.PARAMETERS) * -(-records // limit)
+    print(f"{months} months x {len(Config.PARAMETERS)} parameters, {pages} pages of {limit}")
+    try:
+        if not skip_serial:
+            t0 = time.perf_counter()
+            total = serial_baseline(url)
+            dt = time.perf_counter() - t0
+            print(
+                f"serial (0.5s page sleep): {total} records in {dt:6.1f}s "
+                f"({total / dt:,.0f} records/s)"
+            )
+        with tempfile.TemporaryDirectory() as out:
+            Config.OUTPUT_DIR = out
+            Config.CHECKPOINT_DIR = os.path.join(out, "_partial")
+            fetch_openaq.configure(workers=workers, rate=rate, burst=workers, api_url=url)
+            MockOpenAQ.throttle_every = 25
+            t0 = time.perf_counter()
+            fetch_openaq.run_collection()
+            dt = time.perf_counter() - t0
+            total = months * len(Config.PARAMETERS) * records
+            print(
+                f"engine ({workers} workers, {rate}/s): {total} records in {dt:6.1f}s "
+                f"({total / dt:,.0f} records/s)"
+            )
+    finally:
+        server.shutdown()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="fetch throughput against a local mock OpenAQ server")
+    parser.add_argument("--months", type=int, default=6)
+    parser.add_argument("--records", type=int, default=5000, help="records per month and parameter")
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=40.0)
+    parser.add_argument("--skip-serial", action="store_true")
+    args = parser.parse_args()
+    run(args.months, args.records, args.limit, args.workers, args.rate, args.skip_serial)
@@ -0,0 +1,123 @@
+import argparse
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "etl"))
+import fetch_openaq_bulk  # noqa: E402
+from fetch_openaq_bulk import Config  # noqa: E402
+RANGE_RE = re.compile(r"bytes=(\d+)-(\d*)")
+class RangeServer(BaseHTTPRequestHandler):
+    root = "."
+    latency = 0.02
+    bandwidth = 50e6
+    bytes_served = 0
+    lock = threading.Lock()
+    def log_message(self, *args):
+        pass
+    def _path(self):
+        return os.path.join(self.root, os.path.basename(self.path))
+    def do_HEAD(self):
+        path = self._path()
+        if not os.path.exists(path):
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+    def do_GET(self):
+        path = self._path()
+        if not os.path.exists(path):
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        m = RANGE_RE.match(self.headers.get("Range", ""))
+        start, end = 0, size - 1
+        if m:
+            start = int(m.group(1))
+            end = min(size - 1, int(m.group(2))) if m.group(2) else size - 1
+        with open(path, "rb") as f:
+            f.seek(start)
+            body = f.read(end - start + 1)
+        time.sleep(self.latency + len(body) / self.bandwidth)
+        with RangeServer.lock:
+            RangeServer.bytes_served += len(body)
+        self.send_response(206 if m else 200)
+        if m:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+def make_file(path: str, rows: int, seed: int, row_group_size: int):
+    rng = np.random.default_rng(seed)
+    site = np.sort(rng.integers(0, 2000, rows))
+    site_lat = np.random.default_rng(0).uniform(25.0, 49.0, 2000)
+    site_lon = np.random.default_rng(1).uniform(-124.0, -67.0, 2000)
+    order = np.argsort(site_lat[site], kind="stable")
+    site = site[order]
+    ts = pd.Timestamp("2016-01-01", tz="UTC") + pd.to_timedelta(
+        rng.integers(0, 10 * 365 * 24 * 3600, rows), unit="s"
+    )
+    lat = site_lat[site]
+    lon = site_lon[site]
+    table = pa.table(
+        {
+            "location": pa.array(site.astype(str)),
+            "parameter": pa.array(rng.choice(["co", "no2", "o3", "pm10", "pm25", "so2"], rows)),
+            "value": rng.gamma(2.0, 6.0, rows),
+            "unit": pa.array(["µg/m³"] * rows),
+            "country": pa.array(["US"] * rows),
+            "datetime": pa.array(ts),
+            "latitude": lat,
+            "longitude": lon,
+        }
+    )
+    pq.write_table(table, path, row_group_size=row_group_size)
+def run(files: int, rows: int, row_group_size: int, workers: int, bandwidth: float):
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(files):
+            make_file(os.path.join(tmp, f"part-{i:03d}.parquet"), rows, i, row_group_size)
+        total_mb = sum(os.path.getsize(os.path.join(tmp, n)) for n in os.listdir(tmp)) / 1e6
+        RangeServer.root = tmp
+        RangeServer.bandwidth = bandwidth
+        server = ThreadingHTTPServer(("127.0.0.1", 0), RangeServer)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        Config.BULK_URLS = [
+            f"http://127.0.0.1:{server.server_port}/part-{i:03d}.parquet" for i in range(files)
+        ]
+        print(f"{files} files x {rows} rows ({total_mb:.1f}MB), served at {bandwidth / 1e6:.0f}MB/s")
+        results = {}
+        try:
+            for mode, n_workers in (("download", 1), ("range", workers)):
+                RangeServer.bytes_served = 0
+                Config.OUTPUT_FILE = os.path.join(tmp, "out", f"{mode}.parquet")
+                t0 = time.perf_counter()
+                fetch_openaq_bulk.run(mode, n_workers)
+                dt = time.perf_counter() - t0
+                out_rows = pq.ParquetFile(Config.OUTPUT_FILE).metadata.num_rows
+                results[mode] = dt
+                print(
+                    f"{mode:>8} ({n_workers} workers): {dt:6.2f}s  "
+                    f"{RangeServer.bytes_served / 1e6:7.1f}MB served  {out_rows} rows kept"
+                )
+        finally:
+            server.shutdown()
+        print(f"speedup {results['download'] / results['range']:.1f}x")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="download-then-filter vs range-request row group reads")
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--row-group-size", type=int, default=50_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--bandwidth", type=float, default=50e6, help="simulated bytes/s per request")
+    args = parser.parse_args()
+    run(args.files, args.rows, args.row_group_size, args.workers, args.bandwidth)
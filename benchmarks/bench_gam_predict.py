@@ -0,0 +1,55 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from pygam import LinearGAM, s
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "analysis"))
+from gam_cache import CachedGAMPredictor  # noqa: E402
+RNG = np.random.default_rng(42)
+def make_data(n: int):
+    X = np.column_stack(
+        [
+            RNG.uniform(4, 14, n),
+            RNG.uniform(5, 40, n),
+            RNG.uniform(0, 0.6, n),
+            RNG.uniform(0, 5000, n),
+            RNG.lognormal(8, 1, n),
+            RNG.integers(2019, 2025, n).astype(float),
+        ]
+    )
+    y = 8 + 0.3 * X[:, 0] + 0.05 * X[:, 1] + 6 * X[:, 2] - 0.0002 * X[:, 3] + RNG.normal(0, 1, n)
+    return X, y
+def perturbed(X, scenarios: int):
+    stack = np.repeat(X[None], scenarios, axis=0)
+    factors = np.linspace(0.6, 0.99, scenarios)
+    stack[:, :, 0] *= factors[:, None]
+    stack[::2, :, 1] *= 0.8
+    return stack
+def run(tracts: int, scenarios: int, repeat: int):
+    X, y = make_data(tracts)
+    model = LinearGAM(s(0) + s(1) + s(2) + s(3) + s(4) + s(5)).fit(X, y)
+    stack = perturbed(X, scenarios).reshape(-1, X.shape[1])
+    rows = np.tile(np.arange(tracts), scenarios)
+    print(f"{tracts} tracts x {scenarios} scenarios perturbing pm25 (and no2 in half)")
+    t0 = time.perf_counter()
+    predictor = CachedGAMPredictor(model, X)
+    print(f"cache build:        {time.perf_counter() - t0:7.3f}s")
+    plain, cached = [], []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        expected = model.predict(stack)
+        plain.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        got = predictor.predict_rows(stack, rows)
+        cached.append(time.perf_counter() - t0)
+    print(f"plain predict:      {min(plain):7.3f}s")
+    print(f"cached predict:     {min(cached):7.3f}s  ({min(plain) / min(cached):.1f}x)")
+    print(f"max abs difference: {np.abs(expected - got).max():.2e}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="plain LinearGAM.predict vs cached per-term basis prediction")
+    parser.add_argument("--tracts", type=int, default=5000)
+    parser.add_argument("--scenarios", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.tracts, args.scenarios, args.repeat)
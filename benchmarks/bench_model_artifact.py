@@ -0,0 +1,81 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import joblib
+import numpy as np
+from pygam import LinearGAM, s, te
+ANALYSIS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "analysis")
+sys.path.insert(0, ANALYSIS_DIR)
+from gam_portable import export_model, load_model  # noqa: E402
+RNG = np.random.default_rng(42)
+COLD_START = """
+import sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {analysis_dir!r})
+import numpy as np
+from gam_portable import load_model
+model = load_model({path!r})
+model.predict(np.load({x_path!r})[:1])
+print(time.perf_counter() - t0)
+"""
+def make_data(n: int):
+    X = np.column_stack(
+        [
+            RNG.uniform(4, 14, n),
+            RNG.uniform(5, 40, n),
+            RNG.uniform(0, 0.6, n),
+            RNG.uniform(0, 5000, n),
+            RNG.lognormal(8, 1, n),
+            RNG.integers(2019, 2025, n).astype(float),
+            RNG.uniform(-80, -70, n),
+            RNG.uniform(38, 45, n),
+        ]
+    )
+    y = 8 + 0.3 * X[:, 0] + 0.05 * X[:, 1] + 6 * X[:, 2] - 0.0002 * X[:, 3] + np.sin(X[:, 6]) + RNG.normal(0, 1, n)
+    return X, y
+def cold_start(path, x_path, runs):
+    code = COLD_START.format(analysis_dir=ANALYSIS_DIR, path=path, x_path=x_path)
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return min(times)
+def throughput(model, X, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        model.predict(X)
+        best = min(best, time.perf_counter() - t0)
+    return len(X) / best
+def run(tracts: int, repeat: int):
+    X, y = make_data(tracts)
+    terms = s(0) + s(1) + s(2) + s(3) + s(4) + s(5) + te(0, 1) + te(6, 7)
+    model = LinearGAM(terms).fit(X, y)
+    X_new = X * RNG.uniform(0.5, 1.5, X.shape)
+    with tempfile.TemporaryDirectory() as tmp:
+        pkl_path = os.path.join(tmp, "gam.pkl")
+        npz_path = os.path.join(tmp, "gam.npz")
+        x_path = os.path.join(tmp, "X.npy")
+        joblib.dump(model, pkl_path)
+        export_model(model, npz_path)
+        np.save(x_path, X_new)
+        print(f"{tracts} tracts, 6 splines + pm25/no2 and lat/lon tensor terms")
+        print(f"artifact size:  pickle {os.path.getsize(pkl_path) / 1024:8.0f}KB   npz {os.path.getsize(npz_path) / 1024:8.0f}KB")
+        pkl_cold = cold_start(pkl_path, x_path, repeat)
+        npz_cold = cold_start(npz_path, x_path, repeat)
+        print(f"cold start:     pickle {pkl_cold:8.3f}s   npz {npz_cold:8.3f}s  ({pkl_cold / npz_cold:.1f}x)")
+        portable = load_model(npz_path)
+    pkl_rate = throughput(model, X_new, repeat)
+    npz_rate = throughput(portable, X_new, repeat)
+    print(f"predictions/s:  pickle {pkl_rate:10,.0f}   npz {npz_rate:10,.0f}  ({npz_rate / pkl_rate:.1f}x)")
+    diff = np.abs(model.predict(X_new) - portable.predict(X_new)).max()
+    print(f"max abs difference: {diff:.2e}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="joblib LinearGAM pickle vs portable npz model with the numpy predictor")
+    parser.add_argument("--tracts", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.tracts, args.repeat)
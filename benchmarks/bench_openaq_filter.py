@@ -0,0 +1,112 @@
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "etl"))
+from openaq_filter import OUTPUT_SCHEMA, filter_batch  # noqa: E402
+from process_openaq_local import Config  # noqa: E402
+def make_batch(rows: int, seed: int) -> pa.RecordBatch:
+    rng = np.random.default_rng(seed)
+    ts = pd.Timestamp("2018-06-01", tz="UTC") + pd.to_timedelta(
+        rng.integers(0, 7 * 365 * 24, rows), unit="h"
+    )
+    return pa.record_batch(
+        {
+            "location": pa.array(rng.integers(0, 500, rows).astype(str)),
+            "parameter": pa.array(rng.choice(["pm25", "PM25", "no2", "o3", "co"], rows)),
+            "value": rng.gamma(2.0, 6.0, rows),
+            "datetime": pa.array(ts.strftime("%Y-%m-%dT%H:%M:%S+00:00")),
+            "lat": rng.uniform(36.0, 45.0, rows),
+            "lon": rng.uniform(-78.0, -69.0, rows),
+        }
+    )
+def _first_present(df, candidates):
+    for c in candidates:
+        if c in df.columns:
+            return c
+    return None
+def old_filter(batch: pa.RecordBatch):
+    df = batch.to_pandas()
+    param_col = _first_present(df, ["parameter", "pollutant"])
+    country_col = _first_present(df, ["country"])
+    lat_col = _first_present(df, ["latitude", "coordinates.latitude", "lat"])
+    lon_col = _first_present(df, ["longitude", "coordinates.longitude", "lon", "lng"])
+    ts_col = _first_present(df, ["date_utc", "utc", "timestamp", "datetime", "date.utc"])
+    df = df.copy()
+    df[param_col] = df[param_col].astype(str).str.lower()
+    df = df[df[param_col].isin(Config.POLLUTANTS)]
+    if country_col:
+        df = df[df[country_col].astype(str).str.upper() == Config.COUNTRY]
+    df[ts_col] = pd.to_datetime(df[ts_col], errors="coerce", utc=True)
+    start = pd.to_datetime(Config.START_DATE, utc=True)
+    end = pd.to_datetime(Config.END_DATE, utc=True) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+    df = df[(df[ts_col] >= start) & (df[ts_col] <= end)]
+    df[lat_col] = pd.to_numeric(df[lat_col], errors="coerce")
+    df[lon_col] = pd.to_numeric(df[lon_col], errors="coerce")
+    bbox = Config.BBOX
+    df = df[
+        (df[lat_col] >= bbox["lat_min"])
+        & (df[lat_col] <= bbox["lat_max"])
+        & (df[lon_col] >= bbox["lon_min"])
+        & (df[lon_col] <= bbox["lon_max"])
+    ]
+    out = pd.DataFrame(
+        {
+            "parameter": df[param_col],
+            "value": df["value"],
+            "latitude": df[lat_col],
+            "longitude": df[lon_col],
+            "timestamp_utc": df[ts_col],
+            "location": df["location"],
+        }
+    ).reindex(columns=OUTPUT_SCHEMA.names)
+    out["value"] = pd.to_numeric(out["value"], errors="coerce")
+    return pa.Table.from_pandas(out, schema=OUTPUT_SCHEMA, preserve_index=False)
+def new_filter(batch: pa.RecordBatch):
+    return filter_batch(batch, Config)
+IMPLS = {"old": old_filter, "new": new_filter}
+def run_impl(impl: str, batches: int, rows: int):
+    data = [make_batch(rows, seed) for seed in range(batches)]
+    fn = IMPLS[impl]
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    kept = 0
+    for batch in data:
+        out = fn(batch)
+        kept += 0 if out is None else out.num_rows
+    elapsed = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{impl},{elapsed:.4f},{kept},{baseline_rss},{peak}")
+def run(batches: int, rows: int):
+    print(f"{batches} batches x {rows} rows")
+    results = {}
+    for impl in IMPLS:
+        out = subprocess.run(
+            [sys.executable, __file__, "--impl", impl, "--batches", str(batches), "--rows", str(rows)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip().splitlines()[-1]
+        _, elapsed, kept, base_kb, peak_kb = out.split(",")
+        results[impl] = float(elapsed)
+        print(
+            f"{impl:>4}: {batches / float(elapsed):8.1f} batches/s  "
+            f"{batches * rows / float(elapsed) / 1e6:6.2f}M rows/s  kept {int(kept)}  "
+            f"peak rss {int(peak_kb) / 1024:.0f}MB (+{(int(peak_kb) - int(base_kb)) / 1024:.0f}MB while filtering)"
+        )
+    print(f"speedup {results['old'] / results['new']:.1f}x")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="pandas vs arrow compute OpenAQ filter throughput")
+    parser.add_argument("--batches", type=int, default=40)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--impl", choices=sorted(IMPLS), help="run a single implementation")
+    args = parser.parse_args()
+    if args.impl:
+        run_impl(args.impl, args.batches, args.rows)
+    else:
+        run(args.batches, args.rows)
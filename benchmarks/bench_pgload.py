@@ -0,0 +1,188 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import shapely
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "etl"))
+from pgload import (  # noqa: E402
+    encode_copy_binary,
+    float8_field,
+    frame_to_copy,
+    text_field,
+    timestamp_field,
+)
+RNG = np.random.default_rng(42)
+def make_tracts(n: int) -> pd.DataFrame:
+    lon = RNG.uniform(-75.5, -71.5, n)
+    lat = RNG.uniform(38.5, 42.3, n)
+    polys = shapely.buffer(shapely.points(lon, lat), 0.01, quad_segs=48)
+    return pd.DataFrame(
+        {
+            "geo_id": [f"36{i:09d}" for i in range(n)],
+            "state_code": "36",
+            "county_code": "061",
+            "name": [f"Census Tract {i}" for i in range(n)],
+            "population": None,
+            "geom": polys,
+        }
+    )
+def make_highways(n: int) -> pd.DataFrame:
+    start = RNG.uniform([-75.5, 38.5], [-71.5, 42.3], (n, 2))
+    steps = RNG.normal(0, 0.002, (n, 40, 2)).cumsum(axis=1) + start[:, None, :]
+    return pd.DataFrame(
+        {
+            "linear_id": [f"{i:022d}" for i in range(n)],
+            "fullname": "I- 95",
+            "mtfcc": RNG.choice(["S1100", "S1200"], n),
+            "geom": shapely.linestrings(steps),
+        }
+    )
+def make_acs(n: int) -> pd.DataFrame:
+    total = RNG.integers(0, 8000, n).astype(float)
+    return pd.DataFrame(
+        {
+            "geo_id": [f"36{i:09d}" for i in range(n)],
+            "population": RNG.integers(0, 10000, n),
+            "poverty_total": total,
+            "poverty_below": np.floor(total * RNG.uniform(0, 0.5, n)),
+        }
+    )
+def make_weather(n: int) -> pd.DataFrame:
+    dates = pd.date_range("2019-01-01", periods=n, freq="D").strftime("%Y-%m-%d")
+    return pd.DataFrame(
+        {
+            "date": dates,
+            "avg_temp_celsius": RNG.normal(12, 9, n).round(2),
+            "avg_humidity": RNG.uniform(30, 95, n).round(2),
+            "pollen_level": RNG.choice(["Low", "Medium", "High"], n),
+            "smoke_surge": RNG.random(n) < 0.01,
+        }
+    )
+def make_readings(n: int) -> pd.DataFrame:
+    ts = pd.Timestamp("2019-01-01", tz="UTC") + pd.to_timedelta(
+        RNG.integers(0, 6 * 365 * 24, n), unit="h"
+    )
+    return pd.DataFrame(
+        {
+            "monitor_id": np.char.add("OAQ_site_", RNG.integers(0, 300, n).astype(str)),
+            "timestamp_utc": ts,
+            "parameter": RNG.choice(["pm25", "no2"], n),
+            "value": RNG.gamma(2.0, 4.0, n),
+            "unit": "µg/m³",
+        }
+    )
+def old_tracts(df):
+    records = []
+    for _, row in df.iterrows():
+        records.append(
+            (row["geo_id"], row["state_code"], row["county_code"], row["name"],
+             row["population"], None, None, None, None, row["geom"].wkt)
+        )
+    return records
+def old_highways(df):
+    records = []
+    for _, row in df.iterrows():
+        records.append((row["linear_id"], row["fullname"], row["mtfcc"], None, None, row["geom"].wkt))
+    return records
+def old_acs(df):
+    records = []
+    for _, row in df.iterrows():
+        try:
+            pop = int(row["population"])
+        except Exception:
+            pop = None
+        try:
+            pov_total = float(row["poverty_total"])
+            pov_below = float(row["poverty_below"])
+            pov_rate = pov_below / pov_total if pov_total > 0 else None
+        except Exception:
+            pov_rate = None
+        records.append((row["geo_id"].zfill(11), pop, pov_rate))
+    return records
+def old_weather(df):
+    records = []
+    for _, row in df.iterrows():
+        records.append(
+            (row["date"], row["avg_temp_celsius"], row["avg_humidity"],
+             row["pollen_level"], row["smoke_surge"])
+        )
+    return records
+def old_readings(df):
+    records = []
+    for _, row in df.iterrows():
+        records.append(
+            (row["monitor_id"], row["timestamp_utc"].to_pydatetime(), str(row["parameter"]),
+             float(row["value"]), None)
+        )
+    return records
+def new_tracts(df):
+    return frame_to_copy(
+        df, ["geo_id", "state_code", "county_code", "name", "population", "geom"],
+        geometry="geom", multi=True,
+    )
+def new_highways(df):
+    return frame_to_copy(df, ["linear_id", "fullname", "mtfcc", "geom"], geometry="geom", multi=True)
+def new_acs(df):
+    pop = df["population"].to_numpy(dtype=float)
+    total = df["poverty_total"].to_numpy(dtype=float)
+    below = df["poverty_below"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = np.where(total > 0, below / total, np.nan)
+    out = pd.DataFrame(
+        {
+            "geo_id": df["geo_id"].str.zfill(11),
+            "population": pd.array(np.trunc(pop), dtype="Int64"),
+            "poverty_rate": rate,
+        }
+    )
+    return frame_to_copy(out, ["geo_id", "population", "poverty_rate"])
+def new_weather(df):
+    return frame_to_copy(df, ["date", "avg_temp_celsius", "avg_humidity", "pollen_level", "smoke_surge"])
+def new_readings(df):
+    batch = pa.RecordBatch.from_pandas(df, preserve_index=False)
+    return encode_copy_binary(
+        [
+            text_field(batch.column("monitor_id")),
+            timestamp_field(batch.column("timestamp_utc")),
+            text_field(batch.column("parameter")),
+            float8_field(batch.column("value")),
+            text_field(pa.nulls(batch.num_rows, pa.string())),
+        ]
+    )
+CASES = {
+    "tracts": (make_tracts, old_tracts, new_tracts, 13_000),
+    "highways": (make_highways, old_highways, new_highways, 20_000),
+    "acs": (make_acs, old_acs, new_acs, 13_000),
+    "daily_covariates": (make_weather, old_weather, new_weather, 2_200),
+    "pollution_readings": (make_readings, old_readings, new_readings, 500_000),
+}
+def timed(fn, df, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(df)
+        best = min(best, time.perf_counter() - t0)
+    return best
+def run(scale: float, repeat: int, tables):
+    print(f"{'table':<20}{'rows':>10}{'before rows/s':>16}{'after rows/s':>16}{'speedup':>10}")
+    for name in tables:
+        make, old, new, rows = CASES[name]
+        n = max(1, int(rows * scale))
+        df = make(n)
+        t_old = timed(old, df, repeat)
+        t_new = timed(new, df, repeat)
+        print(
+            f"{name:<20}{n:>10,}{n / t_old:>16,.0f}{n / t_new:>16,.0f}{t_old / t_new:>9.1f}x"
+        )
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="record building throughput: iterrows + wkt tuples vs pgload COPY streams"
+    )
+    parser.add_argument("--scale", type=float, default=1.0, help="fraction of full tri-state row counts")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tables", nargs="*", default=list(CASES), choices=list(CASES))
+    args = parser.parse_args()
+    run(args.scale, args.repeat, args.tables)
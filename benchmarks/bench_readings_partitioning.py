@@ -0,0 +1,258 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pyarrow as pa
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "etl"))
+from load_openaq_to_postgis import STAGING_TABLE, create_staging_table, get_conn, merge_staging  # noqa: E402
+from pgload import copy_binary, float8_field, text_field, timestamp_field  # noqa: E402
+SCHEMA = "bench_readings"
+CHUNK_ROWS = 200_000
+FALLBACK_BASE_ROWS = 100_000
+START = np.datetime64("2019-01-01T00:00:00", "us")
+SETUP_SQL = f"""
+    DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+    CREATE SCHEMA {SCHEMA};
+    SET search_path TO {SCHEMA}, public;
+    CREATE SEQUENCE {SCHEMA}.monitor_year_agg_change_seq;
+    CREATE TABLE {SCHEMA}.pollution_monitors (
+        monitor_id VARCHAR(100) PRIMARY KEY,
+        id SERIAL UNIQUE,
+        name VARCHAR(255)
+    );
+    CREATE TABLE {SCHEMA}.pollutant_codes (
+        code SMALLINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        pollutant VARCHAR(20) UNIQUE NOT NULL
+    );
+    CREATE TABLE {SCHEMA}.monitor_year_agg (
+        monitor_id VARCHAR(100),
+        year INTEGER NOT NULL,
+        pollutant VARCHAR(20) NOT NULL,
+        value_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+        value_count BIGINT NOT NULL DEFAULT 0,
+        change_seq BIGINT NOT NULL DEFAULT nextval('{SCHEMA}.monitor_year_agg_change_seq'),
+        PRIMARY KEY (monitor_id, year, pollutant)
+    );
+    CREATE TABLE {SCHEMA}.legacy_agg (LIKE {SCHEMA}.monitor_year_agg INCLUDING ALL);
+    CREATE TABLE {SCHEMA}.legacy_readings (
+        id BIGSERIAL PRIMARY KEY,
+        monitor_id VARCHAR(100),
+        timestamp TIMESTAMPTZ NOT NULL,
+        pollutant VARCHAR(20),
+        value DOUBLE PRECISION,
+        unit VARCHAR(20),
+        CONSTRAINT legacy_unique_reading UNIQUE (monitor_id, timestamp, pollutant)
+    );
+    CREATE INDEX ON {SCHEMA}.legacy_readings (monitor_id, timestamp);
+    CREATE INDEX ON {SCHEMA}.legacy_readings (monitor_id, pollutant);
+    CREATE UNLOGGED TABLE {SCHEMA}.legacy_stage (
+        monitor_id VARCHAR(100),
+        timestamp TIMESTAMPTZ,
+        pollutant VARCHAR(20),
+        value DOUBLE PRECISION,
+        unit VARCHAR(20)
+    );
+    CREATE TABLE {SCHEMA}.pollution_readings (
+        monitor_key INTEGER NOT NULL,
+        timestamp TIMESTAMPTZ NOT NULL,
+        pollutant_code SMALLINT NOT NULL,
+        value DOUBLE PRECISION,
+        unit VARCHAR(20),
+        PRIMARY KEY (monitor_key, pollutant_code, timestamp)
+    ) PARTITION BY RANGE (timestamp);
+    CREATE INDEX ON {SCHEMA}.pollution_readings USING BRIN (timestamp) WITH (pages_per_range = 32);
+    CREATE FUNCTION {SCHEMA}.ensure_readings_partition(month_start DATE) RETURNS TEXT AS $$
+    DECLARE
+        first_day DATE := date_trunc('month', month_start)::date;
+        part_name TEXT := 'pollution_readings_' || to_char(first_day, '"y"YYYY"m"MM');
+    BEGIN
+        IF to_regclass('{SCHEMA}.' || part_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE {SCHEMA}.%I PARTITION OF {SCHEMA}.pollution_readings FOR VALUES FROM (%L) TO (%L)',
+                part_name,
+                first_day::timestamp AT TIME ZONE 'UTC',
+                (first_day + INTERVAL '1 month')::timestamp AT TIME ZONE 'UTC'
+            );
+        END IF;
+        RETURN part_name;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+LEGACY_MERGE_SQL = f"""
+    WITH inserted AS (
+        INSERT INTO {SCHEMA}.legacy_readings (monitor_id, timestamp, pollutant, value, unit)
+        SELECT DISTINCT ON (monitor_id, timestamp, pollutant)
+               monitor_id, timestamp, pollutant, value, unit
+        FROM {SCHEMA}.legacy_stage
+        ORDER BY monitor_id, timestamp, pollutant
+        ON CONFLICT ON CONSTRAINT legacy_unique_reading DO NOTHING
+        RETURNING monitor_id, timestamp, pollutant, value
+    )
+    INSERT INTO {SCHEMA}.legacy_agg (monitor_id, year, pollutant, value_sum, value_count)
+    SELECT monitor_id, EXTRACT(YEAR FROM timestamp AT TIME ZONE 'UTC')::int,
+           pollutant, COALESCE(SUM(value), 0), COUNT(value)
+    FROM inserted
+    GROUP BY 1, 2, 3
+    ON CONFLICT (monitor_id, year, pollutant) DO UPDATE
+      SET value_sum = legacy_agg.value_sum + EXCLUDED.value_sum,
+          value_count = legacy_agg.value_count + EXCLUDED.value_count,
+          change_seq = nextval('{SCHEMA}.monitor_year_agg_change_seq');
+    TRUNCATE {SCHEMA}.legacy_stage;
+"""
+AGGREGATIONS = {
+    "yearly group by": (
+        f"""
+        SELECT monitor_id, EXTRACT(YEAR FROM timestamp AT TIME ZONE 'UTC')::int, pollutant, SUM(value), COUNT(value)
+        FROM {SCHEMA}.legacy_readings GROUP BY 1, 2, 3
+        """,
+        f"""
+        SELECT m.monitor_id, r.year, c.pollutant, r.value_sum, r.value_count
+        FROM (
+            SELECT monitor_key, EXTRACT(YEAR FROM timestamp AT TIME ZONE 'UTC')::int AS year, pollutant_code,
+                   SUM(value) AS value_sum, COUNT(value) AS value_count
+            FROM {SCHEMA}.pollution_readings GROUP BY 1, 2, 3
+        ) r
+        JOIN {SCHEMA}.pollution_monitors m ON m.id = r.monitor_key
+        JOIN {SCHEMA}.pollutant_codes c ON c.code = r.pollutant_code
+        """,
+    ),
+    "one year re-aggregate": (
+        f"""
+        SELECT monitor_id, pollutant, SUM(value), COUNT(value)
+        FROM {SCHEMA}.legacy_readings
+        WHERE timestamp >= %(year_lo)s AND timestamp < %(year_hi)s GROUP BY 1, 2
+        """,
+        f"""
+        SELECT monitor_key, pollutant_code, SUM(value), COUNT(value)
+        FROM {SCHEMA}.pollution_readings
+        WHERE timestamp >= %(year_lo)s AND timestamp < %(year_hi)s GROUP BY 1, 2
+        """,
+    ),
+    "one month daily means": (
+        f"""
+        SELECT monitor_id, pollutant, date_trunc('day', timestamp), AVG(value)
+        FROM {SCHEMA}.legacy_readings
+        WHERE timestamp >= %(month_lo)s AND timestamp < %(month_hi)s GROUP BY 1, 2, 3
+        """,
+        f"""
+        SELECT monitor_key, pollutant_code, date_trunc('day', timestamp), AVG(value)
+        FROM {SCHEMA}.pollution_readings
+        WHERE timestamp >= %(month_lo)s AND timestamp < %(month_hi)s GROUP BY 1, 2, 3
+        """,
+    ),
+}
+SIZE_SQL = """
+    SELECT COALESCE(SUM(pg_total_relation_size(relid)), 0)
+    FROM pg_partition_tree(%s::regclass)
+"""
+def base_rows(cur) -> int:
+    cur.execute(
+        """
+        SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint
+        FROM pg_partition_tree(to_regclass('public.pollution_readings')) t
+        JOIN pg_class c ON c.oid = t.relid
+        """
+    )
+    row = cur.fetchone()
+    return int(row[0]) if row and row[0] else 0
+def make_chunk(start_row: int, n: int, monitors: int):
+    rows = np.arange(start_row, start_row + n, dtype=np.int64)
+    hour, within = np.divmod(rows, monitors * 2)
+    monitor, pollutant = np.divmod(within, 2)
+    rng = np.random.default_rng(start_row)
+    slugs = pa.array([f"OAQ_bench_{i}" for i in range(monitors)], pa.string())
+    codes = pa.array(["pm25", "no2"], pa.string())
+    ts = START + hour.astype("timedelta64[h]")
+    return [
+        text_field(slugs.take(pa.array(monitor))),
+        timestamp_field(pa.array(ts, pa.timestamp("us", tz="UTC"))),
+        text_field(codes.take(pa.array(pollutant))),
+        float8_field(pa.array(rng.gamma(2.0, 6.0, n))),
+        text_field(pa.array(np.where(pollutant == 0, "µg/m³", "ppb"), pa.string())),
+    ]
+def ingest(cur, conn, layout: str, start_row: int, stop_row: int, monitors: int) -> float:
+    columns = ["monitor_id", "timestamp", "pollutant", "value", "unit"]
+    elapsed = 0.0
+    for r0 in range(start_row, stop_row, CHUNK_ROWS):
+        fields = make_chunk(r0, min(CHUNK_ROWS, stop_row - r0), monitors)
+        t0 = time.perf_counter()
+        if layout == "legacy":
+            copy_binary(cur, f"{SCHEMA}.legacy_stage", columns, fields)
+            cur.execute(LEGACY_MERGE_SQL)
+        else:
+            copy_binary(cur, f"{SCHEMA}.{STAGING_TABLE}", columns, fields)
+            merge_staging(cur)
+        conn.commit()
+        elapsed += time.perf_counter() - t0
+    return elapsed
+def timed(cur, sql, params) -> float:
+    t0 = time.perf_counter()
+    cur.execute(f"SELECT COUNT(*) FROM ({sql}) q", params)
+    cur.fetchone()
+    return time.perf_counter() - t0
+def run(scales, base, monitors: int, keep: bool):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            if base is None:
+                base = base_rows(cur)
+                if base == 0:
+                    base = FALLBACK_BASE_ROWS
+                    print(f"pollution_readings looks empty, using {base:,} rows as 1x")
+                else:
+                    print(f"current pollution_readings volume: ~{base:,} rows")
+            cur.execute(SETUP_SQL)
+            cur.execute(
+                f"INSERT INTO {SCHEMA}.pollution_monitors (monitor_id, name) SELECT 'OAQ_bench_' || i, 'bench ' || i "
+                f"FROM generate_series(0, %s) i",
+                (monitors - 1,),
+            )
+            create_staging_table(cur)
+            conn.commit()
+            loaded = 0
+            print(
+                f"{'scale':>6}{'rows':>15}{'layout':>13}{'ingest rows/s':>15}{'size MB':>10}"
+                + "".join(f"{name:>24}" for name in AGGREGATIONS)
+            )
+            for scale in sorted(scales):
+                target = int(base * scale)
+                last_hour = START + np.timedelta64(int((target - 1) // (monitors * 2)), "h")
+                year = int(str(last_hour)[:4])
+                month = str(last_hour)[:7]
+                nxt = np.datetime64(month, "M") + np.timedelta64(1, "M")
+                params = {
+                    "year_lo": f"{year}-01-01T00:00:00+00:00",
+                    "year_hi": f"{year + 1}-01-01T00:00:00+00:00",
+                    "month_lo": f"{month}-01T00:00:00+00:00",
+                    "month_hi": f"{nxt}-01T00:00:00+00:00",
+                }
+                results = {}
+                for layout in ["legacy", "partitioned"]:
+                    seconds = ingest(cur, conn, layout, loaded, target, monitors)
+                    table = "legacy_readings" if layout == "legacy" else "pollution_readings"
+                    cur.execute(f"ANALYZE {SCHEMA}.{table}")
+                    cur.execute(SIZE_SQL, (f"{SCHEMA}.{table}",))
+                    size = cur.fetchone()[0] / 1e6
+                    conn.commit()
+                    idx = 0 if layout == "legacy" else 1
+                    times = [timed(cur, queries[idx], params) for queries in AGGREGATIONS.values()]
+                    results[layout] = ((target - loaded) / seconds if seconds > 0 else 0, size, times)
+                for layout, (rate, size, times) in results.items():
+                    print(
+                        f"{scale:>5}x{target:>15,}{layout:>13}{rate:>15,.0f}{size:>10,.0f}"
+                        + "".join(f"{t:>23.2f}s" for t in times)
+                    )
+                loaded = target
+            if not keep:
+                cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+                conn.commit()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="ingest and aggregation: varchar-keyed heap vs monthly-partitioned pollution_readings"
+    )
+    parser.add_argument("--scales", type=float, nargs="+", default=[10, 100, 1000], help="multiples of current volume")
+    parser.add_argument("--base-rows", type=int, help="rows counted as 1x (default: current pollution_readings size)")
+    parser.add_argument("--monitors", type=int, default=250)
+    parser.add_argument("--keep", action="store_true", help=f"leave the {SCHEMA} schema in place afterwards")
+    args = parser.parse_args()
+    run(args.scales, args.base_rows, args.monitors, args.keep)
@@ -0,0 +1,75 @@
+import argparse
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "etl"))
+from compute_road_distance import Config, get_conn  # noqa: E402
+CROSS_JOIN_SQL = """
+    CREATE TEMP TABLE bench_cross_join AS
+    SELECT
+        t.geo_id,
+        MIN(ST_Distance(
+            t.geom::geography,
+            h.geom::geography
+        )) as dist_primary_road_meters
+    FROM tracts t
+    CROSS JOIN highways h
+    WHERE h.mtfcc = 'S1100'
+    GROUP BY t.geo_id
+"""
+KNN_SQL = """
+    CREATE TEMP TABLE bench_knn AS
+    SELECT t.geo_id, nr.dist AS dist_primary_road_meters
+    FROM tracts t
+    LEFT JOIN LATERAL (
+        SELECT ST_Distance(t.geom::geography, c.geom::geography) AS dist
+        FROM (
+            SELECT h.geom
+            FROM highways h
+            WHERE h.mtfcc = 'S1100'
+            ORDER BY h.geom <-> t.geom
+            LIMIT %(k)s
+        ) c
+        ORDER BY dist
+        LIMIT 1
+    ) nr ON true
+"""
+COMPARE_SQL = """
+    SELECT COUNT(*),
+           MAX(ABS(a.dist_primary_road_meters - b.dist_primary_road_meters)),
+           SUM(CASE WHEN ABS(a.dist_primary_road_meters - b.dist_primary_road_meters) > 0.01
+                    THEN 1 ELSE 0 END)
+    FROM bench_cross_join a
+    JOIN bench_knn b ON a.geo_id = b.geo_id
+"""
+def timed(cur, sql, params=None) -> float:
+    t0 = time.perf_counter()
+    cur.execute(sql, params)
+    return time.perf_counter() - t0
+def run(k: int, skip_cross_join: bool):
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM tracts")
+            n_tracts = cur.fetchone()[0]
+            cur.execute("SELECT COUNT(*) FROM highways WHERE mtfcc = %s", (Config.MTFCC,))
+            n_roads = cur.fetchone()[0]
+            print(f"{n_tracts} tracts x {n_roads} {Config.MTFCC} segments")
+            t_knn = timed(cur, KNN_SQL, {"k": k})
+            print(f"knn lateral (k={k}):  {t_knn:8.1f}s")
+            if skip_cross_join:
+                conn.rollback()
+                return
+            t_cross = timed(cur, CROSS_JOIN_SQL)
+            print(f"cross join cte:       {t_cross:8.1f}s  ({t_cross / t_knn:.1f}x slower)")
+            cur.execute(COMPARE_SQL)
+            matched, max_diff, mismatched = cur.fetchone()
+            print(f"{matched} tracts compared, max abs diff {max_diff or 0:.4f}m, {mismatched} differ > 1cm")
+        conn.rollback()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="time the old CROSS JOIN nearest_road CTE against the KNN precomputation"
+    )
+    parser.add_argument("--candidates", type=int, default=Config.CANDIDATES)
+    parser.add_argument("--skip-cross-join", action="store_true")
+    args = parser.parse_args()
+    run(args.candidates, args.skip_cross_join)
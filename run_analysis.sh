@@ -6,14 +6,8 @@ if [ -f .env ]; then
     export $(cat .env | grep -v '#' | xargs)
 fi
 
-echo "--- 1. Running Exploratory Data Analysis (EDA) ---"
-python src/analysis/eda.py
-
-echo "--- 2. Training GAM Model with Spatial CV ---"
-python src/analysis/model_gam.py
-
-echo "--- 3. Running Intervention Analysis ---"
-python src/analysis/intervention.py
+echo "--- Running the analysis stages (data sync, EDA, GAM with spatial CV, interventions) ---"
+python src/pipeline.py analysis "$@"
 
 echo "--- Analysis Pipeline Complete! ---"
 echo "Check reports/figures/ for plots and reports/intervention_impact.csv for results."
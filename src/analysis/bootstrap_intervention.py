@@ -0,0 +1,132 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import intervention
+from gam_portable import find_model, load_model
+from gam_search import fingerprint
+from model_gam import WORKERS, _attach, design, load_data, make_gam, model_features, run_tasks
+class Config:
+    CACHE_DIR = "models/cache/bootstrap"
+    OUTPUT_FILE = "reports/intervention_bootstrap.csv"
+    REPLICATES = 200
+    CONFIDENCE = 0.95
+    SEED = 20240
+def county_blocks(groups):
+    order = np.argsort(groups, kind="stable")
+    counts = np.bincount(groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    return order, starts, counts
+def resample_rows(groups, replicate, seed=Config.SEED):
+    order, starts, counts = county_blocks(groups)
+    rng = np.random.default_rng([seed, replicate])
+    drawn = rng.integers(0, len(counts), size=len(counts))
+    return np.concatenate([order[starts[c] : starts[c] + counts[c]] for c in drawn])
+def run_key(X, y, groups, X_base, population, params, scenarios, seed):
+    data_key = fingerprint(X, y, groups, [X_base, population])
+    spec = json.dumps([data_key, params, scenarios, seed], sort_keys=True, default=list)
+    return hashlib.sha256(spec.encode()).hexdigest()[:16]
+def _replicate_path(cache_dir, replicate):
+    return os.path.join(cache_dir, f"rep_{replicate:05d}.json")
+def _replicate_task(task):
+    start = time.perf_counter()
+    X = _attach(task["X"])
+    y = _attach(task["y"])
+    groups = _attach(task["groups"])
+    rows = resample_rows(groups, task["replicate"], task["seed"])
+    model = make_gam(task["params"]).fit(X[rows], y[rows])
+    base, burden = intervention.score_scenarios(
+        model, _attach(task["X_base"]), _attach(task["population"]), task["scenarios"]
+    )
+    result = {
+        "replicate": task["replicate"],
+        "base": float(base),
+        "burden": [float(b) for b in burden],
+        "n_rows": int(len(rows)),
+        "seconds": time.perf_counter() - start,
+        "pid": os.getpid(),
+    }
+    path = _replicate_path(task["cache_dir"], task["replicate"])
+    with open(path + ".tmp", "w") as f:
+        json.dump(result, f)
+    os.replace(path + ".tmp", path)
+    return result
+def load_replicates(cache_dir, replicates):
+    done = {}
+    for r in range(replicates):
+        path = _replicate_path(cache_dir, r)
+        if os.path.exists(path):
+            with open(path) as f:
+                done[r] = json.load(f)
+    return done
+def bootstrap(train_df, sim_df, replicates=Config.REPLICATES, workers=WORKERS, params=None, scenarios=None, seed=Config.SEED):
+    scenarios = scenarios or intervention.SCENARIOS
+    features = model_features(params)
+    X, y, groups = design(train_df.dropna(subset=features), features)
+    sim_df = sim_df.dropna(subset=features)
+    X_base = np.ascontiguousarray(sim_df[features].to_numpy(dtype=np.float64))
+    population = np.nan_to_num(sim_df["population"].to_numpy(dtype=np.float64))
+    key = run_key(X, y, groups, X_base, population, params, scenarios, seed)
+    cache_dir = os.path.join(Config.CACHE_DIR, key)
+    os.makedirs(cache_dir, exist_ok=True)
+    done = load_replicates(cache_dir, replicates)
+    todo = [r for r in range(replicates) if r not in done]
+    print(
+        f"{replicates} county-block replicates over {len(np.unique(groups))} counties: "
+        f"{len(done)} cached under {cache_dir}, {len(todo)} to fit on {min(workers, max(len(todo), 1))} workers"
+    )
+    if todo:
+        start = time.perf_counter()
+        tasks = [
+            {"replicate": r, "seed": seed, "params": params, "scenarios": scenarios, "cache_dir": cache_dir}
+            for r in todo
+        ]
+        arrays = {"X": X, "y": y, "groups": groups, "X_base": X_base, "population": population}
+        for result in run_tasks(tasks, arrays, workers, fn=_replicate_task):
+            done[result["replicate"]] = result
+        print(f"fitted {len(todo)} replicates in {time.perf_counter() - start:.1f}s wall")
+    reps = [done[r] for r in range(replicates)]
+    base = np.array([rep["base"] for rep in reps])
+    burden = np.array([rep["burden"] for rep in reps])
+    return base, burden
+def summarize(point, base, burden, scenarios, confidence=Config.CONFIDENCE):
+    tail = (1 - confidence) / 2 * 100
+    prevented = base[:, None] - burden
+    lo, hi = np.percentile(prevented, [tail, 100 - tail], axis=0)
+    out = point.set_index("Scenario").loc[[sc["name"] for sc in scenarios]].reset_index()
+    out["Prevented_lo"] = lo
+    out["Prevented_hi"] = hi
+    out["Prevented_se"] = prevented.std(axis=0, ddof=1) if len(base) > 1 else np.nan
+    out["Replicates"] = len(base)
+    return out.sort_values("Prevented", ascending=False)
+def run(replicates=Config.REPLICATES, workers=WORKERS, params_path=None, confidence=Config.CONFIDENCE):
+    params = None
+    if params_path:
+        with open(params_path) as f:
+            params = json.load(f)
+    model_path = find_model()
+    if model_path is None:
+        raise SystemExit("Model not found. Run model_gam.py first.")
+    model = load_model(model_path)
+    if intervention.model_features(model) != model_features(params):
+        print(f"warning: {model_path} was trained on different features than these bootstrap fits, pass the same --params")
+    sim_df = intervention.load_data()
+    point = intervention.run_scenarios(model, sim_df)
+    base, burden = bootstrap(load_data(), sim_df, replicates, workers, params)
+    out = summarize(point, base, burden, intervention.SCENARIOS, confidence)
+    print(f"\nCases prevented with {confidence:.0%} county-block bootstrap intervals ({len(base)} replicates)")
+    print(out)
+    os.makedirs(os.path.dirname(Config.OUTPUT_FILE), exist_ok=True)
+    out.to_csv(Config.OUTPUT_FILE, index=False)
+    print(f"Saved results to {Config.OUTPUT_FILE}")
+    return out
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="county-block bootstrap intervals for intervention burden")
+    parser.add_argument("--replicates", type=int, default=Config.REPLICATES)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--params", help="json of GAM hyperparameters, same as model_gam.py --params")
+    parser.add_argument("--confidence", type=float, default=Config.CONFIDENCE)
+    args = parser.parse_args()
+    run(args.replicates, args.workers, args.params, args.confidence)
@@ -0,0 +1,176 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import time
+import pandas as pd
+import psycopg2
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+load_dotenv()
+class Config:
+    CACHE_DIR = "data/cache/modeling_data"
+    STAMP_FILE = "data/cache/modeling_data/current.json"
+    KEEP = 3
+    DAILY_DIR = "data/processed/daily_features"
+WATERMARK = "modeling_data.change_seq"
+SCHEMA = pa.schema(
+    [
+        ("geo_id", pa.string()),
+        ("state_code", pa.string()),
+        ("county_code", pa.string()),
+        ("asthma_prev", pa.float64()),
+        ("poverty_rate", pa.float64()),
+        ("population_density", pa.float64()),
+        ("svi_ranking", pa.float64()),
+        ("year", pa.int32()),
+        ("pm25_mean", pa.float64()),
+        ("no2_mean", pa.float64()),
+        ("dist_primary_road_meters", pa.float64()),
+        ("population", pa.float64()),
+        ("pm25_popweighted", pa.float64()),
+        ("no2_popweighted", pa.float64()),
+        ("lon", pa.float64()),
+        ("lat", pa.float64()),
+    ]
+)
+QUERY = """
+    SELECT d.geo_id, d.state_code, d.county_code, d.asthma_prev, d.poverty_rate,
+           d.population_density, d.svi_ranking, d.year, d.pm25_mean, d.no2_mean,
+           d.dist_primary_road_meters, d.population, d.pm25_popweighted, d.no2_popweighted,
+           ST_X(ST_PointOnSurface(t.geom)) AS lon, ST_Y(ST_PointOnSurface(t.geom)) AS lat
+    FROM modeling_data d
+    LEFT JOIN tracts t ON t.geo_id = d.geo_id
+    ORDER BY d.year, d.geo_id
+"""
+CONTENT_HASH_SQL = """
+    SELECT COUNT(*), md5(COALESCE(string_agg(md5(d::text), '' ORDER BY d.geo_id, d.year), ''))
+    FROM modeling_data d
+"""
+def get_conn():
+    required = ["PGHOST", "PGPORT", "PGDATABASE", "PGUSER", "PGPASSWORD"]
+    missing = [v for v in required if not os.getenv(v)]
+    if missing:
+        raise SystemExit(f"missing env vars: {', '.join(missing)}")
+    return psycopg2.connect(
+        host=os.getenv("PGHOST"),
+        port=os.getenv("PGPORT"),
+        dbname=os.getenv("PGDATABASE"),
+        user=os.getenv("PGUSER"),
+        password=os.getenv("PGPASSWORD"),
+    )
+def cache_key(cur) -> str:
+    cur.execute("SELECT value, updated_at FROM etl_watermarks WHERE name = %s", (WATERMARK,))
+    row = cur.fetchone()
+    if row:
+        source = f"refresh:{row[0]}:{row[1].isoformat()}"
+    else:
+        cur.execute(CONTENT_HASH_SQL)
+        count, digest = cur.fetchone()
+        source = f"content:{count}:{digest}"
+    source += ":" + hashlib.sha256((QUERY + str(SCHEMA)).encode()).hexdigest()[:8]
+    return hashlib.sha256(source.encode()).hexdigest()[:16]
+def cache_path(key: str) -> str:
+    return os.path.join(Config.CACHE_DIR, f"modeling_data-{key}.parquet")
+def read_stamp():
+    if not os.path.exists(Config.STAMP_FILE):
+        return None
+    with open(Config.STAMP_FILE) as f:
+        return json.load(f)
+def write_stamp(key: str):
+    os.makedirs(Config.CACHE_DIR, exist_ok=True)
+    tmp = Config.STAMP_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"key": key, "path": cache_path(key), "checked_at": time.time()}, f)
+    os.replace(tmp, Config.STAMP_FILE)
+def pull(cur) -> pa.Table:
+    buf = io.BytesIO()
+    cur.copy_expert(f"COPY ({QUERY}) TO STDOUT WITH (FORMAT csv, HEADER true)", buf)
+    table = pv.read_csv(
+        pa.BufferReader(pa.py_buffer(buf.getbuffer())),
+        convert_options=pv.ConvertOptions(
+            column_types=SCHEMA,
+            include_columns=SCHEMA.names,
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+    columns = []
+    for field in SCHEMA:
+        col = table.column(field.name)
+        if pa.types.is_floating(field.type):
+            col = pc.fill_null(col, float("nan"))
+        columns.append(col)
+    return pa.Table.from_arrays(columns, schema=SCHEMA).combine_chunks()
+def prune(keep_path: str):
+    files = [
+        os.path.join(Config.CACHE_DIR, f)
+        for f in os.listdir(Config.CACHE_DIR)
+        if f.startswith("modeling_data-") and f.endswith(".parquet")
+    ]
+    files.sort(key=os.path.getmtime, reverse=True)
+    for path in files[Config.KEEP :]:
+        if path != keep_path:
+            os.remove(path)
+def sync(check: bool = False) -> str:
+    stamp = read_stamp()
+    if stamp and not check and os.path.exists(stamp["path"]):
+        return stamp["path"]
+    start = time.perf_counter()
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            key = cache_key(cur)
+            path = cache_path(key)
+            if os.path.exists(path):
+                print(f"modeling_data unchanged, using {path}")
+            else:
+                table = pull(cur)
+                os.makedirs(Config.CACHE_DIR, exist_ok=True)
+                tmp = path + ".tmp"
+                pq.write_table(table, tmp, compression="zstd")
+                os.replace(tmp, path)
+                print(f"pulled {table.num_rows} modeling_data rows into {path} in {time.perf_counter() - start:.2f}s")
+    write_stamp(key)
+    prune(path)
+    return path
+_tables = {}
+def load_table(columns=None, year=None) -> pa.Table:
+    path = sync()
+    if path not in _tables:
+        _tables.clear()
+        _tables[path] = pq.read_table(path, memory_map=True).combine_chunks()
+    table = _tables[path]
+    if year is not None:
+        table = table.filter(pc.equal(table.column("year"), year))
+    if columns is not None:
+        table = table.select(columns)
+    return table
+def column(name, year=None):
+    return load_table([name], year).column(0).to_numpy()
+def load_frame(columns=None, year=None) -> pd.DataFrame:
+    return load_table(columns, year).to_pandas(split_blocks=True)
+def load_daily(columns=None, year=None, geo_ids=None) -> pd.DataFrame:
+    if not os.path.isdir(Config.DAILY_DIR):
+        raise SystemExit(f"{Config.DAILY_DIR} not found. Run src/etl/compute_daily_features.py first.")
+    dataset = ds.dataset(Config.DAILY_DIR, format="parquet", partitioning="hive")
+    terms = []
+    if year is not None:
+        terms.append(ds.field("year") == year)
+    if geo_ids is not None:
+        terms.append(ds.field("geo_id").isin(list(geo_ids)))
+    expr = None
+    for term in terms:
+        expr = term if expr is None else expr & term
+    return dataset.to_table(columns=columns, filter=expr).to_pandas(split_blocks=True)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="cache modeling_data locally as parquet for the analysis stages")
+    parser.add_argument("--check", action="store_true", help="ask the database whether modeling_data changed")
+    args = parser.parse_args()
+    path = sync(check=args.check)
+    table = load_table()
+    print(f"{table.num_rows} rows, {table.nbytes / 1e6:.1f}MB in {path}")
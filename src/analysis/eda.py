@@ -1,93 +1,165 @@
+import argparse
+import hashlib
+import json
 import os
-import matplotlib.pyplot as plt
-import pandas as pd
-import seaborn as sns
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
-load_dotenv()
+import time
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import seaborn as sns  # noqa: E402
+from data import load_frame, sync  # noqa: E402
+from streaming_stats import summarize  # noqa: E402
+class Config:
+    FIGURES_DIR = "reports/figures"
+    CACHE_FILE = os.path.join(FIGURES_DIR, ".eda_render_hashes.json")
+    WORKERS = os.cpu_count() or 1
+    HEXBIN_MIN_POINTS = 5000
+    HEXBIN_GRIDSIZE = 60
+REQUIRED = ["asthma_prev", "pm25_mean", "no2_mean", "poverty_rate"]
+SUMMARY_COLUMNS = [
+    "asthma_prev",
+    "pm25_mean",
+    "no2_mean",
+    "poverty_rate",
+    "dist_primary_road_meters",
+    "population_density",
+]
 def load_data():
-    user = os.getenv("PGUSER")
-    password = os.getenv("PGPASSWORD")
-    host = os.getenv("PGHOST", "localhost")
-    port = os.getenv("PGPORT", "5432")
-    dbname = os.getenv("PGDATABASE", "asthma")
-    db_url = f"postgresql://{user}:{password}@{host}:{port}/{dbname}"
-    engine = create_engine(db_url)
-    query = "SELECT * FROM modeling_data;"
-    print("Loading data from postgis")
-    df = pd.read_sql(query, engine)
+    print("Loading modeling data")
+    df = load_frame(REQUIRED + ["dist_primary_road_meters"])
     print(f"Loaded {len(df)} records")
     return df
-def generate_summary(df):
+def generate_summary(workers=Config.WORKERS):
     print("\nStatistical Summary")
-    cols = [
-        "asthma_prev",
-        "pm25_mean",
-        "no2_mean",
-        "poverty_rate",
-        "dist_primary_road_meters",
-        "population_density",
-    ]
-    summary = df[cols].describe()
+    stats = summarize(sync(), SUMMARY_COLUMNS, require=REQUIRED, workers=workers)
+    summary = stats.describe()
     print(summary)
+    os.makedirs("reports", exist_ok=True)
     summary.to_csv("reports/summary_stats.csv")
-    print("Saved summary to reports/summary_stats.csv")
-def plot_distributions(df):
-    print("\nGenerating Distributions")
-    os.makedirs("reports/figures", exist_ok=True)
+    print(f"Saved summary of {int(stats.count().max())} rows to reports/summary_stats.csv")
+    return stats
+def distribution_figures(df):
     vars_to_plot = ["asthma_prev", "pm25_mean", "no2_mean", "poverty_rate"]
-    for var in vars_to_plot:
-        plt.figure(figsize=(8, 6))
-        sns.histplot(df[var], kde=True, bins=30)
-        plt.title(f"Distribution of {var}")
-        plt.xlabel(var)
-        plt.ylabel("Frequency")
-        plt.tight_layout()
-        path = f"reports/figures/hist_{var}.png"
-        plt.savefig(path)
-        plt.close()
-        print(f"Saved {path}")
-def plot_correlations(df):
-    print("\nGenerating Correlation Matrix")
-    cols = [
-        "asthma_prev",
-        "pm25_mean",
-        "no2_mean",
-        "poverty_rate",
-        "dist_primary_road_meters",
-        "population_density",
+    return [
+        {
+            "kind": "hist",
+            "path": os.path.join(Config.FIGURES_DIR, f"hist_{var}.png"),
+            "names": [var],
+            "data": [df[var].to_numpy()],
+        }
+        for var in vars_to_plot
+    ]
+def correlation_figures(stats):
+    corr = stats.corr()
+    return [
+        {
+            "kind": "corr",
+            "path": os.path.join(Config.FIGURES_DIR, "correlation_matrix.png"),
+            "names": list(corr.columns),
+            "data": [corr.to_numpy(), stats.n],
+            "corr": corr.to_numpy(),
+        }
     ]
-    corr = df[cols].corr()
+def scatter_figures(df, hexbin_min=Config.HEXBIN_MIN_POINTS):
+    predictors = ["pm25_mean", "no2_mean", "poverty_rate", "dist_primary_road_meters"]
+    target = "asthma_prev"
+    return [
+        {
+            "kind": "hexbin" if len(df) >= hexbin_min else "scatter",
+            "path": os.path.join(Config.FIGURES_DIR, f"scatter_asthma_vs_{pred}.png"),
+            "names": [pred, target],
+            "data": [df[pred].to_numpy(), df[target].to_numpy()],
+        }
+        for pred in predictors
+    ]
+def figure_hash(fig):
+    h = hashlib.sha256()
+    h.update(json.dumps([fig["kind"], fig["names"], Config.HEXBIN_GRIDSIZE]).encode())
+    for arr in fig["data"]:
+        arr = np.ascontiguousarray(arr, dtype=np.float64)
+        h.update(str(arr.shape).encode())
+        h.update(arr.tobytes())
+    return h.hexdigest()[:16]
+def _draw_hist(var, values):
+    plt.figure(figsize=(8, 6))
+    sns.histplot(values, kde=True, bins=30)
+    plt.title(f"Distribution of {var}")
+    plt.xlabel(var)
+    plt.ylabel("Frequency")
+def _draw_corr(names, corr):
     plt.figure(figsize=(10, 8))
-    sns.heatmap(corr, annot=True, cmap="coolwarm", fmt=".2f")
+    sns.heatmap(corr, annot=True, cmap="coolwarm", fmt=".2f", xticklabels=names, yticklabels=names)
     plt.title("Correlation Matrix")
+def _draw_scatter(kind, names, data):
+    pred, target = names
+    x, y = data
+    plt.figure(figsize=(8, 6))
+    if kind == "hexbin":
+        ok = np.isfinite(x) & np.isfinite(y)
+        plt.hexbin(x[ok], y[ok], gridsize=Config.HEXBIN_GRIDSIZE, bins="log", mincnt=1, cmap="viridis")
+        plt.colorbar(label="Tracts (log scale)")
+    else:
+        sns.scatterplot(x=x, y=y, alpha=0.3)
+    plt.title(f"Asthma Prevalence vs {pred}")
+    plt.xlabel(pred)
+    plt.ylabel("Asthma Prevalence (%)")
+def render(fig):
+    start = time.perf_counter()
+    if fig["kind"] == "hist":
+        _draw_hist(fig["names"][0], fig["data"][0])
+    elif fig["kind"] == "corr":
+        _draw_corr(fig["names"], fig["corr"])
+    else:
+        _draw_scatter(fig["kind"], fig["names"], fig["data"])
     plt.tight_layout()
-    path = "reports/figures/correlation_matrix.png"
-    plt.savefig(path)
-    plt.close()
-    print(f"Saved {path}")
-def plot_scatters(df):
-    print("\nGenerating Scatter Plots")
-    predictors = ["pm25_mean", "no2_mean", "poverty_rate", "dist_primary_road_meters"]
-    target = "asthma_prev"
-    for pred in predictors:
-        plt.figure(figsize=(8, 6))
-        sns.scatterplot(data=df, x=pred, y=target, alpha=0.3)
-        plt.title(f"Asthma Prevalence vs {pred}")
-        plt.xlabel(pred)
-        plt.ylabel("Asthma Prevalence (%)")
-        plt.tight_layout()
-        path = f"reports/figures/scatter_asthma_vs_{pred}.png"
-        plt.savefig(path)
-        plt.close()
-        print(f"Saved {path}")
-def run():
+    plt.savefig(fig["path"])
+    plt.close("all")
+    return fig["path"], time.perf_counter() - start
+def render_figures(figures, workers=Config.WORKERS, force=False):
+    os.makedirs(Config.FIGURES_DIR, exist_ok=True)
+    cache = {}
+    if os.path.exists(Config.CACHE_FILE):
+        with open(Config.CACHE_FILE) as f:
+            cache = json.load(f)
+    todo = []
+    for fig in figures:
+        fig["hash"] = figure_hash(fig)
+        if not force and cache.get(fig["path"]) == fig["hash"] and os.path.exists(fig["path"]):
+            print(f"Unchanged {fig['path']}")
+            continue
+        todo.append(fig)
+    if todo:
+        start = time.perf_counter()
+        if workers <= 1 or len(todo) == 1:
+            results = [render(fig) for fig in todo]
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+                results = list(pool.map(render, todo))
+        for fig, (path, seconds) in zip(todo, results):
+            cache[path] = fig["hash"]
+            print(f"Saved {path} ({seconds:.1f}s)")
+        print(f"Rendered {len(todo)} figures in {time.perf_counter() - start:.1f}s on {min(workers, len(todo))} workers")
+    tmp = Config.CACHE_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp, Config.CACHE_FILE)
+    print(f"{len(figures) - len(todo)} of {len(figures)} figures unchanged")
+def run(workers=Config.WORKERS, hexbin_min=Config.HEXBIN_MIN_POINTS, force=False):
+    stats = generate_summary(workers)
     df = load_data()
-    df = df.dropna(subset=["asthma_prev", "pm25_mean", "no2_mean", "poverty_rate"])
-    generate_summary(df)
-    plot_distributions(df)
-    plot_correlations(df)
-    plot_scatters(df)
+    df = df.dropna(subset=REQUIRED)
+    print("\nGenerating Figures")
+    figures = distribution_figures(df) + correlation_figures(stats) + scatter_figures(df, hexbin_min)
+    render_figures(figures, workers, force)
     print("\nEDA Complete")
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="summary stats and exploratory figures for modeling_data")
+    parser.add_argument("--workers", type=int, default=Config.WORKERS)
+    parser.add_argument(
+        "--hexbin-min", type=int, default=Config.HEXBIN_MIN_POINTS, help="draw scatters as hexbins from this many points"
+    )
+    parser.add_argument("--force", action="store_true", help="redraw figures even if their data is unchanged")
+    args = parser.parse_args()
+    run(args.workers, args.hexbin_min, args.force)
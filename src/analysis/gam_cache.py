@@ -0,0 +1,29 @@
+import numpy as np
+from gam_portable import PortableGAM
+class CachedGAMPredictor:
+    def __init__(self, model, X_base):
+        self.model = model if isinstance(model, PortableGAM) else PortableGAM.from_pygam(model)
+        self.X_base = np.ascontiguousarray(X_base, dtype=np.float64)
+        self.intercept = self.model.intercept
+        self.terms = [(term, term.coef, term.features) for term in self.model.terms]
+        self.contributions = np.column_stack([term.contribution(self.X_base) for term in self.model.terms])
+        self.base_lp = self.intercept + self.contributions.sum(axis=1)
+        self.baseline = self.model.mu(self.base_lp)
+    def predict_rows(self, X, rows):
+        X = np.asarray(X, dtype=np.float64)
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.float64)
+        diff = X != self.X_base[rows]
+        lp = self.base_lp[rows].copy()
+        for k, (term, coef, features) in enumerate(self.terms):
+            changed = diff[:, features].any(axis=1)
+            if not changed.any():
+                continue
+            lp[changed] += term.contribution(X[changed]) - self.contributions[rows[changed], k]
+        return self.model.mu(lp)
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.shape == self.X_base.shape:
+            return self.predict_rows(X, np.arange(len(X)))
+        return self.model.predict(X)
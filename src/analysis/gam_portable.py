@@ -0,0 +1,182 @@
+import os
+import numpy as np
+MODEL_PATH = "models/gam_asthma.npz"
+PICKLE_PATH = "models/gam_asthma.pkl"
+FORMAT_VERSION = 1
+LINKS = {
+    "identity": lambda lp: lp,
+    "log": np.exp,
+}
+def knot_vector(edge_knots, n_splines, spline_order, periodic):
+    n_splines += spline_order * periodic
+    boundary = np.linspace(0, 1, 1 + n_splines - spline_order)
+    diff = np.diff(boundary[:2])[0]
+    aug = np.arange(1, spline_order + 1) * diff
+    knots = np.r_[-aug[::-1], boundary, 1 + aug]
+    knots[-1] += 1e-9
+    return knots
+def spline_basis(x, knots, offset, scale, spline_order, periodic):
+    x = (np.ravel(x) - offset) / scale
+    if periodic:
+        x = x % (1 + 1e-9)
+    x = np.r_[x, 0.0, 1.0]
+    left_of = x < 0
+    right_of = x > 1
+    inside = ~(left_of | right_of)
+    x = x[:, None]
+    bases = ((x >= knots[:-1]) & (x < knots[1:])).astype(np.float64)
+    bases[-1] = bases[-2][::-1]
+    prev = None
+    maxi = len(knots) - 1
+    for m in range(2, spline_order + 2):
+        maxi -= 1
+        left = (x - knots[:maxi]) * bases[:, :maxi] / (knots[m - 1 : maxi + m - 1] - knots[:maxi])
+        right = (knots[m : maxi + m] - x) * bases[:, 1 : maxi + 1] / (knots[m : maxi + m] - knots[1 : maxi + 1])
+        prev = bases[-2:]
+        bases = left + right
+    if periodic and spline_order > 0:
+        bases[:, :spline_order] = np.maximum(bases[:, :spline_order], bases[:, -spline_order:])
+        bases = bases[:, :-spline_order]
+    if spline_order > 0 and not inside.all():
+        bases[~inside] = 0.0
+        left = prev[:, :-1] / (knots[spline_order:-1] - knots[: -spline_order - 1])
+        right = prev[:, 1:] / (knots[spline_order + 1 :] - knots[1:-spline_order])
+        grads = spline_order * (left - right)
+        if left_of.any():
+            bases[left_of] = grads[0] * x[left_of] + bases[-2]
+        if right_of.any():
+            bases[right_of] = grads[1] * (x[right_of] - 1) + bases[-1]
+    return bases[:-2]
+class Marginal:
+    def __init__(self, feature, edge_knots, n_splines, spline_order, periodic, knots=None):
+        self.feature = int(feature)
+        self.edge_knots = np.sort(np.asarray(edge_knots, dtype=np.float64))
+        self.n_splines = int(n_splines)
+        self.spline_order = int(spline_order)
+        self.periodic = bool(periodic)
+        self.offset = self.edge_knots[0]
+        scale = self.edge_knots[-1] - self.edge_knots[0]
+        self.scale = scale if scale != 0 else 1
+        if knots is None:
+            knots = knot_vector(self.edge_knots, self.n_splines, self.spline_order, self.periodic)
+        self.knots = np.asarray(knots, dtype=np.float64)
+    def basis(self, X):
+        return spline_basis(X[:, self.feature], self.knots, self.offset, self.scale, self.spline_order, self.periodic)
+class PortableTerm:
+    isintercept = False
+    def __init__(self, marginals, coef):
+        self.marginals = marginals
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.features = np.array([m.feature for m in marginals], dtype=np.int64)
+        self.shape = [m.n_splines for m in marginals]
+    def contribution(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        out = self.marginals[0].basis(X) @ self.coef.reshape(self.shape[0], -1)
+        for marginal, size in zip(self.marginals[1:], self.shape[1:]):
+            out = np.einsum("nij,ni->nj", out.reshape(len(X), size, -1), marginal.basis(X))
+        return out.ravel()
+class PortableGAM:
+    def __init__(self, intercept, terms, link="identity", feature_names=None, feature_range=None):
+        if link not in LINKS:
+            raise ValueError(f"unsupported link {link!r}, expected one of {sorted(LINKS)}")
+        self.intercept = float(intercept)
+        self.terms = terms
+        self.link = link
+        self.feature_names_ = list(feature_names) if feature_names is not None else None
+        self.feature_range = feature_range
+    @classmethod
+    def from_pygam(cls, model):
+        intercept = 0.0
+        terms = []
+        for i, term in enumerate(model.terms):
+            coef = model.coef_[model.terms.get_coef_indices(i)]
+            if term.isintercept:
+                intercept += float(coef.sum())
+                continue
+            parts = term._terms if term.istensor else [term]
+            if any(p.__class__.__name__ != "SplineTerm" or p.by is not None for p in parts) or term.by is not None:
+                raise ValueError(f"cannot export term {term}: only spline and tensor spline terms are supported")
+            marginals = [
+                Marginal(p.feature, p.edge_knots_, p.n_splines, p.spline_order, p.basis == "cp") for p in parts
+            ]
+            terms.append(PortableTerm(marginals, coef))
+        n_features = 1 + max(int(f) for t in terms for f in t.features)
+        feature_range = np.full((n_features, 2), np.nan)
+        for t in terms:
+            for m in t.marginals:
+                feature_range[m.feature] = m.edge_knots[[0, -1]]
+        return cls(
+            intercept,
+            terms,
+            link=str(model.link),
+            feature_names=getattr(model, "feature_names_", None),
+            feature_range=feature_range,
+        )
+    def save(self, path):
+        arrays = {
+            "format_version": np.array(FORMAT_VERSION),
+            "intercept": np.array(self.intercept),
+            "link": np.array(self.link),
+            "feature_range": self.feature_range,
+            "n_terms": np.array(len(self.terms)),
+        }
+        if self.feature_names_ is not None:
+            arrays["feature_names"] = np.array(self.feature_names_)
+        for k, term in enumerate(self.terms):
+            arrays[f"term{k}_coef"] = term.coef
+            arrays[f"term{k}_features"] = term.features
+            arrays[f"term{k}_edge_knots"] = np.array([m.edge_knots[[0, -1]] for m in term.marginals])
+            arrays[f"term{k}_n_splines"] = np.array([m.n_splines for m in term.marginals])
+            arrays[f"term{k}_spline_order"] = np.array([m.spline_order for m in term.marginals])
+            arrays[f"term{k}_periodic"] = np.array([m.periodic for m in term.marginals])
+            arrays[f"term{k}_knots"] = np.concatenate([m.knots for m in term.marginals])
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            if int(f["format_version"]) != FORMAT_VERSION:
+                raise ValueError(f"{path} has format version {int(f['format_version'])}, expected {FORMAT_VERSION}")
+            terms = []
+            for k in range(int(f["n_terms"])):
+                n_splines = f[f"term{k}_n_splines"]
+                order = f[f"term{k}_spline_order"]
+                periodic = f[f"term{k}_periodic"]
+                sizes = n_splines + order * periodic + order + 1
+                knots = np.split(f[f"term{k}_knots"], np.cumsum(sizes)[:-1])
+                marginals = [
+                    Marginal(*spec)
+                    for spec in zip(f[f"term{k}_features"], f[f"term{k}_edge_knots"], n_splines, order, periodic, knots)
+                ]
+                terms.append(PortableTerm(marginals, f[f"term{k}_coef"]))
+            return cls(
+                float(f["intercept"]),
+                terms,
+                link=str(f["link"]),
+                feature_names=f["feature_names"].tolist() if "feature_names" in f else None,
+                feature_range=f["feature_range"],
+            )
+    def mu(self, lp):
+        return LINKS[self.link](lp)
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        lp = np.full(len(X), self.intercept)
+        for term in self.terms:
+            lp += term.contribution(X)
+        return self.mu(lp)
+def export_model(model, path=MODEL_PATH):
+    portable = PortableGAM.from_pygam(model)
+    portable.save(path)
+    return portable
+def load_model(path=MODEL_PATH):
+    if path.endswith(".npz"):
+        return PortableGAM.load(path)
+    import joblib
+    return joblib.load(path)
+def find_model():
+    for path in (MODEL_PATH, PICKLE_PATH):
+        if os.path.exists(path):
+            return path
+    return None
@@ -0,0 +1,134 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from model_gam import FEATURES, SPATIAL_FEATURES, WORKERS, county_folds, design, load_data, model_features, run_tasks
+class Config:
+    CACHE_DIR = "models/cache/gam_cv"
+    RESULTS_FILE = "reports/gam_search.csv"
+    BEST_PARAMS_FILE = "models/gam_best_params.json"
+    ETA = 3
+    RUNG_FOLDS = [1, 3, 5]
+    TIME_BUDGET = None
+SEARCH_SPACE = {
+    "lam": [0.06, 0.6, 6.0, 60.0],
+    "n_splines": [10, 20, 30],
+    "interactions": [[], ["pm25_no2"], ["latlon"], ["pm25_no2", "latlon"]],
+}
+def candidates(space=SEARCH_SPACE):
+    keys = sorted(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+def fingerprint(X, y, groups, folds) -> str:
+    h = hashlib.sha256()
+    for arr in (X, y, groups, *folds):
+        h.update(np.ascontiguousarray(arr).tobytes())
+        h.update(str(arr.shape).encode())
+    return h.hexdigest()[:16]
+def _cache_path(data_key, params, fold):
+    key = hashlib.sha256(json.dumps([data_key, params, fold], sort_keys=True).encode()).hexdigest()[:24]
+    return os.path.join(Config.CACHE_DIR, f"{key}.json")
+def read_cached(data_key, params, fold):
+    path = _cache_path(data_key, params, fold)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+def write_cached(data_key, params, fold, result):
+    os.makedirs(Config.CACHE_DIR, exist_ok=True)
+    path = _cache_path(data_key, params, fold)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(result, f)
+    os.replace(tmp, path)
+def evaluate(cands, n_folds, folds, arrays, data_key, workers, scores):
+    tasks = []
+    for idx in cands:
+        params = scores[idx]["params"]
+        for fold in range(n_folds):
+            if fold in scores[idx]["folds"]:
+                continue
+            cached = read_cached(data_key, params, fold)
+            if cached is not None:
+                scores[idx]["folds"][fold] = cached
+                continue
+            columns = [i for i, f in enumerate(FEATURES + SPATIAL_FEATURES) if f in model_features(params)]
+            tasks.append(
+                {"fold": fold, "test_groups": folds[fold], "params": params, "columns": columns, "cand": idx}
+            )
+    cached_count = sum(len(scores[idx]["folds"]) for idx in cands)
+    print(f"  {len(tasks)} fits to run, {cached_count} fold results already cached")
+    if not tasks:
+        return
+    for task, result in zip(tasks, run_tasks(tasks, arrays, workers)):
+        metrics = {k: float(result[k]) for k in ("rmse", "r2", "seconds")}
+        write_cached(data_key, task["params"], task["fold"], metrics)
+        scores[task["cand"]]["folds"][task["fold"]] = metrics
+def mean_rmse(score, n_folds):
+    return float(np.mean([score["folds"][f]["rmse"] for f in range(n_folds)]))
+def search(df, space=SEARCH_SPACE, workers=WORKERS, time_budget=Config.TIME_BUDGET):
+    start = time.perf_counter()
+    X, y, groups = design(df, FEATURES + SPATIAL_FEATURES)
+    folds = county_folds(groups)
+    data_key = fingerprint(X, y, groups, folds)
+    arrays = {"X": X, "y": y, "groups": groups}
+    scores = [{"params": p, "folds": {}, "rung": 0} for p in candidates(space)]
+    alive = list(range(len(scores)))
+    print(f"{len(scores)} candidates, data fingerprint {data_key}")
+    for rung, n_folds in enumerate(Config.RUNG_FOLDS):
+        print(f"rung {rung}: {len(alive)} candidates on {n_folds} folds")
+        evaluate(alive, n_folds, folds, arrays, data_key, workers, scores)
+        for idx in alive:
+            scores[idx]["rung"] = rung
+        alive.sort(key=lambda i: mean_rmse(scores[i], n_folds))
+        last = rung == len(Config.RUNG_FOLDS) - 1
+        if last:
+            break
+        if time_budget is not None and time.perf_counter() - start > time_budget:
+            print(f"time budget of {time_budget:.0f}s spent, stopping after rung {rung}")
+            break
+        alive = alive[: max(1, len(alive) // Config.ETA)]
+    rows = []
+    for score in scores:
+        done = sorted(score["folds"])
+        rows.append(
+            {
+                "lam": score["params"]["lam"],
+                "n_splines": score["params"]["n_splines"],
+                "interactions": "+".join(score["params"]["interactions"]) or "none",
+                "rung": score["rung"],
+                "folds": len(done),
+                "rmse": np.mean([score["folds"][f]["rmse"] for f in done]),
+                "r2": np.mean([score["folds"][f]["r2"] for f in done]),
+                "fit_seconds": np.sum([score["folds"][f]["seconds"] for f in done]),
+            }
+        )
+    results = pd.DataFrame(rows).sort_values(["folds", "rmse"], ascending=[False, True])
+    best = scores[alive[0]]["params"]
+    print(f"search finished in {time.perf_counter() - start:.1f}s")
+    return best, results.reset_index(drop=True)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="successive-halving search over GAM smoothing, basis size and interactions"
+    )
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--time-budget", type=float, default=Config.TIME_BUDGET, help="seconds")
+    parser.add_argument("--no-spatial", action="store_true", help="leave out the lat/lon tensor term")
+    args = parser.parse_args()
+    space = dict(SEARCH_SPACE)
+    if args.no_spatial:
+        space["interactions"] = [i for i in space["interactions"] if "latlon" not in i]
+    df = load_data()
+    df = df.dropna(subset=SPATIAL_FEATURES)
+    best, results = search(df, space, args.workers, args.time_budget)
+    os.makedirs(os.path.dirname(Config.RESULTS_FILE), exist_ok=True)
+    results.to_csv(Config.RESULTS_FILE, index=False)
+    os.makedirs(os.path.dirname(Config.BEST_PARAMS_FILE), exist_ok=True)
+    with open(Config.BEST_PARAMS_FILE, "w") as f:
+        json.dump(best, f, indent=2)
+    print(results.head(10))
+    print(f"best: {best}, saved to {Config.BEST_PARAMS_FILE}")
+    print(f"train it with: python src/analysis/model_gam.py --params {Config.BEST_PARAMS_FILE}")
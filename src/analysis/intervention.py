@@ -1,28 +1,12 @@
+import argparse
 import os
-import joblib
 import numpy as np
 import pandas as pd
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
-load_dotenv()
-def get_db_engine():
-    user = os.getenv("PGUSER")
-    password = os.getenv("PGPASSWORD")
-    host = os.getenv("PGHOST", "localhost")
-    port = os.getenv("PGPORT", "5432")
-    dbname = os.getenv("PGDATABASE", "asthma")
-    return create_engine(f"postgresql://{user}:{password}@{host}:{port}/{dbname}")
+from data import load_frame
+from gam_cache import CachedGAMPredictor
+from gam_portable import find_model, load_model
 def load_data():
-    engine = get_db_engine()
-    query = """
-    SELECT geo_id, population, asthma_prev,
-           pm25_mean, no2_mean, poverty_rate, dist_primary_road_meters,
-           population_density, year
-    FROM modeling_data
-    WHERE year = 2024;
-    """
     print("Loading 2024 data for simulation...")
-    df = pd.read_sql(query, engine)
     cols = [
         "asthma_prev",
         "pm25_mean",
@@ -32,130 +16,129 @@ def load_data():
         "population_density",
         "year",
     ]
-    for c in cols:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
+    df = load_frame(["geo_id", "population", *cols, "lon", "lat"], year=2024)
     df = df.dropna(subset=cols)
     return df
-def run_scenarios(model, df):
-    X_base = df[
-        [
-            "pm25_mean",
-            "no2_mean",
-            "poverty_rate",
-            "dist_primary_road_meters",
-            "population_density",
-            "year",
-        ]
-    ].values
-    pred_base = np.clip(model.predict(X_base), 0, 100)
-    burden_base = np.sum((pred_base / 100) * df["population"])
+FEATURES = [
+    "pm25_mean",
+    "no2_mean",
+    "poverty_rate",
+    "dist_primary_road_meters",
+    "population_density",
+    "year",
+]
+SCENARIOS = [
+    {
+        "name": "Traffic Buffer (-20% NO2 <500m)",
+        "where": ("dist_primary_road_meters", "<", 500),
+        "column": "no2_mean",
+        "op": "scale",
+        "value": 0.80,
+    },
+    {
+        "name": "PM2.5 Cap (8.0 ug/m3)",
+        "where": None,
+        "column": "pm25_mean",
+        "op": "cap",
+        "value": 8.0,
+    },
+    {
+        "name": "Equity Focus (-10% PM2.5 in High Poverty)",
+        "where": ("poverty_rate", ">", 0.20),
+        "column": "pm25_mean",
+        "op": "scale",
+        "value": 0.90,
+    },
+    {
+        "name": "Aggressive PM2.5 (-20% All)",
+        "where": None,
+        "column": "pm25_mean",
+        "op": "scale",
+        "value": 0.80,
+    },
+]
+def model_features(model):
+    return list(getattr(model, "feature_names_", None) or FEATURES)
+OPS = {
+    "scale": np.multiply,
+    "cap": np.minimum,
+    "floor": np.maximum,
+    "shift": np.add,
+}
+COMPARISONS = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "==": np.equal,
+}
+def _threshold(X, column, value):
+    if column == "poverty_rate" and X[:, FEATURES.index(column)].max() > 1.0:
+        return value * 100
+    return value
+def scenario_mask(X, scenario):
+    if scenario.get("where") is None:
+        return np.ones(len(X), dtype=bool)
+    column, cmp, value = scenario["where"]
+    j = FEATURES.index(column)
+    return COMPARISONS[cmp](X[:, j], _threshold(X, column, value))
+def build_scenarios(X, scenarios):
+    stack = np.empty((len(scenarios) + 1, X.shape[0], X.shape[1]), dtype=np.float64)
+    stack[:] = X
+    for i, scenario in enumerate(scenarios, start=1):
+        mask = scenario_mask(X, scenario)
+        j = FEATURES.index(scenario["column"])
+        stack[i, mask, j] = OPS[scenario["op"]](X[mask, j], scenario["value"])
+    return stack
+def score_scenarios(model, X, population, scenarios):
+    predictor = model if isinstance(model, CachedGAMPredictor) else CachedGAMPredictor(model, X)
+    stack = build_scenarios(X, scenarios)
+    n_scen, n_tracts, n_feat = stack.shape
+    changed = np.any(stack != X, axis=2)
+    changed[0] = False
+    pred = np.empty((n_scen, n_tracts), dtype=np.float64)
+    pred[:] = predictor.baseline
+    pred[changed] = predictor.predict_rows(stack[changed], np.nonzero(changed)[1])
+    np.clip(pred, 0, 100, out=pred)
+    burden = (pred / 100) @ np.nan_to_num(np.asarray(population, dtype=np.float64))
+    return burden[0], burden[1:]
+def run_scenarios(model, df, scenarios=SCENARIOS):
+    features = model_features(model)
+    df = df.dropna(subset=features)
+    X_base = df[features].to_numpy(dtype=np.float64)
+    print(f"Simulating {len(scenarios)} scenarios over {len(X_base)} tracts...")
+    burden_base, burden = score_scenarios(model, X_base, df["population"], scenarios)
     print(f"Baseline (2024) Estimated Asthma Cases: {burden_base:,.0f}")
-    results = []
-    print("Simulating Scenario 1: Traffic Buffer (-20% NO2 <500m)...")
-    df_s1 = df.copy()
-    mask_road = df_s1["dist_primary_road_meters"] < 500
-    df_s1.loc[mask_road, "no2_mean"] *= 0.80
-    X_s1 = df_s1[
-        [
-            "pm25_mean",
-            "no2_mean",
-            "poverty_rate",
-            "dist_primary_road_meters",
-            "population_density",
-            "year",
-        ]
-    ].values
-    pred_s1 = np.clip(model.predict(X_s1), 0, 100)
-    burden_s1 = np.sum((pred_s1 / 100) * df_s1["population"])
-    results.append(
+    res_df = pd.DataFrame(
         {
-            "Scenario": "Traffic Buffer (-20% NO2 <500m)",
-            "Cases": burden_s1,
-            "Prevented": burden_base - burden_s1,
+            "Scenario": [sc["name"] for sc in scenarios],
+            "Cases": burden,
+            "Prevented": burden_base - burden,
         }
-    )
-    print("Simulating Scenario 2: PM2.5 Cap at 8.0...")
-    df_s2 = df.copy()
-    mask_cap = df_s2["pm25_mean"] > 8.0
-    df_s2.loc[mask_cap, "pm25_mean"] = 8.0
-    X_s2 = df_s2[
-        [
-            "pm25_mean",
-            "no2_mean",
-            "poverty_rate",
-            "dist_primary_road_meters",
-            "population_density",
-            "year",
-        ]
-    ].values
-    pred_s2 = np.clip(model.predict(X_s2), 0, 100)
-    burden_s2 = np.sum((pred_s2 / 100) * df_s2["population"])
-    results.append(
-        {
-            "Scenario": "PM2.5 Cap (8.0 ug/m3)",
-            "Cases": burden_s2,
-            "Prevented": burden_base - burden_s2,
-        }
-    )
-    print("Simulating Scenario 3: Equity Focus...")
-    df_s3 = df.copy()
-    if df["poverty_rate"].max() <= 1.0:
-        mask_pov = df_s3["poverty_rate"] > 0.20
-    else:
-        mask_pov = df_s3["poverty_rate"] > 20.0
-    df_s3.loc[mask_pov, "pm25_mean"] *= 0.90
-    X_s3 = df_s3[
-        [
-            "pm25_mean",
-            "no2_mean",
-            "poverty_rate",
-            "dist_primary_road_meters",
-            "population_density",
-            "year",
-        ]
-    ].values
-    pred_s3 = np.clip(model.predict(X_s3), 0, 100)
-    burden_s3 = np.sum((pred_s3 / 100) * df_s3["population"])
-    results.append(
-        {
-            "Scenario": "Equity Focus (-10% PM2.5 in High Poverty)",
-            "Cases": burden_s3,
-            "Prevented": burden_base - burden_s3,
-        }
-    )
-    print("Simulating Scenario 4: Aggressive PM2.5 (-20% All)...")
-    df_s4 = df.copy()
-    df_s4["pm25_mean"] *= 0.80
-    X_s4 = df_s4[
-        [
-            "pm25_mean",
-            "no2_mean",
-            "poverty_rate",
-            "dist_primary_road_meters",
-            "population_density",
-            "year",
-        ]
-    ].values
-    pred_s4 = np.clip(model.predict(X_s4), 0, 100)
-    burden_s4 = np.sum((pred_s4 / 100) * df_s4["population"])
-    results.append(
-        {
-            "Scenario": "Aggressive PM2.5 (-20% All)",
-            "Cases": burden_s4,
-            "Prevented": burden_base - burden_s4,
-        }
-    )
-    res_df = pd.DataFrame(results).sort_values("Prevented", ascending=False)
+    ).sort_values("Prevented", ascending=False)
     print("\nIntervention Results")
     print(res_df)
+    os.makedirs("reports", exist_ok=True)
     res_df.to_csv("reports/intervention_impact.csv", index=False)
     print("Saved results to reports/intervention_impact.csv")
-def run():
-    model_path = "models/gam_asthma.pkl"
-    if not os.path.exists(model_path):
+    return res_df
+def run(bootstrap=0, workers=None):
+    if bootstrap:
+        import bootstrap_intervention
+        return bootstrap_intervention.run(bootstrap, workers or bootstrap_intervention.WORKERS)
+    model_path = find_model()
+    if model_path is None:
         print("Model not found. Run model_gam.py first.")
         return
-    print("Loading model...")
-    model = joblib.load(model_path)
+    print(f"Loading model from {model_path}...")
+    model = load_model(model_path)
     df = load_data()
     run_scenarios(model, df)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="estimate asthma cases prevented under intervention scenarios")
+    parser.add_argument(
+        "--bootstrap", type=int, default=0, help="also refit the GAM on this many county-block resamples for intervals"
+    )
+    parser.add_argument("--workers", type=int, help="processes for the bootstrap refits")
+    args = parser.parse_args()
+    run(args.bootstrap, args.workers)
@@ -1,31 +1,20 @@
+import argparse
+import json
 import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 import joblib
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
-from dotenv import load_dotenv
+from data import load_frame
+from gam_portable import MODEL_PATH, PICKLE_PATH, export_model
 from pygam import LinearGAM, s, te
 from sklearn.metrics import mean_squared_error, r2_score
 from sklearn.model_selection import KFold
-from sqlalchemy import create_engine
-load_dotenv()
-def get_db_engine():
-    user = os.getenv("PGUSER")
-    password = os.getenv("PGPASSWORD")
-    host = os.getenv("PGHOST", "localhost")
-    port = os.getenv("PGPORT", "5432")
-    dbname = os.getenv("PGDATABASE", "asthma")
-    return create_engine(f"postgresql://{user}:{password}@{host}:{port}/{dbname}")
 def load_data():
-    engine = get_db_engine()
-    query = """
-    SELECT geo_id, state_code, county_code, asthma_prev,
-           pm25_mean, no2_mean, poverty_rate, dist_primary_road_meters,
-           population_density, year
-    FROM modeling_data;
-    """
     print("Loading modeling data...")
-    df = pd.read_sql(query, engine)
     cols = [
         "asthma_prev",
         "pm25_mean",
@@ -35,58 +24,138 @@ def load_data():
         "population_density",
         "year",
     ]
-    for c in cols:
-        df[c] = pd.to_numeric(df[c], errors="coerce")
+    df = load_frame(["geo_id", "state_code", "county_code", *cols, "lon", "lat"])
     df = df.dropna(subset=cols)
     print(f"Loaded {len(df)} clean records.")
     return df
-def train_and_validate(df):
-    X = df[
-        [
-            "pm25_mean",
-            "no2_mean",
-            "poverty_rate",
-            "dist_primary_road_meters",
-            "population_density",
-            "year",
-        ]
-    ].values
-    y = df["asthma_prev"].values
-    groups = df["county_code"].values
-    gam = LinearGAM(s(0) + s(1) + s(2) + s(3) + s(4) + s(5))
-    print("\nStarting Spatial Cross-Validation (Grouped by County)")
+FEATURES = [
+    "pm25_mean",
+    "no2_mean",
+    "poverty_rate",
+    "dist_primary_road_meters",
+    "population_density",
+    "year",
+]
+SPATIAL_FEATURES = ["lon", "lat"]
+WORKERS = os.cpu_count() or 1
+def model_features(params=None):
+    interactions = (params or {}).get("interactions", [])
+    return FEATURES + SPATIAL_FEATURES if "latlon" in interactions else list(FEATURES)
+def make_gam(params=None):
+    params = params or {}
+    lam = params.get("lam", 0.6)
+    n_splines = params.get("n_splines", 20)
+    terms = s(0, n_splines=n_splines, lam=lam)
+    for i in range(1, len(FEATURES)):
+        terms += s(i, n_splines=n_splines, lam=lam)
+    interactions = params.get("interactions", [])
+    if "pm25_no2" in interactions:
+        terms += te(FEATURES.index("pm25_mean"), FEATURES.index("no2_mean"), lam=lam)
+    if "latlon" in interactions:
+        terms += te(len(FEATURES), len(FEATURES) + 1, lam=lam)
+    return LinearGAM(terms)
+def _share(arr):
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+    return shm, (shm.name, arr.shape, arr.dtype.str)
+_attached = {}
+def _attach(spec):
+    name, shape, dtype = spec
+    if name not in _attached:
+        _attached[name] = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=_attached[name].buf)
+def _fit_task(task):
+    start = time.perf_counter()
+    X = _attach(task["X"])
+    if task.get("columns") is not None:
+        X = X[:, task["columns"]]
+    y = _attach(task["y"])
+    groups = _attach(task["groups"])
+    params = task.get("params")
+    result = {"fold": task["fold"]}
+    if task["test_groups"] is None:
+        result["model"] = make_gam(params).fit(X, y)
+    else:
+        test_mask = np.isin(groups, task["test_groups"])
+        model = make_gam(params).fit(X[~test_mask], y[~test_mask])
+        preds = model.predict(X[test_mask])
+        result["rmse"] = np.sqrt(mean_squared_error(y[test_mask], preds))
+        result["r2"] = r2_score(y[test_mask], preds)
+        result["n_test"] = int(test_mask.sum())
+        result["n_counties"] = len(task["test_groups"])
+    result["seconds"] = time.perf_counter() - start
+    result["pid"] = os.getpid()
+    result["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+def county_folds(groups):
     unique_counties = np.unique(groups)
     kf = KFold(n_splits=5, shuffle=True, random_state=42)
+    return [test_idx for _, test_idx in kf.split(unique_counties)]
+def design(df, features):
+    X = np.ascontiguousarray(df[features].to_numpy(dtype=np.float64))
+    y = np.ascontiguousarray(df["asthma_prev"].to_numpy(dtype=np.float64))
+    _, groups = np.unique(df["county_code"].to_numpy(), return_inverse=True)
+    return X, y, groups.astype(np.int64)
+def run_tasks(tasks, arrays, workers, fn=_fit_task):
+    handles = []
+    try:
+        for key, arr in arrays.items():
+            shm, spec = _share(arr)
+            handles.append(shm)
+            for task in tasks:
+                task[key] = spec
+        if workers <= 1:
+            return [fn(task) for task in tasks]
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            return list(pool.map(fn, tasks))
+    finally:
+        for shm in handles:
+            shm.close()
+            shm.unlink()
+def train_and_validate(df, workers=WORKERS, params=None):
+    features = model_features(params)
+    X, y, groups = design(df.dropna(subset=features), features)
+    tasks = [{"fold": "full", "test_groups": None, "params": params}]
+    for i, test_groups in enumerate(county_folds(groups)):
+        tasks.append({"fold": i, "test_groups": test_groups, "params": params})
+    print("\nStarting Spatial Cross-Validation (Grouped by County)")
+    print(f"fitting {len(tasks) - 1} folds and the full model on {min(workers, len(tasks))} workers")
+    start = time.perf_counter()
+    results = run_tasks(tasks, {"X": X, "y": y, "groups": groups}, workers)
+    elapsed = time.perf_counter() - start
+    final_model = None
     rmse_scores = []
     r2_scores = []
-    for train_idx, test_idx in kf.split(unique_counties):
-        test_counties = unique_counties[test_idx]
-        train_mask = ~np.isin(groups, test_counties)
-        test_mask = np.isin(groups, test_counties)
-        X_train, y_train = X[train_mask], y[train_mask]
-        X_test, y_test = X[test_mask], y[test_mask]
-        if len(X_test) == 0:
+    for result in results:
+        if result["fold"] == "full":
+            final_model = result["model"]
+            print(
+                f"Full fit -> {result['seconds']:.1f}s "
+                f"(worker {result['pid']}, peak rss {result['max_rss_mb']:.0f}MB)"
+            )
             continue
-        model = LinearGAM(s(0) + s(1) + s(2) + s(3) + s(4) + s(5)).fit(X_train, y_train)
-        preds = model.predict(X_test)
-        rmse = np.sqrt(mean_squared_error(y_test, preds))
-        r2 = r2_score(y_test, preds)
-        rmse_scores.append(rmse)
-        r2_scores.append(r2)
+        rmse_scores.append(result["rmse"])
+        r2_scores.append(result["r2"])
         print(
-            f"Fold Results -> RMSE: {rmse:.4f}, R2: {r2:.4f} (Held out {len(test_counties)} counties)"
+            f"Fold Results -> RMSE: {result['rmse']:.4f}, R2: {result['r2']:.4f} "
+            f"(Held out {result['n_counties']} counties) {result['seconds']:.1f}s "
+            f"(worker {result['pid']}, peak rss {result['max_rss_mb']:.0f}MB)"
         )
     print(f"\nAverage RMSE: {np.mean(rmse_scores):.4f}")
     print(f"Average R2: {np.mean(r2_scores):.4f}")
-    print("\nRetraining on full dataset...")
-    final_model = gam.fit(X, y)
+    slowest = max(r["seconds"] for r in results)
+    total = sum(r["seconds"] for r in results)
+    print(f"CV and full fit took {elapsed:.1f}s wall, {total:.1f}s of fitting, slowest single fit {slowest:.1f}s")
     print(final_model.summary())
+    final_model.feature_names_ = features
     return final_model
 def save_model_and_plots(model):
     os.makedirs("models", exist_ok=True)
     os.makedirs("reports/figures", exist_ok=True)
-    joblib.dump(model, "models/gam_asthma.pkl")
-    print("Saved model to models/gam_asthma.pkl")
+    joblib.dump(model, PICKLE_PATH)
+    print(f"Saved model to {PICKLE_PATH}")
+    export_model(model, MODEL_PATH)
+    print(f"Exported portable model to {MODEL_PATH} ({os.path.getsize(MODEL_PATH) / 1024:.0f}KB)")
     titles = ["PM2.5", "NO2", "Poverty Rate", "Distance to Road", "Pop Density", "Year"]
     plt.figure(figsize=(15, 10))
     for i, title in enumerate(titles):
@@ -97,7 +166,7 @@ def save_model_and_plots(model):
             XX[:, i],
             model.partial_dependence(term=i, X=XX, width=0.95)[1],
             c="r",
-            ls="
+            ls="--",
         )
         plt.title(title)
         plt.xlabel("Value")
@@ -106,9 +175,18 @@ def save_model_and_plots(model):
     plt.tight_layout()
     plt.savefig("reports/figures/gam_partial_dependence.png")
     print("Saved partial dependence plot.")
-def run():
+def run(workers=WORKERS, params_path=None):
+    params = None
+    if params_path:
+        with open(params_path) as f:
+            params = json.load(f)
+        print(f"Using hyperparameters from {params_path}: {params}")
     df = load_data()
-    model = train_and_validate(df)
+    model = train_and_validate(df, workers, params)
     save_model_and_plots(model)
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="train the asthma GAM with county-grouped CV")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--params", help="json of hyperparameters, e.g. the one written by gam_search.py")
+    args = parser.parse_args()
+    run(args.workers, args.params)
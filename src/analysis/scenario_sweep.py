@@ -0,0 +1,255 @@
+import argparse
+import itertools
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from gam_cache import CachedGAMPredictor
+from gam_portable import PortableGAM, find_model, load_model
+from intervention import FEATURES, OPS, load_data, model_features, scenario_mask, score_scenarios
+class Config:
+    OUTPUT_FILE = "reports/scenario_sweep.parquet"
+    WORKERS = os.cpu_count() or 1
+    CHUNK_SCENARIOS = 32
+    MONOTONE_STEPS = 256
+    MONOTONE_OTHERS = 32
+SWEEPS = {
+    "traffic_buffer": {
+        "where": ("dist_primary_road_meters", "<"),
+        "threshold": [300, 500, 1000],
+        "column": "no2_mean",
+        "op": "scale",
+        "value": [0.90, 0.80, 0.70],
+    },
+    "pm25_cap": {
+        "where": None,
+        "threshold": [None],
+        "column": "pm25_mean",
+        "op": "cap",
+        "value": [6.0, 7.0, 8.0, 9.0, 10.0],
+    },
+    "equity": {
+        "where": ("poverty_rate", ">"),
+        "threshold": [0.10, 0.20, 0.30],
+        "column": "pm25_mean",
+        "op": "scale",
+        "value": [0.90, 0.80, 0.70],
+    },
+}
+def expand_sweeps(sweeps):
+    scenarios = []
+    for family, spec in sweeps.items():
+        for threshold, value in itertools.product(spec["threshold"], spec["value"]):
+            where = None if spec["where"] is None else (*spec["where"], threshold)
+            scenarios.append(
+                {
+                    "name": f"{family} threshold={threshold} value={value}",
+                    "family": family,
+                    "where": where,
+                    "threshold": threshold,
+                    "column": spec["column"],
+                    "op": spec["op"],
+                    "value": value,
+                }
+            )
+    return scenarios
+def describe(X, population, scenario):
+    mask = scenario_mask(X, scenario)
+    j = FEATURES.index(scenario["column"])
+    new = OPS[scenario["op"]](X[mask, j], scenario["value"])
+    delta = np.abs(new - X[mask, j])
+    touched = delta > 0
+    pop = population[mask]
+    signature = (
+        scenario["column"],
+        scenario["op"],
+        scenario["value"],
+        np.flatnonzero(mask)[touched].tobytes(),
+    )
+    return {
+        "tracts_affected": int(touched.sum()),
+        "population_affected": float(pop[touched].sum()),
+        "exposure_change": float((pop * delta).sum() / max(population.sum(), 1.0)),
+    }, signature
+_worker = {}
+def _init_worker(model_path, x_path, pop_path):
+    _worker["X"] = np.load(x_path, mmap_mode="r")
+    _worker["population"] = np.load(pop_path, mmap_mode="r")
+    _worker["predictor"] = CachedGAMPredictor(load_model(model_path), _worker["X"])
+def _score_chunk(scenarios):
+    _, burden = score_scenarios(_worker["predictor"], _worker["X"], _worker["population"], scenarios)
+    return burden
+def pareto_dominated(cost, prevented):
+    order = np.lexsort((-prevented, cost))
+    dominated = np.zeros(len(cost), dtype=bool)
+    best = -np.inf
+    for i in order:
+        if prevented[i] <= best:
+            dominated[i] = True
+        else:
+            best = prevented[i]
+    return dominated
+def shifted_column(X, scenario):
+    j = FEATURES.index(scenario["column"])
+    column = X[:, j].copy()
+    mask = scenario_mask(X, scenario)
+    column[mask] = OPS[scenario["op"]](X[mask, j], scenario["value"])
+    return column
+def monotone_in(model, X, column, lo, hi, steps=Config.MONOTONE_STEPS, others=Config.MONOTONE_OTHERS):
+    gam = model if isinstance(model, PortableGAM) else PortableGAM.from_pygam(model)
+    j = FEATURES.index(column)
+    terms = [t for t in gam.terms if j in t.features]
+    if not terms:
+        return True
+    rest = sorted({int(f) for t in terms for f in t.features} - {j})
+    axes = [np.linspace(lo, hi, steps)] + [np.linspace(X[:, k].min(), X[:, k].max(), others) for k in rest]
+    grid = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, len(axes))
+    probe = np.zeros((len(grid), X.shape[1]))
+    probe[:, [j, *rest]] = grid
+    effect = sum(t.contribution(probe) for t in terms).reshape(steps, -1)
+    return bool((np.diff(effect, axis=0) >= -1e-12).all())
+def provably_dominated(key, todo, shifted, cost, prevented):
+    column, values = shifted.get(key, (None, None))
+    if column is None:
+        return False
+    bound = min(
+        (p for a, p in prevented.items() if a in shifted and shifted[a][0] == column and (shifted[a][1] <= values).all()),
+        default=None,
+    )
+    if bound is None:
+        return False
+    return any(todo[c]["column"] == column and cost[c] <= cost[key] and p >= bound for c, p in prevented.items())
+def score_order(todo, shifted, cost):
+    above = {
+        key: [
+            other
+            for other in shifted
+            if shifted[other][0] == shifted[key][0]
+            and (shifted[other][1] <= shifted[key][1]).all()
+            and (shifted[other][1] < shifted[key][1]).any()
+        ]
+        for key in shifted
+    }
+    depth = {}
+    def layer(key):
+        if key not in depth:
+            depth[key] = 1 + max((layer(other) for other in above.get(key, [])), default=-1)
+        return depth[key]
+    return sorted(todo, key=lambda k: (layer(k), cost[k]))
+def run_sweep(model_path, df, sweeps=SWEEPS, workers=Config.WORKERS, drop_dominated=False):
+    start = time.perf_counter()
+    model = load_model(model_path)
+    X = df[model_features(model)].to_numpy(dtype=np.float64)
+    population = np.nan_to_num(df["population"].to_numpy(dtype=np.float64))
+    scenarios = expand_sweeps(sweeps)
+    rows = []
+    unique = {}
+    for scenario in scenarios:
+        stats, signature = describe(X, population, scenario)
+        rows.append({**scenario, **stats, "signature": unique.setdefault(signature, len(unique))})
+    todo = {}
+    cost = {}
+    for i, row in enumerate(rows):
+        if row["tracts_affected"] and row["signature"] not in todo:
+            todo[row["signature"]] = scenarios[i]
+            cost[row["signature"]] = row["exposure_change"]
+    print(
+        f"{len(scenarios)} configurations, {len(todo)} distinct after pruning no-op and duplicate ones, "
+        f"{len(X)} tracts"
+    )
+    shifted = {}
+    if drop_dominated:
+        columns = {k: shifted_column(X, sc) for k, sc in todo.items()}
+        for column in sorted({sc["column"] for sc in todo.values()}):
+            keys = [k for k, sc in todo.items() if sc["column"] == column]
+            j = FEATURES.index(column)
+            lo = min(X[:, j].min(), *(columns[k].min() for k in keys))
+            hi = max(X[:, j].max(), *(columns[k].max() for k in keys))
+            if monotone_in(model, X, column, lo, hi):
+                shifted.update((k, (column, columns[k])) for k in keys)
+            else:
+                print(f"model is not monotone in {column}, scoring every {column} configuration")
+    burden_base, _ = score_scenarios(model, X, population, [])
+    order = score_order(todo, shifted, cost)
+    batch_size = Config.CHUNK_SCENARIOS * max(workers, 1)
+    rounds = [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+    burden = {}
+    prevented = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        x_path = os.path.join(tmp, "X.npy")
+        pop_path = os.path.join(tmp, "population.npy")
+        np.save(x_path, X)
+        np.save(pop_path, population)
+        if workers <= 1 or len(todo) <= Config.CHUNK_SCENARIOS:
+            _init_worker(model_path, x_path, pop_path)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(model_path, x_path, pop_path)
+            )
+        try:
+            for keys in rounds:
+                keys = [k for k in keys if not provably_dominated(k, todo, shifted, cost, prevented)]
+                if not keys:
+                    continue
+                key_chunks = [keys[i : i + Config.CHUNK_SCENARIOS] for i in range(0, len(keys), Config.CHUNK_SCENARIOS)]
+                chunks = [[todo[k] for k in chunk] for chunk in key_chunks]
+                results = list(pool.map(_score_chunk, chunks)) if pool else list(map(_score_chunk, chunks))
+                for chunk, values in zip(key_chunks, results):
+                    for key, value in zip(chunk, values):
+                        burden[key] = value
+                        prevented[key] = burden_base - value
+        finally:
+            if pool:
+                pool.shutdown()
+    pruned = set(todo) - set(burden)
+    if drop_dominated:
+        print(f"{len(pruned)} configurations pruned as dominated before scoring")
+    out = pd.DataFrame(rows)
+    out["cases"] = [burden.get(sig, np.nan if sig in pruned else burden_base) for sig in out["signature"]]
+    out["prevented"] = burden_base - out["cases"]
+    out["baseline_cases"] = burden_base
+    out["dominated"] = out["signature"].isin(pruned)
+    for _, group in out[~out["dominated"]].groupby("column"):
+        out.loc[group.index, "dominated"] = pareto_dominated(
+            group["exposure_change"].to_numpy(), group["prevented"].to_numpy()
+        )
+    out = out.drop(columns=["name", "where", "signature"])
+    if drop_dominated:
+        out = out[~out["dominated"]]
+    out = out.sort_values("prevented", ascending=False).reset_index(drop=True)
+    print(f"evaluated sweep in {time.perf_counter() - start:.1f}s")
+    return out
+def parse_args():
+    parser = argparse.ArgumentParser(description="sweep intervention parameters and score every combination")
+    parser.add_argument("--grid", help="json file of sweep families, defaults to SWEEPS")
+    parser.add_argument("--families", nargs="*", help="only run these families")
+    parser.add_argument("--workers", type=int, default=Config.WORKERS)
+    parser.add_argument("--output", default=Config.OUTPUT_FILE)
+    parser.add_argument(
+        "--drop-dominated",
+        action="store_true",
+        help="leave out configs that prevent fewer cases than one with less exposure change on the same column, "
+        "skipping the ones a monotone model proves dominated before scoring them",
+    )
+    return parser.parse_args()
+if __name__ == "__main__":
+    args = parse_args()
+    model_path = find_model()
+    if model_path is None:
+        raise SystemExit("Model not found. Run model_gam.py first.")
+    sweeps = SWEEPS
+    if args.grid:
+        with open(args.grid) as f:
+            sweeps = json.load(f)
+    if args.families:
+        sweeps = {k: v for k, v in sweeps.items() if k in args.families}
+    df = load_data()
+    out = run_sweep(model_path, df, sweeps, args.workers, args.drop_dominated)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    out.to_parquet(args.output, index=False)
+    print(out.head(20))
+    print(f"Saved {len(out)} configurations to {args.output}")
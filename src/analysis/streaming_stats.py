@@ -0,0 +1,207 @@
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+class Config:
+    SKETCH_K = 400
+    BATCH_ROWS = 65_536
+    WORKERS = os.cpu_count() or 1
+QUANTILES = [0.25, 0.5, 0.75]
+class KLLSketch:
+    def __init__(self, k=Config.SKETCH_K, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                pairs = items[: len(items) - len(keep)]
+                promoted = pairs[self.rng.integers(2) :: 2]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                self.levels[level] = keep
+            level += 1
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return self
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += len(values)
+        self._compress()
+        return self
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+    def quantiles(self, qs):
+        if self.n == 0:
+            return np.full(len(qs), np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(v), 2.0**level) for level, v in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        items, cum = items[order], np.cumsum(weights[order])
+        idx = np.searchsorted(cum, np.asarray(qs) * cum[-1], side="left")
+        return items[np.minimum(idx, len(items) - 1)]
+class StreamingStats:
+    def __init__(self, columns, sketch_k=Config.SKETCH_K):
+        self.columns = list(columns)
+        k = len(self.columns)
+        self.rows = 0
+        self.n = np.zeros((k, k))
+        self.mean_x = np.zeros((k, k))
+        self.mean_y = np.zeros((k, k))
+        self.m2_x = np.zeros((k, k))
+        self.m2_y = np.zeros((k, k))
+        self.comoment = np.zeros((k, k))
+        self.min = np.full(k, np.inf)
+        self.max = np.full(k, -np.inf)
+        self.sketches = [KLLSketch(sketch_k, seed=i) for i in range(k)]
+    def _merge_moments(self, n, mean_x, mean_y, m2_x, m2_y, comoment):
+        total = self.n + n
+        safe = np.where(total > 0, total, 1)
+        dx = mean_x - self.mean_x
+        dy = mean_y - self.mean_y
+        w = self.n * n / safe
+        self.m2_x += m2_x + dx * dx * w
+        self.m2_y += m2_y + dy * dy * w
+        self.comoment += comoment + dx * dy * w
+        self.mean_x += dx * n / safe
+        self.mean_y += dy * n / safe
+        self.n = total
+    def update(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if len(X) == 0:
+            return self
+        finite = np.isfinite(X)
+        F = finite.astype(np.float64)
+        counts = np.maximum(F.sum(axis=0), 1)
+        shift = np.where(finite, X, 0.0).sum(axis=0) / counts
+        D = np.where(finite, X - shift, 0.0)
+        n = F.T @ F
+        safe = np.where(n > 0, n, 1)
+        sum_x = D.T @ F
+        sum_y = sum_x.T
+        mean_x = sum_x / safe
+        mean_y = sum_y / safe
+        m2_x = (D * D).T @ F - sum_x * mean_x
+        m2_y = m2_x.T
+        comoment = D.T @ D - sum_x * mean_y
+        self._merge_moments(n, mean_x + shift[:, None], mean_y + shift[None, :], m2_x, m2_y, comoment)
+        self.min = np.fmin(self.min, np.nanmin(np.where(finite, X, np.inf), axis=0))
+        self.max = np.fmax(self.max, np.nanmax(np.where(finite, X, -np.inf), axis=0))
+        for j, sketch in enumerate(self.sketches):
+            sketch.update(X[:, j])
+        self.rows += len(X)
+        return self
+    def merge(self, other):
+        if other.columns != self.columns:
+            raise ValueError("cannot merge statistics over different columns")
+        self._merge_moments(other.n, other.mean_x, other.mean_y, other.m2_x, other.m2_y, other.comoment)
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        for sketch, theirs in zip(self.sketches, other.sketches):
+            sketch.merge(theirs)
+        self.rows += other.rows
+        return self
+    def count(self):
+        return np.diag(self.n).copy()
+    def mean(self):
+        return np.where(self.count() > 0, np.diag(self.mean_x), np.nan)
+    def var(self, ddof=1):
+        count = self.count()
+        return np.where(count > ddof, np.diag(self.m2_x) / np.maximum(count - ddof, 1), np.nan)
+    def corr(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            r = self.comoment / np.sqrt(self.m2_x * self.m2_y)
+        r[self.n < 2] = np.nan
+        return pd.DataFrame(np.clip(r, -1, 1), index=self.columns, columns=self.columns)
+    def describe(self, quantiles=QUANTILES):
+        count = self.count()
+        qs = np.column_stack([s.quantiles(quantiles) for s in self.sketches])
+        rows = {
+            "count": count,
+            "mean": self.mean(),
+            "std": np.sqrt(self.var()),
+            "min": np.where(count > 0, self.min, np.nan),
+        }
+        for q, values in zip(quantiles, qs):
+            rows[f"{q * 100:g}%"] = values
+        rows["max"] = np.where(count > 0, self.max, np.nan)
+        return pd.DataFrame(rows, index=self.columns).T
+def batch_matrix(batch, columns, require=()):
+    arrays = []
+    for name in columns:
+        col = batch.column(name)
+        arrays.append(pc.cast(col, pa.float64()).to_numpy(zero_copy_only=False))
+    X = np.column_stack(arrays) if arrays else np.empty((batch.num_rows, 0))
+    if require:
+        keep = np.ones(len(X), dtype=bool)
+        for name in require:
+            keep &= np.isfinite(pc.cast(batch.column(name), pa.float64()).to_numpy(zero_copy_only=False))
+        X = X[keep]
+    return X
+def parquet_files(source):
+    if isinstance(source, (list, tuple)):
+        return [f for s in source for f in parquet_files(s)]
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, "**", "*.parquet"), recursive=True))
+    return [source]
+def row_group_units(files):
+    return [(path, rg) for path in files for rg in range(pq.ParquetFile(path).num_row_groups)]
+def _summarize_units(task):
+    units, columns, require, batch_rows, sketch_k = task
+    stats = StreamingStats(columns, sketch_k)
+    needed = list(dict.fromkeys([*columns, *require]))
+    current, pf = None, None
+    for path, rg in units:
+        if path != current:
+            pf, current = pq.ParquetFile(path), path
+        for batch in pf.iter_batches(batch_size=batch_rows, row_groups=[rg], columns=needed):
+            stats.update(batch_matrix(batch, columns, require))
+    return stats
+def summarize(source, columns, require=(), workers=Config.WORKERS, batch_rows=Config.BATCH_ROWS, sketch_k=Config.SKETCH_K):
+    units = row_group_units(parquet_files(source))
+    parts = [chunk.tolist() for chunk in np.array_split(np.arange(len(units)), max(1, min(workers, len(units))))]
+    tasks = [([units[i] for i in part], list(columns), tuple(require), batch_rows, sketch_k) for part in parts if part]
+    if len(tasks) <= 1:
+        results = [_summarize_units(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=len(tasks)) as pool:
+            results = list(pool.map(_summarize_units, tasks))
+    stats = StreamingStats(columns, sketch_k)
+    for part in results:
+        stats.merge(part)
+    return stats
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="one-pass count/mean/std/quantiles/correlation over parquet files")
+    parser.add_argument("source", nargs="+", help="parquet files or dataset directories")
+    parser.add_argument("--columns", nargs="+", required=True)
+    parser.add_argument("--workers", type=int, default=Config.WORKERS)
+    parser.add_argument("--output", help="csv for the describe()-style summary")
+    args = parser.parse_args()
+    stats = summarize(args.source, args.columns, workers=args.workers)
+    summary = stats.describe()
+    print(f"{stats.rows} rows")
+    print(summary)
+    print(stats.corr().round(3))
+    if args.output:
+        summary.to_csv(args.output)
@@ -1,52 +1,55 @@
-DROP MATERIALIZED VIEW IF EXISTS modeling_data;
-CREATE MATERIALIZED VIEW modeling_data AS
-WITH pollution_agg AS (
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_matviews WHERE matviewname = 'modeling_data') THEN
+        DROP MATERIALIZED VIEW modeling_data;
+    END IF;
+END $$;
+CREATE TABLE IF NOT EXISTS modeling_data (
+    geo_id VARCHAR(11) NOT NULL,
+    state_code VARCHAR(2),
+    county_code VARCHAR(3),
+    asthma_prev DOUBLE PRECISION,
+    poverty_rate DOUBLE PRECISION,
+    population_density DOUBLE PRECISION,
+    svi_ranking DOUBLE PRECISION,
+    year INTEGER,
+    pm25_mean DOUBLE PRECISION,
+    no2_mean DOUBLE PRECISION,
+    dist_primary_road_meters DOUBLE PRECISION,
+    population INTEGER,
+    pm25_popweighted DOUBLE PRECISION,
+    no2_popweighted DOUBLE PRECISION,
+    geom_md5 TEXT
+);
+ALTER TABLE modeling_data ADD COLUMN IF NOT EXISTS pm25_popweighted DOUBLE PRECISION;
+ALTER TABLE modeling_data ADD COLUMN IF NOT EXISTS no2_popweighted DOUBLE PRECISION;
+ALTER TABLE modeling_data ADD COLUMN IF NOT EXISTS geom_md5 TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_modeling_data_geo_year ON modeling_data (geo_id, year);
+CREATE INDEX IF NOT EXISTS idx_modeling_data_year ON modeling_data (year);
+CREATE OR REPLACE VIEW monitor_year_means AS
+SELECT
+    monitor_id,
+    year,
+    SUM(value_sum) FILTER (WHERE pollutant = 'pm25')
+        / NULLIF(SUM(value_count) FILTER (WHERE pollutant = 'pm25'), 0) as pm25_mean,
+    SUM(value_sum) FILTER (WHERE pollutant = 'no2')
+        / NULLIF(SUM(value_count) FILTER (WHERE pollutant = 'no2'), 0) as no2_mean
+FROM monitor_year_agg
+GROUP BY monitor_id, year;
+TRUNCATE monitor_year_agg;
+INSERT INTO monitor_year_agg (monitor_id, year, pollutant, value_sum, value_count)
+SELECT m.monitor_id, r.year, c.pollutant, r.value_sum, r.value_count
+FROM (
     SELECT
-        monitor_id,
-        EXTRACT(YEAR FROM timestamp) as year,
-        AVG(CASE WHEN pollutant = 'pm25' THEN value END) as pm25_mean,
-        AVG(CASE WHEN pollutant = 'no2' THEN value END) as no2_mean
+        monitor_key,
+        EXTRACT(YEAR FROM timestamp AT TIME ZONE 'UTC')::int as year,
+        pollutant_code,
+        COALESCE(SUM(value), 0) as value_sum,
+        COUNT(value) as value_count
     FROM pollution_readings
-    GROUP BY monitor_id, year
-),
-tract_pollution AS (
-    SELECT
-        t.geo_id,
-        p.year,
-        AVG(p.pm25_mean) as pm25_mean,
-        AVG(p.no2_mean) as no2_mean
-    FROM tracts t
-    JOIN pollution_monitors m ON ST_Contains(t.geom, m.geom)
-    JOIN pollution_agg p ON m.monitor_id = p.monitor_id
-    GROUP BY t.geo_id, p.year
-),
-nearest_road AS (
-    SELECT
-        t.geo_id,
-        MIN(ST_Distance(
-            t.geom::geography,
-            h.geom::geography
-        )) as dist_primary_road_meters
-    FROM tracts t
-    CROSS JOIN highways h
-    WHERE h.mtfcc = 'S1100'
-    GROUP BY t.geo_id
-)
-SELECT
-    t.geo_id,
-    t.state_code,
-    t.county_code,
-    t.asthma_prev,
-    t.poverty_rate,
-    t.population_density,
-    t.svi_ranking,
-    tp.year,
-    tp.pm25_mean,
-    tp.no2_mean,
-    nr.dist_primary_road_meters,
-    t.population
-FROM tracts t
-LEFT JOIN tract_pollution tp ON t.geo_id = tp.geo_id
-LEFT JOIN nearest_road nr ON t.geo_id = nr.geo_id;
-CREATE INDEX IF NOT EXISTS idx_modeling_data_geo_id ON modeling_data (geo_id);
-CREATE INDEX IF NOT EXISTS idx_modeling_data_year ON modeling_data (year);
+    GROUP BY 1, 2, 3
+) r
+JOIN pollution_monitors m ON m.id = r.monitor_key
+JOIN pollutant_codes c ON c.code = r.pollutant_code;
+TRUNCATE modeling_data;
+DELETE FROM etl_watermarks WHERE name = 'modeling_data.change_seq';
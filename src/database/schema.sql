@@ -23,25 +23,141 @@ CREATE TABLE IF NOT EXISTS highways (
 );
 CREATE INDEX IF NOT EXISTS idx_highways_geom ON highways USING GIST (geom);
 CREATE INDEX IF NOT EXISTS idx_highways_mtfcc ON highways (mtfcc);
+CREATE INDEX IF NOT EXISTS idx_highways_primary_geom ON highways USING GIST (geom) WHERE mtfcc = 'S1100';
+CREATE TABLE IF NOT EXISTS tract_road_distance (
+    geo_id VARCHAR(11) PRIMARY KEY REFERENCES tracts(geo_id) ON DELETE CASCADE,
+    dist_primary_road_meters DOUBLE PRECISION,
+    nearest_gid INTEGER,
+    geom_md5 TEXT,
+    computed_at TIMESTAMPTZ DEFAULT now()
+);
 CREATE TABLE IF NOT EXISTS pollution_monitors (
     monitor_id VARCHAR(100) PRIMARY KEY,
+    id SERIAL UNIQUE,
     name VARCHAR(255),
     source VARCHAR(50),
     sensor_type VARCHAR(50),
     geom GEOMETRY(Point, 4326)
 );
+ALTER TABLE pollution_monitors ADD COLUMN IF NOT EXISTS id SERIAL UNIQUE;
 CREATE INDEX IF NOT EXISTS idx_monitors_geom ON pollution_monitors USING GIST (geom);
+CREATE TABLE IF NOT EXISTS pollutant_codes (
+    code SMALLINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    pollutant VARCHAR(20) UNIQUE NOT NULL
+);
+INSERT INTO pollutant_codes (code, pollutant) OVERRIDING SYSTEM VALUE VALUES (1, 'pm25'), (2, 'no2')
+ON CONFLICT DO NOTHING;
+SELECT setval(pg_get_serial_sequence('pollutant_codes', 'code'), GREATEST(MAX(code), 2)) FROM pollutant_codes;
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass('pollution_readings') AND relkind = 'r') THEN
+        ALTER TABLE pollution_readings RENAME TO pollution_readings_legacy;
+        ALTER TABLE pollution_readings_legacy RENAME CONSTRAINT unique_reading TO unique_reading_legacy;
+        ALTER INDEX IF EXISTS idx_readings_monitor_time RENAME TO idx_readings_legacy_monitor_time;
+        ALTER INDEX IF EXISTS idx_readings_monitor_param RENAME TO idx_readings_legacy_monitor_param;
+    END IF;
+END $$;
 CREATE TABLE IF NOT EXISTS pollution_readings (
-    id BIGSERIAL PRIMARY KEY,
-    monitor_id VARCHAR(100) REFERENCES pollution_monitors(monitor_id) ON DELETE CASCADE,
+    monitor_key INTEGER NOT NULL,
     timestamp TIMESTAMPTZ NOT NULL,
-    pollutant VARCHAR(20),
+    pollutant_code SMALLINT NOT NULL,
     value DOUBLE PRECISION,
     unit VARCHAR(20),
-    CONSTRAINT unique_reading UNIQUE (monitor_id, timestamp, pollutant)
+    CONSTRAINT unique_reading PRIMARY KEY (monitor_key, pollutant_code, timestamp)
+) PARTITION BY RANGE (timestamp);
+CREATE INDEX IF NOT EXISTS idx_readings_timestamp_brin ON pollution_readings USING BRIN (timestamp) WITH (pages_per_range = 32);
+CREATE OR REPLACE FUNCTION readings_partition_name(month_start DATE) RETURNS TEXT AS $$
+    SELECT 'pollution_readings_' || to_char(month_start, '"y"YYYY"m"MM');
+$$ LANGUAGE sql IMMUTABLE;
+CREATE OR REPLACE FUNCTION ensure_readings_partition(month_start DATE) RETURNS TEXT AS $$
+DECLARE
+    first_day DATE := date_trunc('month', month_start)::date;
+    part_name TEXT := readings_partition_name(first_day);
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_inherits
+        WHERE inhparent = 'pollution_readings'::regclass AND inhrelid = to_regclass(part_name)
+    ) THEN
+        RETURN part_name;
+    END IF;
+    IF to_regclass(part_name || '_detached') IS NOT NULL THEN
+        RAISE EXCEPTION '% is detached as %_detached, attach or drop it before loading that month', part_name, part_name;
+    END IF;
+    IF to_regclass(part_name) IS NOT NULL THEN
+        RAISE EXCEPTION '% exists but is not a partition of pollution_readings, attach, rename or drop it', part_name;
+    END IF;
+    EXECUTE format(
+        'CREATE TABLE %I PARTITION OF pollution_readings FOR VALUES FROM (%L) TO (%L)',
+        part_name,
+        first_day::timestamp AT TIME ZONE 'UTC',
+        (first_day + INTERVAL '1 month')::timestamp AT TIME ZONE 'UTC'
+    );
+    RETURN part_name;
+END;
+$$ LANGUAGE plpgsql;
+DO $$
+BEGIN
+    IF to_regclass('pollution_readings_legacy') IS NOT NULL THEN
+        INSERT INTO pollutant_codes (pollutant)
+        SELECT DISTINCT pollutant FROM pollution_readings_legacy WHERE pollutant IS NOT NULL
+        ON CONFLICT (pollutant) DO NOTHING;
+        PERFORM ensure_readings_partition(m)
+        FROM (
+            SELECT DISTINCT date_trunc('month', timestamp AT TIME ZONE 'UTC')::date AS m
+            FROM pollution_readings_legacy
+        ) months;
+        INSERT INTO pollution_readings (monitor_key, timestamp, pollutant_code, value, unit)
+        SELECT m.id, l.timestamp, c.code, l.value, l.unit
+        FROM pollution_readings_legacy l
+        JOIN pollution_monitors m ON m.monitor_id = l.monitor_id
+        JOIN pollutant_codes c ON c.pollutant = l.pollutant
+        ORDER BY l.timestamp
+        ON CONFLICT DO NOTHING;
+        DROP TABLE pollution_readings_legacy;
+    END IF;
+END $$;
+CREATE SEQUENCE IF NOT EXISTS monitor_year_agg_change_seq;
+CREATE TABLE IF NOT EXISTS monitor_year_agg (
+    monitor_id VARCHAR(100) REFERENCES pollution_monitors(monitor_id) ON DELETE CASCADE,
+    year INTEGER NOT NULL,
+    pollutant VARCHAR(20) NOT NULL,
+    value_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    value_count BIGINT NOT NULL DEFAULT 0,
+    change_seq BIGINT NOT NULL DEFAULT nextval('monitor_year_agg_change_seq'),
+    PRIMARY KEY (monitor_id, year, pollutant)
+);
+CREATE INDEX IF NOT EXISTS idx_monitor_year_agg_change_seq ON monitor_year_agg (change_seq);
+CREATE UNLOGGED TABLE IF NOT EXISTS pollution_readings_stage (
+    monitor_id VARCHAR(100),
+    timestamp TIMESTAMPTZ,
+    pollutant VARCHAR(20),
+    value DOUBLE PRECISION,
+    unit VARCHAR(20)
+);
+CREATE TABLE IF NOT EXISTS tract_exposure (
+    geo_id VARCHAR(11) REFERENCES tracts(geo_id) ON DELETE CASCADE,
+    year INTEGER NOT NULL,
+    pm25_mean DOUBLE PRECISION,
+    no2_mean DOUBLE PRECISION,
+    pm25_monitors SMALLINT,
+    no2_monitors SMALLINT,
+    pm25_nearest_km DOUBLE PRECISION,
+    no2_nearest_km DOUBLE PRECISION,
+    method VARCHAR(20),
+    computed_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (geo_id, year)
+);
+CREATE TABLE IF NOT EXISTS tract_exposure_popweighted (
+    geo_id VARCHAR(11) REFERENCES tracts(geo_id) ON DELETE CASCADE,
+    year INTEGER NOT NULL,
+    pm25_mean DOUBLE PRECISION,
+    no2_mean DOUBLE PRECISION,
+    pm25_pop_covered DOUBLE PRECISION,
+    no2_pop_covered DOUBLE PRECISION,
+    population DOUBLE PRECISION,
+    computed_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (geo_id, year)
 );
-CREATE INDEX IF NOT EXISTS idx_readings_monitor_time ON pollution_readings (monitor_id, timestamp);
-CREATE INDEX IF NOT EXISTS idx_readings_monitor_param ON pollution_readings (monitor_id, pollutant);
 CREATE TABLE IF NOT EXISTS daily_covariates (
     date DATE PRIMARY KEY,
     avg_temp_celsius DECIMAL(5, 2),
@@ -49,6 +165,11 @@ CREATE TABLE IF NOT EXISTS daily_covariates (
     pollen_level VARCHAR(20),
     smoke_surge BOOLEAN DEFAULT FALSE
 );
+CREATE TABLE IF NOT EXISTS etl_watermarks (
+    name VARCHAR(100) PRIMARY KEY,
+    value TEXT,
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
 CREATE TABLE IF NOT EXISTS interventions (
     id SERIAL PRIMARY KEY,
     name VARCHAR(100),
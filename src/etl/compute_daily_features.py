@@ -0,0 +1,239 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from compute_tract_exposure import POLLUTANTS, TRACTS_SQL, get_conn, to_xyz, weight_matrix
+from compute_tract_exposure import Config as ExposureConfig
+from openaq_lake import LAKE_DIR, read_lake
+class Config:
+    LAKE_DIR = LAKE_DIR
+    OUTPUT_DIR = "data/processed/daily_features"
+    MANIFEST_FILE = os.path.join(OUTPUT_DIR, "_manifest.json")
+    WINDOWS = (7, 30)
+    MIN_COVERAGE = 0.5
+    EXCEEDANCE = {"pm25": 35.0, "no2": 0.053}
+    EXCEEDANCE_WINDOW = 30
+    TRACTS_PER_ROW_GROUP = 128
+FORMAT_VERSION = 2
+UNIT_FACTORS = {
+    "pm25": {"ug/m3": 1.0},
+    "no2": {"ppm": 1.0, "ppb": 1e-3, "ug/m3": 1 / 1880.0},
+}
+COVARIATES_SQL = """
+    SELECT date, avg_temp_celsius, avg_humidity, pollen_level, smoke_surge
+    FROM daily_covariates
+    ORDER BY date
+"""
+YEAR_RE = re.compile(r"year=(\d{4})")
+def lake_years():
+    pattern = os.path.join(Config.LAKE_DIR, "*", "year=*")
+    years = {int(m.group(1)) for path in glob.glob(pattern) if (m := YEAR_RE.search(path))}
+    return sorted(years)
+def lake_files(years):
+    files = []
+    for year in years:
+        pattern = os.path.join(Config.LAKE_DIR, "*", f"year={year}", "**", "*.parquet")
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            st = os.stat(path)
+            files.append([os.path.relpath(path, Config.LAKE_DIR), st.st_size, st.st_mtime_ns])
+    return files
+def unit_key(unit: str) -> str:
+    return unit.strip().lower().replace("µ", "u").replace("μ", "u").replace("³", "3")
+def in_units(table: pa.Table, pollutant: str) -> pa.Table:
+    if "unit" not in table.schema.names or table.num_rows == 0:
+        return table
+    codes = pc.dictionary_encode(pc.cast(table.column("unit"), pa.string())).combine_chunks()
+    factors = np.array([UNIT_FACTORS[pollutant].get(unit_key(u), np.nan) for u in codes.dictionary.to_pylist()] + [1.0])
+    index = codes.indices.fill_null(len(codes.dictionary)).to_numpy(zero_copy_only=False)
+    value = table.column("value").to_numpy(zero_copy_only=False) * factors[index]
+    unknown = np.isnan(factors[index]).sum()
+    if unknown:
+        print(f"  dropped {unknown} {pollutant} readings in units other than {sorted(UNIT_FACTORS[pollutant])}")
+    return table.set_column(table.schema.get_field_index("value"), "value", pa.array(value, pa.float64()))
+def monitor_days(table: pa.Table, first_day: np.datetime64, n_days: int):
+    if table.num_rows == 0:
+        return np.empty((0, 2)), np.empty((0, n_days))
+    codes = pc.dictionary_encode(pc.cast(table.column("location"), pa.string())).combine_chunks()
+    monitor = codes.indices.to_numpy(zero_copy_only=False).astype(np.int64)
+    n_monitors = len(codes.dictionary)
+    day = pc.cast(pc.cast(table.column("timestamp_utc"), pa.date32()), pa.int32()).to_numpy(zero_copy_only=False)
+    day = day.astype(np.int64) - first_day.astype("datetime64[D]").astype(np.int64)
+    value = table.column("value").to_numpy(zero_copy_only=False)
+    ok = (day >= 0) & (day < n_days) & np.isfinite(value)
+    key = monitor[ok] * n_days + day[ok]
+    sums = np.bincount(key, value[ok], minlength=n_monitors * n_days)
+    counts = np.bincount(key, minlength=n_monitors * n_days)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        daily = np.where(counts > 0, sums / counts, np.nan).reshape(n_monitors, n_days)
+    seen = np.bincount(monitor, minlength=n_monitors)
+    lon = np.bincount(monitor, table.column("longitude").to_numpy(zero_copy_only=False), minlength=n_monitors) / np.maximum(seen, 1)
+    lat = np.bincount(monitor, table.column("latitude").to_numpy(zero_copy_only=False), minlength=n_monitors) / np.maximum(seen, 1)
+    return np.column_stack([lon, lat]), daily
+def tract_days(W, daily: np.ndarray) -> np.ndarray:
+    have = np.isfinite(daily)
+    num = W @ np.where(have, daily, 0.0)
+    den = W @ have.astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(den > 0, num / den, np.nan)
+def trailing_sum(X: np.ndarray, window: int) -> np.ndarray:
+    c = np.concatenate([np.zeros((X.shape[0], 1)), np.cumsum(X, axis=1)], axis=1)
+    lo = np.maximum(np.arange(X.shape[1]) + 1 - window, 0)
+    return c[:, 1:] - c[:, lo]
+def trailing_mean(X: np.ndarray, window: int, min_coverage=Config.MIN_COVERAGE) -> np.ndarray:
+    have = np.isfinite(X)
+    total = trailing_sum(np.where(have, X, 0.0), window)
+    count = trailing_sum(have.astype(np.float64), window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count >= max(1, min_coverage * window), total / count, np.nan)
+def pollutant_features(name: str, X: np.ndarray, keep: slice) -> dict:
+    features = {name: X[:, keep]}
+    lag = np.concatenate([np.full((X.shape[0], 1), np.nan), X[:, :-1]], axis=1)
+    features[f"{name}_lag1"] = lag[:, keep]
+    for window in Config.WINDOWS:
+        features[f"{name}_{window}d"] = trailing_mean(X, window)[:, keep]
+    above = np.where(np.isfinite(X), X > Config.EXCEEDANCE[name], False).astype(np.float64)
+    features[f"{name}_exceed_{Config.EXCEEDANCE_WINDOW}d"] = trailing_sum(above, Config.EXCEEDANCE_WINDOW)[:, keep]
+    return {k: v.astype(np.float32) for k, v in features.items()}
+def covariate_days(covariates: pd.DataFrame, days: np.ndarray, keep: slice) -> dict:
+    cov = covariates.set_index("date").reindex(days)
+    smoke = cov["smoke_surge"].astype("boolean").fillna(False).to_numpy(dtype=np.float64)[None, :]
+    out = {
+        "avg_temp_celsius": pd.to_numeric(cov["avg_temp_celsius"]).to_numpy(dtype=np.float32)[keep],
+        "avg_humidity": pd.to_numeric(cov["avg_humidity"]).to_numpy(dtype=np.float32)[keep],
+        "pollen_level": pd.Categorical(cov["pollen_level"].to_numpy(dtype=object)[keep]),
+        "smoke_surge": smoke[0, keep].astype(bool),
+    }
+    for window in Config.WINDOWS:
+        out[f"smoke_days_{window}d"] = trailing_sum(smoke, window)[0, keep].astype(np.float32)
+    return out
+def year_features(year: int, targets: np.ndarray, covariates: pd.DataFrame, options: dict):
+    lead = max(max(Config.WINDOWS), Config.EXCEEDANCE_WINDOW)
+    first = np.datetime64(f"{year}-01-01") - np.timedelta64(lead, "D")
+    days = np.arange(first, np.datetime64(f"{year + 1}-01-01"), dtype="datetime64[D]")
+    keep = slice(lead, len(days))
+    features = {}
+    for pollutant in POLLUTANTS:
+        lake = read_lake(
+            columns=["location", "longitude", "latitude", "timestamp_utc", "value", "unit"],
+            start=str(days[0]),
+            end=str(days[-1]),
+            pollutants=[pollutant],
+            lake_dir=Config.LAKE_DIR,
+        )
+        coords, daily = monitor_days(in_units(lake, pollutant), days[0], len(days))
+        W = weight_matrix(to_xyz(coords[:, 0], coords[:, 1]), targets, **options)
+        features.update(pollutant_features(pollutant, tract_days(W, daily), keep))
+        print(f"  {year} {pollutant}: {lake.num_rows} readings from {len(coords)} monitors")
+    return days[keep], features, covariate_days(covariates, days, keep)
+def chunk_table(tract_ids: np.ndarray, rows: slice, days: np.ndarray, features: dict, covariates: dict) -> pa.Table:
+    n_tracts, n_days = rows.stop - rows.start, len(days)
+    columns = {
+        "geo_id": pa.DictionaryArray.from_arrays(
+            pa.array(np.repeat(np.arange(rows.start, rows.stop, dtype=np.int32), n_days)), pa.array(tract_ids, pa.string())
+        ),
+        "date": pa.array(np.tile(days, n_tracts), pa.date32()),
+        "day_of_year": pa.array(np.tile(np.arange(1, n_days + 1, dtype=np.int16), n_tracts)),
+    }
+    for name, values in features.items():
+        columns[name] = pa.array(values[rows].ravel(), from_pandas=True)
+    for name, values in covariates.items():
+        if isinstance(values, pd.Categorical):
+            columns[name] = pa.array(pd.Categorical.from_codes(np.tile(values.codes, n_tracts), values.categories))
+        else:
+            columns[name] = pa.array(np.tile(values, n_tracts), from_pandas=True)
+    return pa.table(columns)
+def write_year(year: int, tract_ids: np.ndarray, days: np.ndarray, features: dict, covariates: dict):
+    part_dir = os.path.join(Config.OUTPUT_DIR, f"year={year}")
+    os.makedirs(part_dir, exist_ok=True)
+    path = os.path.join(part_dir, "part-0.parquet")
+    tmp = os.path.join(part_dir, ".part-0.parquet.tmp")
+    rows = 0
+    writer = None
+    for start in range(0, len(tract_ids), Config.TRACTS_PER_ROW_GROUP):
+        chunk = slice(start, min(start + Config.TRACTS_PER_ROW_GROUP, len(tract_ids)))
+        table = chunk_table(tract_ids, chunk, days, features, covariates)
+        if writer is None:
+            writer = pq.ParquetWriter(tmp, table.schema, compression="zstd", write_statistics=True)
+        writer.write_table(table)
+        rows += table.num_rows
+    if writer is not None:
+        writer.close()
+        os.replace(tmp, path)
+    return path, rows
+def year_key(year, tract_ids, targets, covariates, options) -> str:
+    h = hashlib.sha256()
+    config = [FORMAT_VERSION, options, Config.WINDOWS, Config.MIN_COVERAGE, Config.EXCEEDANCE, Config.EXCEEDANCE_WINDOW]
+    h.update(json.dumps([config, lake_files([year - 1, year])], sort_keys=True, default=list).encode())
+    h.update("\n".join(tract_ids).encode())
+    h.update(np.ascontiguousarray(targets).tobytes())
+    h.update(pd.util.hash_pandas_object(covariates, index=False).to_numpy().tobytes())
+    return h.hexdigest()[:16]
+def load_manifest():
+    if not os.path.exists(Config.MANIFEST_FILE):
+        return {}
+    with open(Config.MANIFEST_FILE) as f:
+        return json.load(f)
+def save_manifest(manifest):
+    tmp = Config.MANIFEST_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, Config.MANIFEST_FILE)
+def build(tract_ids, lonlat, covariates, options, years=None, force=False):
+    years = years or lake_years()
+    targets = to_xyz(lonlat[:, 0], lonlat[:, 1])
+    os.makedirs(Config.OUTPUT_DIR, exist_ok=True)
+    manifest = load_manifest()
+    for year in years:
+        key = year_key(year, tract_ids, targets, covariates, options)
+        name = str(year)
+        if not force and manifest.get(name) == key and os.path.exists(os.path.join(Config.OUTPUT_DIR, f"year={year}")):
+            print(f"{year} unchanged")
+            continue
+        t0 = time.perf_counter()
+        days, features, daily_covariates = year_features(year, targets, covariates, options)
+        path, rows = write_year(year, tract_ids, days, features, daily_covariates)
+        manifest[name] = key
+        save_manifest(manifest)
+        print(f"wrote {rows} tract-days to {path} in {time.perf_counter() - t0:.1f}s")
+def run(options: dict, years=None, force=False):
+    start = time.perf_counter()
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(TRACTS_SQL)
+            rows = cur.fetchall()
+            cur.execute(COVARIATES_SQL)
+            covariates = pd.DataFrame(
+                cur.fetchall(), columns=["date", "avg_temp_celsius", "avg_humidity", "pollen_level", "smoke_surge"]
+            )
+    tract_ids = np.array([r[0] for r in rows], dtype=object)
+    lonlat = np.array([[r[1], r[2]] for r in rows], dtype=np.float64).reshape(-1, 2)
+    covariates["date"] = pd.to_datetime(covariates["date"]).to_numpy(dtype="datetime64[D]")
+    print(f"{len(tract_ids)} tracts, {len(covariates)} days of covariates")
+    build(tract_ids, lonlat, covariates, options, years, force)
+    print(f"daily features up to date in {Config.OUTPUT_DIR} ({time.perf_counter() - start:.1f}s)")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="daily tract x date exposure features as parquet partitioned by year")
+    parser.add_argument("--years", type=int, nargs="+", help="only rebuild these years (default: every year in the lake)")
+    parser.add_argument("--neighbours", type=int, default=ExposureConfig.NEIGHBOURS)
+    parser.add_argument("--radius-km", type=float, default=ExposureConfig.RADIUS_KM)
+    parser.add_argument("--method", choices=["idw", "gaussian"], default=ExposureConfig.METHOD)
+    parser.add_argument("--power", type=float, default=ExposureConfig.POWER)
+    parser.add_argument("--range-km", type=float, default=ExposureConfig.RANGE_KM)
+    parser.add_argument("--force", action="store_true", help="rebuild years whose inputs are unchanged")
+    args = parser.parse_args()
+    options = {
+        "k": args.neighbours,
+        "radius_km": args.radius_km,
+        "method": args.method,
+        "power": args.power,
+        "range_km": args.range_km,
+    }
+    run(options, args.years, args.force)
@@ -0,0 +1,156 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from compute_tract_exposure import MONITOR_YEARS_SQL, POLLUTANTS, get_conn, interpolate, to_xyz
+from compute_tract_exposure import Config as ExposureConfig
+from pgload import copy_frame
+class Config:
+    BLOCKS_FILE = "data/processed/block_population.parquet"
+    GRID_DIR = "data/processed/exposure_grids"
+    MANIFEST_FILE = os.path.join(GRID_DIR, "manifest.json")
+    BBOX = {"lon_min": -79.9, "lon_max": -71.7, "lat_min": 38.8, "lat_max": 45.1}
+    CELL_DEG = 0.005
+    ROWS_PER_BATCH = 32
+COLUMNS = [
+    "geo_id",
+    "year",
+    "pm25_mean",
+    "no2_mean",
+    "pm25_pop_covered",
+    "no2_pop_covered",
+    "population",
+]
+def grid_shape(bbox=Config.BBOX, cell=Config.CELL_DEG):
+    ny = int(np.ceil((bbox["lat_max"] - bbox["lat_min"]) / cell))
+    nx = int(np.ceil((bbox["lon_max"] - bbox["lon_min"]) / cell))
+    return ny, nx
+def cell_index(lon, lat, bbox=Config.BBOX, cell=Config.CELL_DEG) -> np.ndarray:
+    ny, nx = grid_shape(bbox, cell)
+    col = np.floor((np.asarray(lon) - bbox["lon_min"]) / cell).astype(np.int64)
+    row = np.floor((np.asarray(lat) - bbox["lat_min"]) / cell).astype(np.int64)
+    inside = (col >= 0) & (col < nx) & (row >= 0) & (row < ny)
+    return np.where(inside, row * nx + col, -1)
+def zones(blocks: pd.DataFrame, tract_ids: np.ndarray, bbox=Config.BBOX, cell=Config.CELL_DEG):
+    ny, nx = grid_shape(bbox, cell)
+    order = np.argsort(tract_ids)
+    pos = np.searchsorted(tract_ids, blocks["geo_id"].to_numpy(), sorter=order)
+    pos = np.minimum(pos, len(tract_ids) - 1)
+    tract = order[pos]
+    cells = cell_index(blocks["lon"].to_numpy(), blocks["lat"].to_numpy(), bbox, cell)
+    keep = (tract_ids[tract] == blocks["geo_id"].to_numpy()) & (cells >= 0)
+    tract, cells = tract[keep], cells[keep]
+    pop = blocks["population"].to_numpy(dtype=np.float64)[keep]
+    tract_pop = np.bincount(tract, pop, minlength=len(tract_ids))
+    weight = np.where(tract_pop[tract] > 0, pop, 1.0)
+    pairs, inverse = np.unique(tract * (ny * nx) + cells, return_inverse=True)
+    weight = np.bincount(inverse, weight)
+    return pairs // (ny * nx), pairs % (ny * nx), weight, tract_pop
+def cell_centres(rows: slice, bbox=Config.BBOX, cell=Config.CELL_DEG):
+    _, nx = grid_shape(bbox, cell)
+    lat = bbox["lat_min"] + (np.arange(rows.start, rows.stop) + 0.5) * cell
+    lon = bbox["lon_min"] + (np.arange(nx) + 0.5) * cell
+    lon, lat = np.meshgrid(lon, lat)
+    return to_xyz(lon.ravel(), lat.ravel())
+def grid_key(sources: np.ndarray, values: np.ndarray, options: dict, bbox=Config.BBOX, cell=Config.CELL_DEG) -> str:
+    h = hashlib.sha256(json.dumps([options, bbox, cell], sort_keys=True).encode())
+    h.update(np.ascontiguousarray(sources).tobytes())
+    h.update(np.ascontiguousarray(values).tobytes())
+    return h.hexdigest()[:16]
+def rasterize(path, sources, values, options, bbox=Config.BBOX, cell=Config.CELL_DEG, rows_per_batch=Config.ROWS_PER_BATCH):
+    ny, nx = grid_shape(bbox, cell)
+    tmp = path + ".tmp.npy"
+    grid = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(ny, nx))
+    for r0 in range(0, ny, rows_per_batch):
+        rows = slice(r0, min(r0 + rows_per_batch, ny))
+        estimate, _, _ = interpolate(sources, values, cell_centres(rows, bbox, cell), **options)
+        grid[rows] = estimate.reshape(-1, nx)
+    grid.flush()
+    del grid
+    os.replace(tmp, path)
+def zonal_mean(grid, tract, cells, weight, n_tracts):
+    values = np.asarray(grid.reshape(-1)[cells], dtype=np.float64)
+    ok = np.isfinite(values)
+    total = np.bincount(tract, weight, minlength=n_tracts)
+    covered = np.bincount(tract, np.where(ok, weight, 0.0), minlength=n_tracts)
+    summed = np.bincount(tract, np.where(ok, weight * values, 0.0), minlength=n_tracts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(covered > 0, summed / covered, np.nan), np.where(total > 0, covered / total, np.nan)
+def load_manifest():
+    if not os.path.exists(Config.MANIFEST_FILE):
+        return {}
+    with open(Config.MANIFEST_FILE) as f:
+        return json.load(f)
+def save_manifest(manifest):
+    tmp = Config.MANIFEST_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, Config.MANIFEST_FILE)
+def population_exposure(tract_ids: np.ndarray, blocks: pd.DataFrame, monitors: pd.DataFrame, options: dict, force=False):
+    os.makedirs(Config.GRID_DIR, exist_ok=True)
+    manifest = load_manifest()
+    tract, cells, weight, tract_pop = zones(blocks, tract_ids)
+    ny, nx = grid_shape()
+    print(f"{len(cells)} populated (tract, cell) pairs on a {ny}x{nx} grid of {Config.CELL_DEG} degree cells")
+    frames = []
+    for year, group in monitors.groupby("year", sort=True):
+        out = pd.DataFrame({"geo_id": tract_ids, "year": int(year), "population": tract_pop})
+        for pollutant in POLLUTANTS:
+            have = group[group[f"{pollutant}_mean"].notna()]
+            sources = to_xyz(have["lon"], have["lat"])
+            values = have[f"{pollutant}_mean"].to_numpy(dtype=np.float64)
+            name = f"{pollutant}_{int(year)}.npy"
+            path = os.path.join(Config.GRID_DIR, name)
+            key = grid_key(sources, values, options)
+            if force or manifest.get(name) != key or not os.path.exists(path):
+                t0 = time.perf_counter()
+                rasterize(path, sources, values, options)
+                manifest[name] = key
+                save_manifest(manifest)
+                print(f"rasterized {len(have)} {pollutant} monitors for {year} into {path} in {time.perf_counter() - t0:.1f}s")
+            grid = np.load(path, mmap_mode="r")
+            out[f"{pollutant}_mean"], out[f"{pollutant}_pop_covered"] = zonal_mean(grid, tract, cells, weight, len(tract_ids))
+            del grid
+        frames.append(out)
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.concat(frames, ignore_index=True)[COLUMNS]
+def run(options: dict, force=False):
+    start = time.perf_counter()
+    if not os.path.exists(Config.BLOCKS_FILE):
+        raise SystemExit(f"{Config.BLOCKS_FILE} not found. Run fetch_blocks.py first.")
+    blocks = pd.read_parquet(Config.BLOCKS_FILE)
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT geo_id FROM tracts ORDER BY geo_id")
+            tract_ids = np.array([r[0] for r in cur.fetchall()], dtype=object)
+            cur.execute(MONITOR_YEARS_SQL)
+            monitors = pd.DataFrame(cur.fetchall(), columns=["monitor_id", "lon", "lat", "year", "pm25_mean", "no2_mean"])
+            for c in ["lon", "lat", "pm25_mean", "no2_mean"]:
+                monitors[c] = pd.to_numeric(monitors[c], errors="coerce")
+            print(f"{len(tract_ids)} tracts, {len(blocks)} blocks, {monitors['monitor_id'].nunique()} monitors")
+            out = population_exposure(tract_ids, blocks, monitors, options, force)
+            cur.execute("TRUNCATE tract_exposure_popweighted")
+            copy_frame(cur, out, "tract_exposure_popweighted", COLUMNS)
+        conn.commit()
+    print(f"tract_exposure_popweighted rebuilt with {len(out)} rows in {time.perf_counter() - start:.1f}s")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="population-weighted tract exposure from rasterized monitor surfaces")
+    parser.add_argument("--neighbours", type=int, default=ExposureConfig.NEIGHBOURS)
+    parser.add_argument("--radius-km", type=float, default=ExposureConfig.RADIUS_KM)
+    parser.add_argument("--method", choices=["idw", "gaussian"], default=ExposureConfig.METHOD)
+    parser.add_argument("--power", type=float, default=ExposureConfig.POWER)
+    parser.add_argument("--range-km", type=float, default=ExposureConfig.RANGE_KM)
+    parser.add_argument("--force", action="store_true", help="re-rasterize grids even if their monitors are unchanged")
+    args = parser.parse_args()
+    options = {
+        "k": args.neighbours,
+        "radius_km": args.radius_km,
+        "method": args.method,
+        "power": args.power,
+        "range_km": args.range_km,
+    }
+    run(options, args.force)
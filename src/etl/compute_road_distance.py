@@ -0,0 +1,155 @@
+import argparse
+import os
+import time
+from typing import List
+import psycopg2
+from dotenv import load_dotenv
+load_dotenv()
+class Config:
+    MTFCC = "S1100"
+    CANDIDATES = 8
+    BATCH_SIZE = 500
+    WATERMARK = "tract_road_distance.max_highway_gid"
+def get_conn():
+    required = ["PGHOST", "PGPORT", "PGDATABASE", "PGUSER", "PGPASSWORD"]
+    missing = [v for v in required if not os.getenv(v)]
+    if missing:
+        raise SystemExit(f"missing env vars: {', '.join(missing)}")
+    return psycopg2.connect(
+        host=os.getenv("PGHOST"),
+        port=os.getenv("PGPORT"),
+        dbname=os.getenv("PGDATABASE"),
+        user=os.getenv("PGUSER"),
+        password=os.getenv("PGPASSWORD"),
+    )
+KNN_SQL = """
+    INSERT INTO tract_road_distance (geo_id, dist_primary_road_meters, nearest_gid, geom_md5, computed_at)
+    SELECT t.geo_id, nr.dist, nr.gid, md5(ST_AsEWKB(t.geom)), now()
+    FROM tracts t
+    LEFT JOIN LATERAL (
+        SELECT c.gid, ST_Distance(t.geom::geography, c.geom::geography) AS dist
+        FROM (
+            SELECT h.gid, h.geom
+            FROM highways h
+            WHERE h.mtfcc = %(mtfcc)s
+            ORDER BY h.geom <-> t.geom
+            LIMIT %(k)s
+        ) c
+        ORDER BY dist
+        LIMIT 1
+    ) nr ON true
+    WHERE t.geo_id = ANY(%(ids)s)
+    ON CONFLICT (geo_id) DO UPDATE
+      SET dist_primary_road_meters = EXCLUDED.dist_primary_road_meters,
+          nearest_gid = EXCLUDED.nearest_gid,
+          geom_md5 = EXCLUDED.geom_md5,
+          computed_at = EXCLUDED.computed_at
+"""
+NEW_HIGHWAYS_SQL = """
+    UPDATE tract_road_distance d
+    SET dist_primary_road_meters = nr.dist,
+        nearest_gid = nr.gid,
+        computed_at = now()
+    FROM tracts t
+    CROSS JOIN LATERAL (
+        SELECT c.gid, ST_Distance(t.geom::geography, c.geom::geography) AS dist
+        FROM (
+            SELECT h.gid, h.geom
+            FROM highways h
+            WHERE h.mtfcc = %(mtfcc)s AND h.gid > %(since)s
+            ORDER BY h.geom <-> t.geom
+            LIMIT %(k)s
+        ) c
+        ORDER BY dist
+        LIMIT 1
+    ) nr
+    WHERE d.geo_id = t.geo_id
+      AND t.geo_id = ANY(%(ids)s)
+      AND (d.dist_primary_road_meters IS NULL OR nr.dist < d.dist_primary_road_meters)
+"""
+def get_watermark(cur, name: str, default=None):
+    cur.execute("SELECT value FROM etl_watermarks WHERE name = %s", (name,))
+    row = cur.fetchone()
+    return row[0] if row else default
+def set_watermark(cur, name: str, value):
+    cur.execute(
+        """
+        INSERT INTO etl_watermarks (name, value, updated_at) VALUES (%s, %s, now())
+        ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value, updated_at = EXCLUDED.updated_at
+        """,
+        (name, str(value)),
+    )
+def stale_tracts(cur, full: bool) -> List[str]:
+    if full:
+        cur.execute("SELECT geo_id FROM tracts ORDER BY geo_id")
+        return [r[0] for r in cur.fetchall()]
+    cur.execute(
+        """
+        SELECT t.geo_id
+        FROM tracts t
+        LEFT JOIN tract_road_distance d ON d.geo_id = t.geo_id
+        WHERE d.geo_id IS NULL
+           OR d.geom_md5 IS DISTINCT FROM md5(ST_AsEWKB(t.geom))
+           OR d.nearest_gid IS NULL
+           OR NOT EXISTS (
+                SELECT 1 FROM highways h
+                WHERE h.gid = d.nearest_gid AND h.mtfcc = %s
+           )
+        ORDER BY t.geo_id
+        """,
+        (Config.MTFCC,),
+    )
+    return [r[0] for r in cur.fetchall()]
+def _batches(ids: List[str], size: int):
+    for i in range(0, len(ids), size):
+        yield ids[i : i + size]
+def recompute(cur, ids: List[str], k: int, batch_size: int):
+    done = 0
+    for batch in _batches(ids, batch_size):
+        t0 = time.perf_counter()
+        cur.execute(KNN_SQL, {"mtfcc": Config.MTFCC, "k": k, "ids": batch})
+        done += len(batch)
+        print(f"    {done}/{len(ids)} tracts ({time.perf_counter() - t0:.2f}s)")
+def apply_new_highways(cur, since: int, skip: set, k: int, batch_size: int) -> int:
+    cur.execute("SELECT geo_id FROM tract_road_distance ORDER BY geo_id")
+    ids = [r[0] for r in cur.fetchall() if r[0] not in skip]
+    updated = 0
+    for batch in _batches(ids, batch_size):
+        cur.execute(
+            NEW_HIGHWAYS_SQL, {"mtfcc": Config.MTFCC, "k": k, "since": since, "ids": batch}
+        )
+        updated += cur.rowcount
+    return updated
+def run(full: bool = False, k: int = Config.CANDIDATES, batch_size: int = Config.BATCH_SIZE):
+    start = time.perf_counter()
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM tract_road_distance d
+                WHERE NOT EXISTS (SELECT 1 FROM tracts t WHERE t.geo_id = d.geo_id)
+                """
+            )
+            cur.execute(
+                "SELECT COALESCE(MAX(gid), 0) FROM highways WHERE mtfcc = %s", (Config.MTFCC,)
+            )
+            max_gid = cur.fetchone()[0]
+            since = int(get_watermark(cur, Config.WATERMARK, 0))
+            if since > max_gid:
+                full = True
+            ids = stale_tracts(cur, full)
+            print(f"recomputing nearest {Config.MTFCC} distance for {len(ids)} tracts")
+            recompute(cur, ids, k, batch_size)
+            if not full and max_gid > since:
+                updated = apply_new_highways(cur, since, set(ids), k, batch_size)
+                print(f"{updated} tracts moved closer to highways added after gid {since}")
+            set_watermark(cur, Config.WATERMARK, max_gid)
+        conn.commit()
+    print(f"tract_road_distance refreshed in {time.perf_counter() - start:.1f}s")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="precompute tract to primary road distances")
+    parser.add_argument("--full", action="store_true", help="recompute every tract")
+    parser.add_argument("--candidates", type=int, default=Config.CANDIDATES)
+    parser.add_argument("--batch-size", type=int, default=Config.BATCH_SIZE)
+    args = parser.parse_args()
+    run(full=args.full, k=args.candidates, batch_size=args.batch_size)
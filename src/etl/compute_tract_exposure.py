@@ -0,0 +1,181 @@
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+import psycopg2
+from dotenv import load_dotenv
+from pgload import copy_frame
+from scipy import sparse
+from scipy.spatial import cKDTree
+load_dotenv()
+class Config:
+    NEIGHBOURS = 8
+    RADIUS_KM = 50.0
+    METHOD = "idw"
+    POWER = 2.0
+    RANGE_KM = 20.0
+    BATCH_SIZE = 20_000
+EARTH_RADIUS_KM = 6371.0088
+POLLUTANTS = ["pm25", "no2"]
+COLUMNS = [
+    "geo_id",
+    "year",
+    "pm25_mean",
+    "no2_mean",
+    "pm25_monitors",
+    "no2_monitors",
+    "pm25_nearest_km",
+    "no2_nearest_km",
+    "method",
+]
+TRACTS_SQL = """
+    SELECT geo_id, ST_X(ST_PointOnSurface(geom)) AS lon, ST_Y(ST_PointOnSurface(geom)) AS lat
+    FROM tracts
+    WHERE geom IS NOT NULL
+    ORDER BY geo_id
+"""
+MONITOR_YEARS_SQL = """
+    SELECT y.monitor_id, ST_X(m.geom) AS lon, ST_Y(m.geom) AS lat, y.year, y.pm25_mean, y.no2_mean
+    FROM monitor_year_means y
+    JOIN pollution_monitors m ON m.monitor_id = y.monitor_id
+    WHERE m.geom IS NOT NULL
+"""
+def get_conn():
+    required = ["PGHOST", "PGPORT", "PGDATABASE", "PGUSER", "PGPASSWORD"]
+    missing = [v for v in required if not os.getenv(v)]
+    if missing:
+        raise SystemExit(f"missing env vars: {', '.join(missing)}")
+    return psycopg2.connect(
+        host=os.getenv("PGHOST"),
+        port=os.getenv("PGPORT"),
+        dbname=os.getenv("PGDATABASE"),
+        user=os.getenv("PGUSER"),
+        password=os.getenv("PGPASSWORD"),
+    )
+def to_xyz(lon, lat) -> np.ndarray:
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    return EARTH_RADIUS_KM * np.column_stack(
+        [np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)]
+    )
+def chord_to_km(chord: np.ndarray) -> np.ndarray:
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / (2 * EARTH_RADIUS_KM), 1.0))
+def km_to_chord(km: float) -> float:
+    return 2 * EARTH_RADIUS_KM * np.sin(min(km / (2 * EARTH_RADIUS_KM), np.pi / 2))
+def weights(km: np.ndarray, method: str, power: float, range_km: float) -> np.ndarray:
+    if method == "idw":
+        return 1.0 / np.maximum(km, 1e-3) ** power
+    if method == "gaussian":
+        return np.exp(-((km / range_km) ** 2))
+    raise ValueError(f"unknown method {method!r}, expected idw or gaussian")
+def _neighbours(tree, targets, k, bound, method, power, range_km):
+    chord, idx = tree.query(targets, k=k, distance_upper_bound=bound)
+    chord = chord.reshape(len(chord), k)
+    idx = idx.reshape(len(idx), k)
+    found = np.isfinite(chord)
+    km = chord_to_km(np.where(found, chord, 0.0))
+    w = np.where(found, weights(km, method, power, range_km), 0.0)
+    return np.minimum(idx, tree.n - 1), w, km, found
+def interpolate(
+    sources: np.ndarray,
+    values: np.ndarray,
+    targets: np.ndarray,
+    k: int = Config.NEIGHBOURS,
+    radius_km: float = Config.RADIUS_KM,
+    method: str = Config.METHOD,
+    power: float = Config.POWER,
+    range_km: float = Config.RANGE_KM,
+    batch_size: int = Config.BATCH_SIZE,
+):
+    n = len(targets)
+    estimate = np.full(n, np.nan)
+    used = np.zeros(n, dtype=np.int16)
+    nearest = np.full(n, np.nan)
+    if len(sources) == 0:
+        return estimate, used, nearest
+    tree = cKDTree(sources)
+    k = min(k, len(sources))
+    bound = km_to_chord(radius_km)
+    for start in range(0, n, batch_size):
+        idx, w, km, found = _neighbours(tree, targets[start : start + batch_size], k, bound, method, power, range_km)
+        total = w.sum(axis=1)
+        batch = slice(start, start + len(idx))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            estimate[batch] = np.where(total > 0, (w * values[idx]).sum(axis=1) / total, np.nan)
+        used[batch] = found.sum(axis=1)
+        nearest[batch] = np.where(found[:, 0], km[:, 0], np.nan)
+    return estimate, used, nearest
+def weight_matrix(
+    sources: np.ndarray,
+    targets: np.ndarray,
+    k: int = Config.NEIGHBOURS,
+    radius_km: float = Config.RADIUS_KM,
+    method: str = Config.METHOD,
+    power: float = Config.POWER,
+    range_km: float = Config.RANGE_KM,
+    batch_size: int = Config.BATCH_SIZE,
+) -> sparse.csr_matrix:
+    shape = (len(targets), len(sources))
+    if len(sources) == 0:
+        return sparse.csr_matrix(shape)
+    tree = cKDTree(sources)
+    k = min(k, len(sources))
+    bound = km_to_chord(radius_km)
+    rows, cols, vals = [], [], []
+    for start in range(0, len(targets), batch_size):
+        idx, w, _, found = _neighbours(tree, targets[start : start + batch_size], k, bound, method, power, range_km)
+        r, c = np.nonzero(found)
+        rows.append(r + start)
+        cols.append(idx[r, c])
+        vals.append(w[r, c])
+    return sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))), shape=shape)
+def tract_exposure(tracts: pd.DataFrame, monitors: pd.DataFrame, **options) -> pd.DataFrame:
+    targets = to_xyz(tracts["lon"], tracts["lat"])
+    frames = []
+    for year, group in monitors.groupby("year", sort=True):
+        out = pd.DataFrame({"geo_id": tracts["geo_id"].to_numpy(), "year": int(year)})
+        for pollutant in POLLUTANTS:
+            have = group[group[f"{pollutant}_mean"].notna()]
+            estimate, used, nearest = interpolate(
+                to_xyz(have["lon"], have["lat"]), have[f"{pollutant}_mean"].to_numpy(dtype=np.float64), targets, **options
+            )
+            out[f"{pollutant}_mean"] = estimate
+            out[f"{pollutant}_monitors"] = used
+            out[f"{pollutant}_nearest_km"] = nearest
+        frames.append(out)
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS)
+    out = pd.concat(frames, ignore_index=True)
+    out["method"] = options.get("method", Config.METHOD)
+    return out[COLUMNS]
+def run(**options):
+    start = time.perf_counter()
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute(TRACTS_SQL)
+            tracts = pd.DataFrame(cur.fetchall(), columns=["geo_id", "lon", "lat"])
+            cur.execute(MONITOR_YEARS_SQL)
+            monitors = pd.DataFrame(cur.fetchall(), columns=["monitor_id", "lon", "lat", "year", "pm25_mean", "no2_mean"])
+            for c in ["lon", "lat", "pm25_mean", "no2_mean"]:
+                monitors[c] = pd.to_numeric(monitors[c], errors="coerce")
+            print(f"{len(tracts)} tracts, {monitors['monitor_id'].nunique()} monitors over {monitors['year'].nunique()} years")
+            t0 = time.perf_counter()
+            out = tract_exposure(tracts, monitors, **options)
+            print(f"interpolated {len(out)} tract-years in {time.perf_counter() - t0:.2f}s")
+            for pollutant in POLLUTANTS:
+                covered = out[f"{pollutant}_mean"].notna().mean() if len(out) else 0.0
+                print(f"  {pollutant}: {covered:.1%} of tract-years have a monitor within range")
+            cur.execute("TRUNCATE tract_exposure")
+            copy_frame(cur, out, "tract_exposure", COLUMNS)
+        conn.commit()
+    print(f"tract_exposure rebuilt in {time.perf_counter() - start:.1f}s")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="interpolate yearly monitor means to every tract centroid")
+    parser.add_argument("--neighbours", type=int, default=Config.NEIGHBOURS, help="nearest monitors per tract")
+    parser.add_argument("--radius-km", type=float, default=Config.RADIUS_KM, help="ignore monitors further than this")
+    parser.add_argument("--method", choices=["idw", "gaussian"], default=Config.METHOD)
+    parser.add_argument("--power", type=float, default=Config.POWER, help="idw distance exponent")
+    parser.add_argument("--range-km", type=float, default=Config.RANGE_KM, help="gaussian kernel range")
+    args = parser.parse_args()
+    run(k=args.neighbours, radius_km=args.radius_km, method=args.method, power=args.power, range_km=args.range_km)
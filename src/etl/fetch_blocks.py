@@ -0,0 +1,49 @@
+import io
+import os
+import zipfile
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import requests
+class Config:
+    STATES = {
+        "NY": "36",
+        "NJ": "34",
+        "CT": "09",
+    }
+    BASE_URL = "https://www2.census.gov/geo/tiger/TIGER2020/TABBLOCK20"
+    OUTPUT_DIR = "data/raw/blocks"
+    OUTPUT_FILE = "data/processed/block_population.parquet"
+def download_state(state: str, fips: str) -> str:
+    fname = f"tl_2020_{fips}_tabblock20.zip"
+    path = os.path.join(Config.OUTPUT_DIR, fname.replace(".zip", ".dbf"))
+    if os.path.exists(path):
+        print(f"blocks for {state} already in {Config.OUTPUT_DIR}")
+        return path
+    url = f"{Config.BASE_URL}/{fname}"
+    print(f"downloading blocks for {state} ({fips}) from {url}")
+    resp = requests.get(url, stream=True)
+    resp.raise_for_status()
+    os.makedirs(Config.OUTPUT_DIR, exist_ok=True)
+    with zipfile.ZipFile(io.BytesIO(resp.content)) as z:
+        z.extractall(Config.OUTPUT_DIR)
+    print(f"extracted to {Config.OUTPUT_DIR}")
+    return path
+def block_points(path: str) -> pd.DataFrame:
+    df = gpd.read_file(path, ignore_geometry=True, columns=["GEOID20", "POP20", "INTPTLON20", "INTPTLAT20"])
+    return pd.DataFrame(
+        {
+            "geo_id": df["GEOID20"].str[:11].values,
+            "lon": pd.to_numeric(df["INTPTLON20"], errors="coerce").values,
+            "lat": pd.to_numeric(df["INTPTLAT20"], errors="coerce").values,
+            "population": pd.to_numeric(df["POP20"], errors="coerce").fillna(0).astype(np.int32).values,
+        }
+    )
+def run():
+    frames = [block_points(download_state(st, fips)) for st, fips in Config.STATES.items()]
+    df = pd.concat(frames, ignore_index=True).dropna(subset=["lon", "lat"])
+    os.makedirs(os.path.dirname(Config.OUTPUT_FILE), exist_ok=True)
+    df.to_parquet(Config.OUTPUT_FILE, index=False)
+    print(f"wrote {len(df)} blocks ({df['population'].sum()} people) to {Config.OUTPUT_FILE}")
+if __name__ == "__main__":
+    run()
@@ -1,13 +1,25 @@
+import argparse
+import json
 import os
+import random
+import shutil
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Optional
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 load_dotenv()
 class Config:
     API_URL = "https://api.openaq.org/v2/measurements"
     OUTPUT_DIR = "data/raw/openaq"
+    CHECKPOINT_DIR = os.path.join(OUTPUT_DIR, "_partial")
     QUERY_MODE = "coordinates"
     CITY_REGION = "New York-Northern New Jersey-Long Island"
     COORDINATES = "40.7128,-74.0060"
@@ -18,6 +30,86 @@ class Config:
         start="2024-06-01", end=pd.Timestamp.now().normalize(), freq="MS"
     )
     LIMIT = 10000
+    WORKERS = 4
+    RATE_PER_SEC = 2.0
+    BURST = 4
+    MAX_RETRIES = 6
+    BACKOFF_BASE = 1.0
+    BACKOFF_MAX = 120.0
+    TIMEOUT = 60
+SCHEMA = pa.schema(
+    [
+        ("locationId", pa.int64()),
+        ("location", pa.string()),
+        ("parameter", pa.string()),
+        ("value", pa.float64()),
+        ("unit", pa.string()),
+        ("timestamp_utc", pa.timestamp("us", tz="UTC")),
+        ("timestamp_local", pa.string()),
+        ("latitude", pa.float64()),
+        ("longitude", pa.float64()),
+        ("country", pa.string()),
+        ("city", pa.string()),
+        ("isMobile", pa.bool_()),
+        ("isAnalysis", pa.bool_()),
+        ("entity", pa.string()),
+        ("sensorType", pa.string()),
+    ]
+)
+FLAT_COLUMNS = {
+    "date.utc": "timestamp_utc",
+    "date.local": "timestamp_local",
+    "coordinates.latitude": "latitude",
+    "coordinates.longitude": "longitude",
+}
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+_limiter = TokenBucket(Config.RATE_PER_SEC, Config.BURST)
+_session = None
+_session_lock = threading.Lock()
+def configure(workers=None, rate=None, burst=None, api_url=None):
+    global _limiter, _session
+    if workers is not None:
+        Config.WORKERS = workers
+    if rate is not None:
+        Config.RATE_PER_SEC = rate
+    if burst is not None:
+        Config.BURST = burst
+    if api_url is not None:
+        Config.API_URL = api_url
+    _limiter = TokenBucket(Config.RATE_PER_SEC, Config.BURST)
+    _session = None
+def get_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, Config.WORKERS))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            api_key = os.getenv("OPENAQ_API_KEY")
+            if api_key:
+                session.headers["X-API-Key"] = api_key
+            _session = session
+        return _session
 def get_api_params(parameter, date_from, date_to, page=1):
     params = {
         "parameter": parameter,
@@ -36,88 +128,165 @@ def get_api_params(parameter, date_from, date_to, page=1):
     else:
         params["city"] = Config.CITY_REGION
     return params
-def process_and_save_data(records, filepath):
-    if not records:
-        return
-    df = pd.DataFrame(records)
-    if "date" in df.columns:
-        df["timestamp_utc"] = df["date"].apply(
-            lambda x: x.get("utc") if isinstance(x, dict) else None
-        )
-        df["timestamp_local"] = df["date"].apply(
-            lambda x: x.get("local") if isinstance(x, dict) else None
-        )
-    if "coordinates" in df.columns:
-        df["latitude"] = df["coordinates"].apply(
-            lambda x: x.get("latitude") if isinstance(x, dict) else None
-        )
-        df["longitude"] = df["coordinates"].apply(
-            lambda x: x.get("longitude") if isinstance(x, dict) else None
-        )
-    cols_to_drop = ["date", "coordinates"]
-    df = df.drop(columns=[c for c in cols_to_drop if c in df.columns])
+def flatten_page(results) -> pa.Table:
+    df = pd.json_normalize(results).rename(columns=FLAT_COLUMNS)
+    df = df.reindex(columns=SCHEMA.names)
+    df["timestamp_utc"] = pd.to_datetime(df["timestamp_utc"], errors="coerce", utc=True)
+    for name in ["locationId", "value", "latitude", "longitude"]:
+        df[name] = pd.to_numeric(df[name], errors="coerce")
+    return pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False)
+def write_month(ckpt_dir, filepath) -> int:
+    parts = sorted(n for n in os.listdir(ckpt_dir) if n.startswith("page_") and n.endswith(".parquet"))
+    if not parts:
+        return 0
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    df.to_csv(filepath, index=False)
-    print(f"    Saved {len(df)} records to {filepath}")
-def fetch_page(params):
-    api_key = os.getenv("OPENAQ_API_KEY")
-    headers = {"X-API-Key": api_key} if api_key else {}
+    tmp = filepath + ".tmp"
+    rows = 0
+    with pq.ParquetWriter(tmp, SCHEMA) as writer:
+        for name in parts:
+            table = pq.read_table(os.path.join(ckpt_dir, name), schema=SCHEMA)
+            writer.write_table(table)
+            rows += table.num_rows
+    os.replace(tmp, filepath)
+    print(f"    Saved {rows} records to {filepath}")
+    return rows
+def _retry_after(response) -> Optional[float]:
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
     try:
-        response = requests.get(Config.API_URL, params=params, headers=headers)
-        if response.status_code == 429:
-            print("rate limit hit, sleeping for 60 seconds")
-            time.sleep(60)
-            return fetch_page(params)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"error fetching data: {e}")
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
         return None
+    return max(0.0, (when - datetime.now(tz=when.tzinfo)).total_seconds())
+def _backoff(attempt: int, response=None) -> float:
+    delay = _retry_after(response)
+    if delay is not None:
+        return delay
+    return min(Config.BACKOFF_BASE * (2 ** attempt) * (1 + random.random()), Config.BACKOFF_MAX)
+def fetch_page(params):
+    session = get_session()
+    for attempt in range(Config.MAX_RETRIES + 1):
+        _limiter.acquire()
+        response = None
+        try:
+            response = session.get(Config.API_URL, params=params, timeout=Config.TIMEOUT)
+            if response.status_code == 429 or response.status_code >= 500:
+                raise requests.exceptions.HTTPError(
+                    f"{response.status_code} from {Config.API_URL}", response=response
+                )
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            status = response.status_code if response is not None else None
+            retryable = status is None or status == 429 or status >= 500
+            if not retryable or attempt == Config.MAX_RETRIES:
+                print(f"error fetching data: {e}")
+                return None
+            delay = _backoff(attempt, response)
+            print(f"    {e}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+    return None
+def _checkpoint_dir(parameter, year, month):
+    return os.path.join(Config.CHECKPOINT_DIR, f"{parameter}_{year}_{month:02d}")
+def _read_checkpoint(ckpt_dir):
+    path = os.path.join(ckpt_dir, "state.json")
+    if not os.path.exists(path):
+        return {"next_page": 1, "fetched": 0}
+    with open(path) as f:
+        return json.load(f)
+def _write_checkpoint(ckpt_dir, state):
+    tmp = os.path.join(ckpt_dir, "state.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, os.path.join(ckpt_dir, "state.json"))
+def _save_page(ckpt_dir, page, results):
+    tmp = os.path.join(ckpt_dir, f"page_{page:05d}.parquet.tmp")
+    pq.write_table(flatten_page(results), tmp)
+    os.replace(tmp, os.path.join(ckpt_dir, f"page_{page:05d}.parquet"))
 def fetch_data_for_interval(start_date, end_date, parameter):
     date_from_str = start_date.strftime("%Y-%m-%dT%H:%M:%S+00:00")
     date_to_str = end_date.strftime("%Y-%m-%dT%H:%M:%S+00:00")
     year = start_date.year
     month = start_date.month
+    label = f"{start_date.strftime('%Y-%m')} {parameter}"
     output_file = os.path.join(
-        Config.OUTPUT_DIR, str(year), parameter, f"{parameter}_{year}_{month:02d}.csv"
+        Config.OUTPUT_DIR, str(year), parameter, f"{parameter}_{year}_{month:02d}.parquet"
     )
     if os.path.exists(output_file):
         print(f"skipping {output_file}, already exists")
-        return
-    print(f"starting to fetching {start_date.strftime('%Y-%m')} for {parameter}")
-    all_records = []
-    page = 1
-    while True:
+        return 0
+    ckpt_dir = _checkpoint_dir(parameter, year, month)
+    os.makedirs(ckpt_dir, exist_ok=True)
+    state = _read_checkpoint(ckpt_dir)
+    if state.get("done"):
+        page = None
+    else:
+        page = state["next_page"]
+        if page > 1:
+            print(f"resuming {label} at page {page}")
+        else:
+            print(f"starting to fetching {label}")
+    while page is not None:
         params = get_api_params(parameter, date_from_str, date_to_str, page)
         data = fetch_page(params)
         if not data or "results" not in data:
-            break
+            print(f"stopping {label} at page {page}, rerun to resume")
+            return 0
         results = data["results"]
-        if not results:
-            break
-        all_records.extend(results)
-        print(f"    Page {page}: Retrieved {len(results)} records")
-        meta = data.get("meta", {})
-        found = meta.get("found", 0)
-        if len(all_records) >= found or len(results) < Config.LIMIT:
-            break
-        page += 1
-        time.sleep(0.5)
-    if all_records:
-        process_and_save_data(all_records, output_file)
-    else:
-        print(f"no data found for {start_date.strftime('%Y-%m')}")
-def run_collection():
-    if not os.path.exists(Config.OUTPUT_DIR):
-        os.makedirs(Config.OUTPUT_DIR)
+        if results:
+            _save_page(ckpt_dir, page, results)
+        fetched = state["fetched"] + len(results)
+        found = data.get("meta", {}).get("found", 0)
+        print(f"    {label} page {page}: Retrieved {len(results)} records")
+        done = not results or fetched >= found or len(results) < Config.LIMIT
+        state = {"next_page": page + 1, "fetched": fetched, "done": done}
+        _write_checkpoint(ckpt_dir, state)
+        page = None if done else page + 1
+    rows = write_month(ckpt_dir, output_file)
+    if not rows:
+        print(f"no data found for {label}")
+    shutil.rmtree(ckpt_dir, ignore_errors=True)
+    return rows
+def _intervals():
     for start_date in Config.DATE_RANGE:
         next_month = start_date + pd.DateOffset(months=1)
         end_date = next_month - pd.Timedelta(seconds=1)
         if start_date > pd.Timestamp.now():
             break
         for param in Config.PARAMETERS:
-            fetch_data_for_interval(start_date, end_date, param)
+            yield start_date, end_date, param
+def run_collection():
+    if not os.path.exists(Config.OUTPUT_DIR):
+        os.makedirs(Config.OUTPUT_DIR)
+    start = time.perf_counter()
+    total = 0
+    with ThreadPoolExecutor(max_workers=Config.WORKERS) as pool:
+        futures = {
+            pool.submit(fetch_data_for_interval, s, e, p): (s, p) for s, e, p in _intervals()
+        }
+        for fut in as_completed(futures):
+            s, p = futures[fut]
+            try:
+                total += fut.result()
+            except Exception as e:
+                print(f"failed {s.strftime('%Y-%m')} {p}: {e}")
+    elapsed = time.perf_counter() - start
+    print(
+        f"fetched {total} records in {elapsed:.1f}s "
+        f"({total / elapsed if elapsed > 0 else 0:,.0f} records/s)"
+    )
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="fetch OpenAQ measurements month by month")
+    parser.add_argument("--workers", type=int, default=Config.WORKERS)
+    parser.add_argument("--rate", type=float, default=Config.RATE_PER_SEC, help="requests per second")
+    parser.add_argument("--burst", type=int, default=Config.BURST)
+    args = parser.parse_args()
+    configure(workers=args.workers, rate=args.rate, burst=args.burst)
     if not os.getenv("OPENAQ_API_KEY"):
         print(
             "WARNING: OPENAQ_API_KEY not found in environment so requests might be rate limited check lines 140ish."
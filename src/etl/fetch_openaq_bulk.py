@@ -1,10 +1,17 @@
+import argparse
+import io
 import os
 import tempfile
-from typing import Iterable, List, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional
 import pandas as pd
 import pyarrow as pa
 import pyarrow.parquet as pq
 import requests
+from requests.adapters import HTTPAdapter
+from openaq_filter import OUTPUT_SCHEMA, alias_columns, filter_batch, resolve_columns
 class Config:
     BULK_URLS: List[str] = []
     OUTPUT_DIR = "data/raw/openaq_bulk_filtered"
@@ -20,13 +27,85 @@ class Config:
     START_DATE = "2019-01-01"
     END_DATE = "2024-12-31"
     BATCH_SIZE = 50_000
-def _first_present(df: pd.DataFrame, candidates: Iterable[str]) -> Optional[str]:
-    for c in candidates:
-        if c in df.columns:
-            return c
-    return None
+    MODE = "range"
+    WORKERS = 4
+    TIMEOUT = 60
+_session = None
+_session_lock = threading.Lock()
+def get_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(4, Config.WORKERS * 2))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+class HttpRangeFile(io.RawIOBase):
+    def __init__(self, url: str):
+        self.url = url
+        self.session = get_session()
+        self.pos = 0
+        self.bytes_read = 0
+        self.requests = 0
+        resp = self.session.head(url, allow_redirects=True, timeout=Config.TIMEOUT)
+        resp.raise_for_status()
+        self.size = int(resp.headers.get("Content-Length", -1))
+        self.supports_range = resp.headers.get("Accept-Ranges", "").lower() == "bytes" and self.size >= 0
+    def readable(self):
+        return True
+    def seekable(self):
+        return True
+    def tell(self):
+        return self.pos
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.pos = offset
+        elif whence == io.SEEK_CUR:
+            self.pos += offset
+        else:
+            self.pos = self.size + offset
+        return self.pos
+    def read(self, n=-1):
+        end = self.size if n is None or n < 0 else min(self.size, self.pos + n)
+        if end <= self.pos:
+            return b""
+        resp = self.session.get(
+            self.url,
+            headers={"Range": f"bytes={self.pos}-{end - 1}"},
+            timeout=Config.TIMEOUT,
+        )
+        resp.raise_for_status()
+        if resp.status_code != 206:
+            raise IOError(f"{self.url} ignored the Range header (status {resp.status_code})")
+        data = resp.content
+        self.pos += len(data)
+        self.bytes_read += len(data)
+        self.requests += 1
+        return data
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[: len(data)] = data
+        return len(data)
+class FilteredWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self.writer = None
+        self.rows = 0
+        self.lock = threading.Lock()
+    def write(self, batch: pa.RecordBatch):
+        with self.lock:
+            if self.writer is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.writer = pq.ParquetWriter(self.path, OUTPUT_SCHEMA)
+            self.writer.write_batch(batch)
+            self.rows += batch.num_rows
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
 def _download_to_temp(url: str) -> str:
-    resp = requests.get(url, stream=True)
+    resp = get_session().get(url, stream=True, timeout=Config.TIMEOUT)
     resp.raise_for_status()
     fd, tmp_path = tempfile.mkstemp(suffix=os.path.splitext(url)[1] or ".parquet")
     with os.fdopen(fd, "wb") as f:
@@ -34,90 +113,123 @@ def _download_to_temp(url: str) -> str:
             if chunk:
                 f.write(chunk)
     return tmp_path
-def _filter_batch(df: pd.DataFrame) -> pd.DataFrame:
-    param_col = _first_present(df, ["parameter", "pollutant"])
-    country_col = _first_present(df, ["country"])
-    lat_col = _first_present(df, ["latitude", "coordinates.latitude", "lat"])
-    lon_col = _first_present(df, ["longitude", "coordinates.longitude", "lon", "lng"])
-    ts_col = _first_present(
-        df, ["date_utc", "utc", "timestamp", "datetime", "date.utc"]
-    )
-    if param_col is None or lat_col is None or lon_col is None or ts_col is None:
-        return pd.DataFrame()
-    df = df.copy()
-    df[param_col] = df[param_col].astype(str).str.lower()
-    df = df[df[param_col].isin(Config.POLLUTANTS)]
-    if country_col:
-        df = df[df[country_col].astype(str).str.upper() == Config.COUNTRY]
-    if df.empty:
-        return df
-    df[ts_col] = pd.to_datetime(df[ts_col], errors="coerce", utc=True)
-    start = pd.to_datetime(Config.START_DATE, utc=True)
-    end = (
-        pd.to_datetime(Config.END_DATE, utc=True)
-        + pd.Timedelta(days=1)
-        - pd.Timedelta(seconds=1)
-    )
-    df = df[(df[ts_col] >= start) & (df[ts_col] <= end)]
-    df[lat_col] = pd.to_numeric(df[lat_col], errors="coerce")
-    df[lon_col] = pd.to_numeric(df[lon_col], errors="coerce")
+def _as_utc(value) -> Optional[pd.Timestamp]:
+    try:
+        ts = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        return None
+    if ts is pd.NaT:
+        return None
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+def _as_text(value) -> str:
+    return value.decode("utf-8", "replace") if isinstance(value, bytes) else str(value)
+def _overlaps_text(lo, hi, wanted) -> bool:
+    lo, hi = _as_text(lo), _as_text(hi)
+    return any(lo <= v <= hi for w in wanted for v in (w.lower(), w.upper()))
+def row_group_matches(rg: pq.RowGroupMetaData, cols) -> bool:
+    stats = {}
+    for j in range(rg.num_columns):
+        chunk = rg.column(j)
+        if chunk.statistics is not None and chunk.statistics.has_min_max:
+            stats[chunk.path_in_schema] = (chunk.statistics.min, chunk.statistics.max)
     bbox = Config.BBOX
-    df = df[
-        (df[lat_col] >= bbox["lat_min"])
-        & (df[lat_col] <= bbox["lat_max"])
-        & (df[lon_col] >= bbox["lon_min"])
-        & (df[lon_col] <= bbox["lon_max"])
-    ]
-    if df.empty:
-        return df
-    output_cols = {
-        "parameter": param_col,
-        "value": _first_present(df, ["value"]),
-        "unit": _first_present(df, ["unit"]),
-        "country": country_col,
-        "latitude": lat_col,
-        "longitude": lon_col,
-        "timestamp_utc": ts_col,
-        "location": _first_present(df, ["location"]),
-        "city": _first_present(df, ["city"]),
-        "sourceName": _first_present(df, ["sourceName", "source"]),
-    }
-    selected = {k: df[v] for k, v in output_cols.items() if v}
-    return pd.DataFrame(selected)
-def process_parquet_file(
-    path: str, writer: Optional[pq.ParquetWriter]
-) -> pq.ParquetWriter:
-    pf = pq.ParquetFile(path)
-    for batch in pf.iter_batches(batch_size=Config.BATCH_SIZE):
-        df = batch.to_pandas()
-        filtered = _filter_batch(df)
-        if filtered.empty:
-            continue
-        table = pa.Table.from_pandas(filtered, preserve_index=False)
-        if writer is None:
-            os.makedirs(Config.OUTPUT_DIR, exist_ok=True)
-            writer = pq.ParquetWriter(Config.OUTPUT_FILE, table.schema)
-        writer.write_table(table)
-    return writer
-def run():
+    for key, lo_bound, hi_bound in (
+        ("latitude", bbox["lat_min"], bbox["lat_max"]),
+        ("longitude", bbox["lon_min"], bbox["lon_max"]),
+    ):
+        lo, hi = stats.get(cols[key], (None, None))
+        if isinstance(lo, (int, float)) and isinstance(hi, (int, float)):
+            if hi < lo_bound or lo > hi_bound:
+                return False
+    lo, hi = stats.get(cols["timestamp_utc"], (None, None))
+    lo, hi = _as_utc(lo), _as_utc(hi)
+    if lo is not None and hi is not None:
+        start = pd.Timestamp(Config.START_DATE, tz="UTC") - pd.Timedelta(days=1)
+        end = pd.Timestamp(Config.END_DATE, tz="UTC") + pd.Timedelta(days=2)
+        if hi < start or lo > end:
+            return False
+    if cols["parameter"] in stats:
+        if not _overlaps_text(*stats[cols["parameter"]], Config.POLLUTANTS):
+            return False
+    if "country" in cols and cols["country"] in stats:
+        if not _overlaps_text(*stats[cols["country"]], [Config.COUNTRY]):
+            return False
+    return True
+def filter_parquet(pf: pq.ParquetFile, sink: FilteredWriter, label: str):
+    cols = resolve_columns(tuple(pf.schema_arrow.names))
+    if cols is None:
+        print(f"{label}: missing required columns, skipping")
+        return 0, 0
+    meta = pf.metadata
+    groups = [i for i in range(meta.num_row_groups) if row_group_matches(meta.row_group(i), cols)]
+    if groups:
+        wanted = alias_columns()
+        columns = [c for c in pf.schema_arrow.names if c in wanted]
+        for batch in pf.iter_batches(batch_size=Config.BATCH_SIZE, row_groups=groups, columns=columns):
+            filtered = filter_batch(batch, Config)
+            if filtered is not None:
+                sink.write(filtered)
+    return len(groups), meta.num_row_groups
+def process_parquet_file(path: str, sink: FilteredWriter, label: Optional[str] = None):
+    return filter_parquet(pq.ParquetFile(path), sink, label or path)
+def process_download(url: str, sink: FilteredWriter) -> int:
+    print(f"downloading bulk file: {url}")
+    tmp_path = _download_to_temp(url)
+    try:
+        kept, total = process_parquet_file(tmp_path, sink, url)
+        print(f"{url}: {kept}/{total} row groups matched, {os.path.getsize(tmp_path) / 1e6:.1f}MB downloaded")
+        return os.path.getsize(tmp_path)
+    finally:
+        os.remove(tmp_path)
+def process_remote(url: str, sink: FilteredWriter) -> int:
+    remote = HttpRangeFile(url)
+    if not remote.supports_range:
+        print(f"{url} does not support range requests, downloading instead")
+        return process_download(url, sink)
+    pf = pq.ParquetFile(pa.PythonFile(remote, mode="r"), pre_buffer=True)
+    kept, total = filter_parquet(pf, sink, url)
+    print(
+        f"{url}: {kept}/{total} row groups matched, "
+        f"{remote.bytes_read / 1e6:.1f} of {remote.size / 1e6:.1f}MB fetched in {remote.requests} requests"
+    )
+    return remote.bytes_read
+def run(mode: str = Config.MODE, workers: int = Config.WORKERS):
     if not Config.BULK_URLS:
         print("Config.BULK_URLS is empty. Add bulk parquet URLs and rerun.")
         return
-    writer = None
+    start = time.perf_counter()
+    sink = FilteredWriter(Config.OUTPUT_FILE)
+    process = process_remote if mode == "range" else process_download
+    fetched = 0
     try:
-        for url in Config.BULK_URLS:
-            print(f"Downloading bulk file: {url}")
-            tmp_path = _download_to_temp(url)
-            try:
-                writer = process_parquet_file(tmp_path, writer)
-            finally:
-                os.remove(tmp_path)
+        if mode == "range" and workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(process, url, sink): url for url in Config.BULK_URLS}
+                for fut in as_completed(futures):
+                    fetched += fut.result()
+        else:
+            for url in Config.BULK_URLS:
+                fetched += process(url, sink)
     finally:
-        if writer is not None:
-            writer.close()
-    if writer is None:
+        sink.close()
+    elapsed = time.perf_counter() - start
+    print(f"{len(Config.BULK_URLS)} files, {fetched / 1e6:.1f}MB transferred in {elapsed:.1f}s")
+    if sink.writer is None:
         print("No data matched filters; no parquet written.")
     else:
-        print(f"Wrote filtered data to {Config.OUTPUT_FILE}")
+        print(f"Wrote {sink.rows} filtered rows to {Config.OUTPUT_FILE}")
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="filter remote OpenAQ bulk parquet files to the study area")
+    parser.add_argument(
+        "--mode",
+        choices=["range", "download"],
+        default=Config.MODE,
+        help="range reads only matching row groups, download fetches whole files first",
+    )
+    parser.add_argument("--workers", type=int, default=Config.WORKERS)
+    parser.add_argument("urls", nargs="*", help="overrides Config.BULK_URLS")
+    args = parser.parse_args()
+    if args.urls:
+        Config.BULK_URLS = args.urls
+    Config.WORKERS = args.workers
+    run(args.mode, args.workers)
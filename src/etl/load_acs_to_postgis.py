@@ -1,8 +1,9 @@
 import os
+import numpy as np
 import pandas as pd
 import psycopg2
-import psycopg2.extras
 from dotenv import load_dotenv
+from pgload import copy_frame, create_stage
 load_dotenv()
 CSV_PATH = "data/raw/acs/acs_2022.csv"
 def get_conn():
@@ -21,35 +22,41 @@ def run():
     if not os.path.exists(CSV_PATH):
         raise SystemExit(f"missing ACS file: {CSV_PATH}")
     df = pd.read_csv(CSV_PATH, dtype={"geo_id": str})
-    records = []
-    for _, row in df.iterrows():
-        try:
-            pop = int(row["population"])
-        except Exception:
-            pop = None
-        try:
-            pov_total = float(row["poverty_total"])
-            pov_below = float(row["poverty_below"])
-            pov_rate = pov_below / pov_total if pov_total > 0 else None
-        except Exception:
-            pov_rate = None
-        records.append((row["geo_id"].zfill(11), pop, pov_rate))
-    sql = """
-        UPDATE tracts
-        SET population = data.population,
-            poverty_rate = data.poverty_rate
-        FROM (VALUES %s) AS data(geo_id, population, poverty_rate)
-        WHERE tracts.geo_id = data.geo_id;
-        UPDATE tracts
-        SET population_density = CASE
-            WHEN population IS NOT NULL AND ST_Area(geom::geography) > 0
-            THEN population / (ST_Area(geom::geography) / 1000000.0)
-            ELSE NULL
-        END;
-    """
+    pop = pd.to_numeric(df["population"], errors="coerce").to_numpy(dtype=float)
+    pov_total = pd.to_numeric(df["poverty_total"], errors="coerce").to_numpy(dtype=float)
+    pov_below = pd.to_numeric(df["poverty_below"], errors="coerce").to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pov_rate = np.where(pov_total > 0, pov_below / pov_total, np.nan)
+    records = pd.DataFrame(
+        {
+            "geo_id": df["geo_id"].str.zfill(11),
+            "population": pd.array(np.trunc(pop), dtype="Int64"),
+            "poverty_rate": pov_rate,
+        }
+    )
     with get_conn() as conn:
         with conn.cursor() as cur:
-            psycopg2.extras.execute_values(cur, sql, records, page_size=2000)
+            create_stage(
+                cur,
+                "acs_stage",
+                "(geo_id VARCHAR(11), population INTEGER, poverty_rate DOUBLE PRECISION)",
+            )
+            copy_frame(cur, records, "acs_stage", ["geo_id", "population", "poverty_rate"])
+            cur.execute(
+                """
+                UPDATE tracts
+                SET population = data.population,
+                    poverty_rate = data.poverty_rate
+                FROM acs_stage AS data
+                WHERE tracts.geo_id = data.geo_id;
+                UPDATE tracts
+                SET population_density = CASE
+                    WHEN population IS NOT NULL AND ST_Area(geom::geography) > 0
+                    THEN population / (ST_Area(geom::geography) / 1000000.0)
+                    ELSE NULL
+                END;
+                """
+            )
         conn.commit()
     print(f"updated population/poverty_rate for {len(records)} tracts")
 if __name__ == "__main__":
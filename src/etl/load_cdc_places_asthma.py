@@ -1,8 +1,8 @@
 import os
 import pandas as pd
 import psycopg2
-import psycopg2.extras
 from dotenv import load_dotenv
+from pgload import copy_frame, create_stage
 CSV_PATH = "data/raw/cdc/places_tracts.csv"
 STATES = {"NY", "NJ", "CT"}
 def get_conn():
@@ -25,20 +25,23 @@ def run():
     df = df[df["StateAbbr"].isin(STATES)]
     df = df[df["MeasureId"] == "CASTHMA"]
     df["geo_id"] = df["LocationID"].astype(str).str.zfill(11)
-    records = list(zip(df["geo_id"], df["Data_Value"]))
-    if not records:
+    if df.empty:
         print("no asthma records to load")
         return
-    sql = """
-        UPDATE tracts
-        SET asthma_prev = data.asthma_prev
-        FROM (VALUES %s) AS data(geo_id, asthma_prev)
-        WHERE tracts.geo_id = data.geo_id
-    """
+    df = df.rename(columns={"Data_Value": "asthma_prev"})
     with get_conn() as conn:
         with conn.cursor() as cur:
-            psycopg2.extras.execute_values(cur, sql, records, page_size=2000)
+            create_stage(cur, "asthma_stage", "(geo_id VARCHAR(11), asthma_prev DOUBLE PRECISION)")
+            n = copy_frame(cur, df, "asthma_stage", ["geo_id", "asthma_prev"])
+            cur.execute(
+                """
+                UPDATE tracts
+                SET asthma_prev = data.asthma_prev
+                FROM asthma_stage AS data
+                WHERE tracts.geo_id = data.geo_id
+                """
+            )
         conn.commit()
-    print(f"Updated asthma_prev for {len(records)} tracts.")
+    print(f"Updated asthma_prev for {n} tracts.")
 if __name__ == "__main__":
     run()
@@ -1,9 +1,10 @@
 import glob
 import os
 import geopandas as gpd
+import pandas as pd
 import psycopg2
-import psycopg2.extras
 from dotenv import load_dotenv
+from pgload import copy_frame
 def get_conn():
     required = ["PGHOST", "PGPORT", "PGDATABASE", "PGUSER", "PGPASSWORD"]
     missing = [v for v in required if not os.getenv(v)]
@@ -19,34 +20,21 @@ def get_conn():
 def load_file(path: str, cur):
     gdf = gpd.read_file(path)
     gdf = gdf.to_crs(epsg=4326)
-    records = []
-    for _, row in gdf.iterrows():
-        linear_id = row.get("LINEARID")
-        fullname = row.get("FULLNAME")
-        mtfcc = row.get("MTFCC")
-        geom = row.geometry
-        if geom is None:
-            continue
-        records.append(
-            (
-                linear_id,
-                fullname,
-                mtfcc,
-                None,
-                None,
-                geom.wkt,
-            )
-        )
-    if not records:
+    gdf = gdf[gdf.geometry.notna()]
+    if gdf.empty:
         return
-    sql = """
-        INSERT INTO highways (linear_id, fullname, mtfcc, type, traffic_volume, geom)
-        VALUES %s
-        ON CONFLICT DO NOTHING
-    """
-    template = "(%s,%s,%s,%s,%s, ST_SetSRID(ST_GeomFromText(%s),4326))"
-    psycopg2.extras.execute_values(cur, sql, records, template=template, page_size=2000)
-    print(f"inserted {len(records)} highways from {os.path.basename(path)}")
+    df = pd.DataFrame(
+        {
+            "linear_id": gdf["LINEARID"].values,
+            "fullname": gdf["FULLNAME"].values,
+            "mtfcc": gdf["MTFCC"].values,
+            "geom": gdf.geometry.values,
+        }
+    )
+    n = copy_frame(
+        cur, df, "highways", ["linear_id", "fullname", "mtfcc", "geom"], geometry="geom", multi=True
+    )
+    print(f"inserted {n} highways from {os.path.basename(path)}")
 def run():
     paths = glob.glob("data/raw/highways/tl_2023_*_prisecroads.shp")
     if not paths:
@@ -1,14 +1,23 @@
+import argparse
+import json
 import os
 import re
-from typing import List, Tuple
+import time
 import pandas as pd
 import psycopg2
-import psycopg2.extras
+import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
+import shapely
 from dotenv import load_dotenv
-PARQUET_PATH = "data/raw/openaq_bulk_filtered/filtered_openaq.parquet"
-PARQUET_PATH = "data/raw/openaq_bulk_filtered/filtered_openaq.parquet"
-BATCH_SIZE = 5000
+from openaq_lake import LAKE_DIR, open_lake
+from pgload import copy_binary, copy_frame, create_stage, float8_field, text_field, timestamp_field
+PARQUET_PATH = LAKE_DIR
+CHECKPOINT_PATH = "data/raw/openaq_bulk_filtered/load_checkpoint.json"
+STAGING_TABLE = "pollution_readings_stage"
+BATCH_SIZE = 200_000
+READ_COLUMNS = ["location", "longitude", "latitude", "timestamp_utc", "parameter", "value", "unit"]
+MONTH_RE = re.compile(r"year=(\d{4}).*month=(\d{1,2})")
 load_dotenv()
 def slugify_location(loc: str) -> str:
     s = re.sub(r"[^A-Za-z0-9]+", "_", loc).strip("_")
@@ -25,65 +34,389 @@ def get_conn():
         user=os.getenv("PGUSER"),
         password=os.getenv("PGPASSWORD"),
     )
-def upsert_monitors(cur, monitor_rows: List[Tuple[str, str, float, float]]):
-    if not monitor_rows:
+def upsert_monitors(cur, monitors: pd.DataFrame):
+    if monitors.empty:
         return
-    sql = """
+    create_stage(cur, "monitors_stage", "(monitor_id VARCHAR(100), name VARCHAR(255), geom GEOMETRY(Point, 4326))")
+    copy_frame(cur, monitors, "monitors_stage", ["monitor_id", "name", "geom"], geometry="geom")
+    cur.execute(
+        """
         INSERT INTO pollution_monitors (monitor_id, name, source, sensor_type, geom)
-        VALUES %s
+        SELECT monitor_id, name, 'OpenAQ', 'pm25/no2 bulk', geom
+        FROM monitors_stage
         ON CONFLICT (monitor_id) DO NOTHING
-    """
-    template = (
-        "(%s, %s, 'OpenAQ', 'pm25/no2 bulk', ST_SetSRID(ST_MakePoint(%s, %s), 4326))"
+        """
     )
-    psycopg2.extras.execute_values(
-        cur, sql, monitor_rows, template=template, page_size=1000
+def create_staging_table(cur):
+    cur.execute(
+        f"""
+        CREATE UNLOGGED TABLE IF NOT EXISTS {STAGING_TABLE} (
+            monitor_id VARCHAR(100),
+            timestamp TIMESTAMPTZ,
+            pollutant VARCHAR(20),
+            value DOUBLE PRECISION,
+            unit VARCHAR(20)
+        )
+        """
     )
-def insert_readings(cur, reading_rows: List[Tuple[str, str, float, str]]):
-    if not reading_rows:
-        return
-    sql = """
-        INSERT INTO pollution_readings (monitor_id, timestamp, pollutant, value, unit)
-        VALUES %s
-        ON CONFLICT ON CONSTRAINT unique_reading DO NOTHING
-    """
-    template = "(%s, %s, %s, %s, %s)"
-    psycopg2.extras.execute_values(
-        cur, sql, reading_rows, template=template, page_size=2000
-    )
-def process_parquet(path: str):
-    pf = pq.ParquetFile(path)
+    cur.execute(f"TRUNCATE {STAGING_TABLE}")
+def register_pollutants(cur):
+    cur.execute(
+        f"""
+        INSERT INTO pollutant_codes (pollutant)
+        SELECT DISTINCT pollutant FROM {STAGING_TABLE} WHERE pollutant IS NOT NULL
+        ON CONFLICT (pollutant) DO NOTHING
+        """
+    )
+def ensure_partitions(cur):
+    register_pollutants(cur)
+    cur.execute(
+        f"""
+        SELECT ensure_readings_partition(m)
+        FROM (SELECT DISTINCT date_trunc('month', timestamp AT TIME ZONE 'UTC')::date AS m FROM {STAGING_TABLE}) months
+        """
+    )
+STAGED_READINGS_SQL = f"""
+    SELECT monitor_key, timestamp, pollutant_code, value, unit
+    FROM (
+        SELECT DISTINCT ON (m.id, c.code, s.timestamp)
+               m.id AS monitor_key, s.timestamp, c.code AS pollutant_code, s.value, s.unit
+        FROM {STAGING_TABLE} s
+        JOIN pollution_monitors m ON m.monitor_id = s.monitor_id
+        JOIN pollutant_codes c ON c.pollutant = s.pollutant
+        ORDER BY m.id, c.code, s.timestamp
+    ) d
+    ORDER BY timestamp
+"""
+def merge_staging(cur) -> int:
+    ensure_partitions(cur)
+    cur.execute(
+        f"""
+        WITH inserted AS (
+            INSERT INTO pollution_readings (monitor_key, timestamp, pollutant_code, value, unit)
+            {STAGED_READINGS_SQL}
+            ON CONFLICT (monitor_key, pollutant_code, timestamp) DO NOTHING
+            RETURNING monitor_key, timestamp, pollutant_code, value
+        ),
+        aggregated AS (
+            INSERT INTO monitor_year_agg (monitor_id, year, pollutant, value_sum, value_count)
+            SELECT m.monitor_id, i.year, c.pollutant, i.value_sum, i.value_count
+            FROM (
+                SELECT monitor_key, EXTRACT(YEAR FROM timestamp AT TIME ZONE 'UTC')::int AS year,
+                       pollutant_code, COALESCE(SUM(value), 0) AS value_sum, COUNT(value) AS value_count
+                FROM inserted
+                GROUP BY 1, 2, 3
+            ) i
+            JOIN pollution_monitors m ON m.id = i.monitor_key
+            JOIN pollutant_codes c ON c.code = i.pollutant_code
+            ON CONFLICT (monitor_id, year, pollutant) DO UPDATE
+              SET value_sum = monitor_year_agg.value_sum + EXCLUDED.value_sum,
+                  value_count = monitor_year_agg.value_count + EXCLUDED.value_count,
+                  change_seq = nextval('monitor_year_agg_change_seq')
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM inserted), (SELECT COUNT(*) FROM aggregated)
+        """
+    )
+    inserted, _ = cur.fetchone()
+    cur.execute(f"TRUNCATE {STAGING_TABLE}")
+    return inserted
+MONTH_DELTA_SQL = """
+    WITH delta AS (
+        SELECT monitor_key, pollutant_code, SUM(value_sum) AS value_sum, SUM(value_count) AS value_count
+        FROM ({parts}) p
+        GROUP BY 1, 2
+    )
+    INSERT INTO monitor_year_agg (monitor_id, year, pollutant, value_sum, value_count)
+    SELECT m.monitor_id, %(year)s, c.pollutant, d.value_sum, d.value_count
+    FROM delta d
+    JOIN pollution_monitors m ON m.id = d.monitor_key
+    JOIN pollutant_codes c ON c.code = d.pollutant_code
+    WHERE d.value_sum <> 0 OR d.value_count <> 0
+    ON CONFLICT (monitor_id, year, pollutant) DO UPDATE
+      SET value_sum = monitor_year_agg.value_sum + EXCLUDED.value_sum,
+          value_count = monitor_year_agg.value_count + EXCLUDED.value_count,
+          change_seq = nextval('monitor_year_agg_change_seq')
+"""
+def shift_aggregates(cur, year: int, added: str = None, removed: str = None):
+    parts = [
+        f"SELECT monitor_key, pollutant_code, {sign}COALESCE(SUM(value), 0) AS value_sum, "
+        f"{sign}COUNT(value) AS value_count FROM {table} GROUP BY 1, 2"
+        for table, sign in ((added, ""), (removed, "-"))
+        if table
+    ]
+    if parts:
+        cur.execute(MONTH_DELTA_SQL.format(parts=" UNION ALL ".join(parts)), {"year": year})
+def month_bounds(year: int, month: int):
+    nxt = (year + 1, 1) if month == 12 else (year, month + 1)
+    return f"{year}-{month:02d}-01T00:00:00+00:00", f"{nxt[0]}-{nxt[1]:02d}-01T00:00:00+00:00"
+def partition_name(cur, year: int, month: int) -> str:
+    cur.execute("SELECT readings_partition_name(%s::date)", (f"{year}-{month:02d}-01",))
+    return cur.fetchone()[0]
+def table_exists(cur, name: str) -> bool:
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+    return cur.fetchone()[0]
+def is_attached(cur, name: str) -> bool:
+    cur.execute(
+        """
+        SELECT 1 FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'pollution_readings'::regclass AND c.relname = %s
+        """,
+        (name,),
+    )
+    return cur.fetchone() is not None
+def rename_table(cur, old: str, new: str):
+    cur.execute(
+        """
+        SELECT c.relname FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = %s::regclass
+        """,
+        (old,),
+    )
+    for (index,) in cur.fetchall():
+        if index.startswith(old):
+            cur.execute(f"ALTER INDEX {index} RENAME TO {new}{index[len(old):]}")
+    cur.execute(f"ALTER TABLE {old} RENAME TO {new}")
+def detach_month(cur, year: int, month: int) -> str:
+    name = partition_name(cur, year, month)
+    if not is_attached(cur, name):
+        raise SystemExit(f"{name} is not attached to pollution_readings")
+    if table_exists(cur, f"{name}_detached"):
+        raise SystemExit(f"{name}_detached already exists, attach or drop it first")
+    cur.execute(f"ALTER TABLE pollution_readings DETACH PARTITION {name}")
+    rename_table(cur, name, f"{name}_detached")
+    shift_aggregates(cur, year, removed=f"{name}_detached")
+    return f"{name}_detached"
+def attach_month(cur, year: int, month: int, table: str = None) -> str:
+    name = partition_name(cur, year, month)
+    table = table or f"{name}_detached"
+    if not table_exists(cur, table):
+        raise SystemExit(f"{table} not found, nothing to attach for {year}-{month:02d}")
+    if table_exists(cur, name):
+        raise SystemExit(f"{name} already exists, detach or drop it before attaching {table}")
+    lo, hi = month_bounds(year, month)
+    rename_table(cur, table, name)
+    cur.execute(
+        f"ALTER TABLE {name} ADD CONSTRAINT {name}_bounds CHECK (timestamp >= %s AND timestamp < %s)", (lo, hi)
+    )
+    cur.execute(f"ALTER TABLE pollution_readings ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (lo, hi))
+    cur.execute(f"ALTER TABLE {name} DROP CONSTRAINT {name}_bounds")
+    shift_aggregates(cur, year, added=name)
+    return name
+def reload_month(cur, year: int, month: int, units) -> int:
+    name = partition_name(cur, year, month)
+    load = f"{name}_load"
+    if table_exists(cur, f"{name}_detached"):
+        raise SystemExit(f"{year}-{month:02d} is detached as {name}_detached, attach or drop it before reloading")
+    if table_exists(cur, name) and not is_attached(cur, name):
+        raise SystemExit(f"{name} exists but is not a partition of pollution_readings, drop or rename it first")
+    create_staging_table(cur)
+    for file, pf, rg in units:
+        columns = [c for c in READ_COLUMNS if c in pf.schema_arrow.names]
+        for batch in pf.iter_batches(batch_size=BATCH_SIZE, row_groups=[rg], columns=columns):
+            load_batch(cur, batch)
+    register_pollutants(cur)
+    lo, hi = month_bounds(year, month)
+    cur.execute(f"DROP TABLE IF EXISTS {load}")
+    cur.execute(f"CREATE TABLE {load} (LIKE pollution_readings INCLUDING DEFAULTS)")
+    cur.execute(
+        f"""
+        INSERT INTO {load} (monitor_key, timestamp, pollutant_code, value, unit)
+        SELECT * FROM ({STAGED_READINGS_SQL}) r
+        WHERE timestamp >= %s AND timestamp < %s
+        """,
+        (lo, hi),
+    )
+    n = cur.rowcount
+    cur.execute(f"ALTER TABLE {load} ADD CONSTRAINT {load}_pkey PRIMARY KEY (monitor_key, pollutant_code, timestamp)")
+    cur.execute(f"CREATE INDEX {load}_timestamp_idx ON {load} USING BRIN (timestamp) WITH (pages_per_range = 32)")
+    cur.execute(f"ANALYZE {load}")
+    if is_attached(cur, name):
+        cur.execute(f"ALTER TABLE pollution_readings DETACH PARTITION {name}")
+        shift_aggregates(cur, year, removed=name)
+        cur.execute(f"DROP TABLE {name}")
+    attach_month(cur, year, month, load)
+    cur.execute(f"TRUNCATE {STAGING_TABLE}")
+    return n
+def readings_fields(batch: pa.RecordBatch, monitor_ids: pa.Array):
+    if "unit" in batch.schema.names:
+        unit = batch.column("unit")
+    else:
+        unit = pa.nulls(batch.num_rows, pa.string())
+    return [
+        text_field(monitor_ids),
+        timestamp_field(batch.column("timestamp_utc")),
+        text_field(batch.column("parameter")),
+        float8_field(batch.column("value")),
+        text_field(unit),
+    ]
+def _monitor_ids(locations: pa.Array) -> pa.Array:
+    encoded = pc.dictionary_encode(pc.cast(locations, pa.string()))
+    slugs = pa.array([slugify_location(loc) for loc in encoded.dictionary.to_pylist()], pa.string())
+    return pc.take(slugs, encoded.indices)
+def _monitor_frame(batch: pa.RecordBatch, monitor_ids: pa.Array) -> pd.DataFrame:
+    df = pd.DataFrame(
+        {
+            "monitor_id": monitor_ids.to_numpy(zero_copy_only=False),
+            "name": pc.cast(batch.column("location"), pa.string()).to_numpy(zero_copy_only=False),
+            "longitude": pc.cast(batch.column("longitude"), pa.float64()).to_numpy(zero_copy_only=False),
+            "latitude": pc.cast(batch.column("latitude"), pa.float64()).to_numpy(zero_copy_only=False),
+        }
+    )
+    df = df.dropna().drop_duplicates("monitor_id", keep="last")
+    df["geom"] = shapely.points(df["longitude"].to_numpy(), df["latitude"].to_numpy())
+    return df
+def _valid_readings(batch: pa.RecordBatch) -> pa.RecordBatch:
+    mask = pc.and_(
+        pc.and_(pc.is_valid(batch.column("location")), pc.is_valid(batch.column("timestamp_utc"))),
+        pc.and_(pc.is_valid(batch.column("parameter")), pc.is_valid(batch.column("value"))),
+    )
+    mask = pc.and_(mask, pc.invert(pc.is_nan(pc.cast(batch.column("value"), pa.float64()))))
+    return batch.filter(mask)
+def load_batch(cur, batch: pa.RecordBatch) -> int:
+    batch = _valid_readings(batch)
+    if batch.num_rows == 0:
+        return 0
+    monitor_ids = _monitor_ids(batch.column("location"))
+    upsert_monitors(cur, _monitor_frame(batch, monitor_ids))
+    return copy_binary(
+        cur,
+        STAGING_TABLE,
+        ["monitor_id", "timestamp", "pollutant", "value", "unit"],
+        readings_fields(batch, monitor_ids),
+    )
+def read_checkpoint(path: str):
+    if not os.path.exists(CHECKPOINT_PATH):
+        return None
+    with open(CHECKPOINT_PATH) as f:
+        state = json.load(f)
+    if state.get("path") != path:
+        return None
+    return state.get("next_row_group")
+def write_checkpoint(path: str, next_row_group: int):
+    os.makedirs(os.path.dirname(CHECKPOINT_PATH), exist_ok=True)
+    tmp = CHECKPOINT_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"path": path, "next_row_group": next_row_group}, f)
+    os.replace(tmp, CHECKPOINT_PATH)
+def row_group_units(path: str):
+    files = sorted(open_lake(path).files) if os.path.isdir(path) else [path]
+    units = []
+    for file in files:
+        pf = pq.ParquetFile(file)
+        units.extend((file, pf, rg) for rg in range(pf.num_row_groups))
+    return units
+def process_parquet(path: str, start_row_group: int = 0):
+    units = row_group_units(path)
+    n_groups = len(units)
+    print(f"{n_groups} row groups in {path}, starting at {start_row_group}")
+    total_start = time.perf_counter()
+    total_rows = 0
     with get_conn() as conn:
         with conn.cursor() as cur:
-            for batch in pf.iter_batches(batch_size=BATCH_SIZE):
-                df = batch.to_pandas()
-                monitors = {}
-                for loc, lon, lat in zip(
-                    df["location"], df["longitude"], df["latitude"]
+            create_staging_table(cur)
+            conn.commit()
+            for unit in range(start_row_group, n_groups):
+                file, pf, rg = units[unit]
+                columns = [c for c in READ_COLUMNS if c in pf.schema_arrow.names]
+                staged = 0
+                for i, batch in enumerate(
+                    pf.iter_batches(batch_size=BATCH_SIZE, row_groups=[rg], columns=columns)
                 ):
-                    if pd.isna(loc) or pd.isna(lon) or pd.isna(lat):
-                        continue
-                    mid = slugify_location(str(loc))
-                    monitors[mid] = (mid, str(loc), float(lon), float(lat))
-                upsert_monitors(cur, list(monitors.values()))
-                readings = []
-                for _, row in df.iterrows():
-                    loc = row.get("location")
-                    if pd.isna(loc):
-                        continue
-                    mid = slugify_location(str(loc))
-                    ts = row.get("timestamp_utc")
-                    param = row.get("parameter")
-                    val = row.get("value")
-                    if pd.isna(ts) or pd.isna(param) or pd.isna(val):
-                        continue
-                    readings.append(
-                        (mid, ts.to_pydatetime(), str(param), float(val), None)
+                    t0 = time.perf_counter()
+                    n = load_batch(cur, batch)
+                    dt = time.perf_counter() - t0
+                    staged += n
+                    print(
+                        f"    row group {unit} batch {i}: {n} rows in {dt:.2f}s "
+                        f"({n / dt if dt > 0 else 0:,.0f} rows/s)"
                     )
+                t0 = time.perf_counter()
+                inserted = merge_staging(cur)
+                conn.commit()
+                write_checkpoint(path, unit + 1)
+                total_rows += staged
+                print(
+                    f"row group {unit} ({os.path.basename(os.path.dirname(file))}): "
+                    f"merged {inserted} new of {staged} staged rows "
+                    f"in {time.perf_counter() - t0:.2f}s"
+                )
+    elapsed = time.perf_counter() - total_start
+    print(
+        f"staged {total_rows} rows in {elapsed:.1f}s "
+        f"({total_rows / elapsed if elapsed > 0 else 0:,.0f} rows/s)"
+    )
+def month_units(path: str):
+    months = {}
+    for unit in row_group_units(path):
+        m = MONTH_RE.search(unit[0])
+        if not m:
+            raise SystemExit(f"{unit[0]} is not under year=/month= partitions, --reload needs the partitioned dataset")
+        months.setdefault((int(m.group(1)), int(m.group(2))), []).append(unit)
+    return dict(sorted(months.items()))
+def reload_parquet(path: str, only=None):
+    months = month_units(path)
+    if only:
+        months = {k: v for k, v in months.items() if k in only}
+    print(f"reloading {len(months)} monthly partitions from {path}")
+    total_start = time.perf_counter()
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            create_staging_table(cur)
             conn.commit()
+            for (year, month), units in months.items():
+                t0 = time.perf_counter()
+                n = reload_month(cur, year, month, units)
+                conn.commit()
+                print(f"{year}-{month:02d}: swapped in {n} rows from {len(units)} row groups in {time.perf_counter() - t0:.1f}s")
+    print(f"reload finished in {time.perf_counter() - total_start:.1f}s")
+def switch_month(month: str, attach: bool):
+    year, mon = parse_month(month)
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            name = attach_month(cur, year, mon) if attach else detach_month(cur, year, mon)
+        conn.commit()
+    print(f"{'attached' if attach else 'detached'} {name} and updated monitor_year_agg for {year}")
+def parse_month(value: str):
+    year, month = (int(x) for x in value.split("-"))
+    return year, month
+def parse_args():
+    parser = argparse.ArgumentParser(description="load filtered OpenAQ parquet into postgis")
+    parser.add_argument(
+        "--parquet", default=PARQUET_PATH, help="partitioned dataset directory or a single parquet file"
+    )
+    parser.add_argument(
+        "--resume-from-row-group",
+        type=int,
+        default=None,
+        help="row group to start from, defaults to the last checkpoint for this file",
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="ignore the checkpoint and load from row group 0"
+    )
+    parser.add_argument(
+        "--reload",
+        action="store_true",
+        help="rebuild each month in the dataset as a fresh table and swap it in for the existing partition",
+    )
+    parser.add_argument("--months", nargs="+", type=parse_month, help="with --reload, only these YYYY-MM months")
+    parser.add_argument("--detach", metavar="YYYY-MM", help="detach a monthly partition and keep it as <partition>_detached")
+    parser.add_argument("--attach", metavar="YYYY-MM", help="re-attach the <partition>_detached table left by --detach")
+    return parser.parse_args()
 if __name__ == "__main__":
-    import pandas as pd
-    if not os.path.exists(PARQUET_PATH):
-        raise SystemExit(f"parquet not found: {PARQUET_PATH}")
-    process_parquet(PARQUET_PATH)
+    args = parse_args()
+    if args.detach or args.attach:
+        switch_month(args.attach or args.detach, attach=bool(args.attach))
+        raise SystemExit(0)
+    if not os.path.exists(args.parquet):
+        raise SystemExit(f"parquet not found: {args.parquet}")
+    if args.reload:
+        reload_parquet(args.parquet, set(args.months or []))
+    else:
+        start = args.resume_from_row_group
+        if start is None:
+            start = 0 if args.restart else (read_checkpoint(args.parquet) or 0)
+        process_parquet(args.parquet, start)
     print("load complete")
@@ -1,8 +1,8 @@
 import os
 import pandas as pd
 import psycopg2
-import psycopg2.extras
 from dotenv import load_dotenv
+from pgload import copy_frame, create_stage
 load_dotenv()
 CSV_PATH = "data/raw/svi/SVI2020_US_tract.csv"
 STATES = {"NY", "NJ", "CT"}
@@ -25,17 +25,19 @@ def run():
     df = df[df["STATE"].isin(STATES)]
     df["geo_id"] = df["FIPS"].str.zfill(11)
     df["svi"] = pd.to_numeric(df["RPL_THEMES"], errors="coerce")
-    records = list(zip(df["geo_id"], df["svi"]))
-    sql = """
-        UPDATE tracts
-        SET svi_ranking = data.svi
-        FROM (VALUES %s) AS data(geo_id, svi)
-        WHERE tracts.geo_id = data.geo_id;
-    """
     with get_conn() as conn:
         with conn.cursor() as cur:
-            psycopg2.extras.execute_values(cur, sql, records, page_size=2000)
+            create_stage(cur, "svi_stage", "(geo_id VARCHAR(11), svi DOUBLE PRECISION)")
+            n = copy_frame(cur, df, "svi_stage", ["geo_id", "svi"])
+            cur.execute(
+                """
+                UPDATE tracts
+                SET svi_ranking = data.svi
+                FROM svi_stage AS data
+                WHERE tracts.geo_id = data.geo_id;
+                """
+            )
         conn.commit()
-    print(f"updated svi_ranking for {len(records)} tracts")
+    print(f"updated svi_ranking for {n} tracts")
 if __name__ == "__main__":
     run()
@@ -1,8 +1,9 @@
 import os
 import geopandas as gpd
+import pandas as pd
 import psycopg2
-import psycopg2.extras
 from dotenv import load_dotenv
+from pgload import copy_frame, create_stage
 TRACT_FILES = [
     "data/raw/tracts/tl_2020_36_tract.shp",
     "data/raw/tracts/tl_2020_34_tract.shp",
@@ -26,47 +27,36 @@ def load_file(path: str, cur):
         return
     gdf = gpd.read_file(path)
     gdf = gdf.to_crs(epsg=4326)
-    records = []
-    for _, row in gdf.iterrows():
-        geoid = row.get("GEOID")
-        name = row.get("NAMELSAD")
-        state = row.get("STATEFP")
-        county = row.get("COUNTYFP")
-        pop = row.get("POPULATION") if "POPULATION" in row else None
-        area = row.get("ALAND") if "ALAND" in row else None
-        geom = row.geometry
-        if geoid is None or geom is None:
-            continue
-        records.append(
-            (
-                geoid,
-                state,
-                county,
-                name,
-                pop,
-                None,
-                None,
-                None,
-                None,
-                geom.wkt,
-            )
-        )
-    if not records:
+    gdf = gdf[gdf["GEOID"].notna() & gdf.geometry.notna()]
+    if gdf.empty:
         return
-    sql = """
-        INSERT INTO tracts
-        (geo_id, state_code, county_code, name, population, population_density, svi_ranking, poverty_rate, asthma_prev, geom)
-        VALUES %s
+    df = pd.DataFrame(
+        {
+            "geo_id": gdf["GEOID"].values,
+            "state_code": gdf["STATEFP"].values,
+            "county_code": gdf["COUNTYFP"].values,
+            "name": gdf["NAMELSAD"].values,
+            "population": gdf["POPULATION"].values if "POPULATION" in gdf else None,
+            "geom": gdf.geometry.values,
+        }
+    )
+    create_stage(cur, "tracts_stage", "(LIKE tracts INCLUDING DEFAULTS)")
+    columns = ["geo_id", "state_code", "county_code", "name", "population", "geom"]
+    n = copy_frame(cur, df, "tracts_stage", columns, geometry="geom", multi=True)
+    cur.execute(
+        """
+        INSERT INTO tracts (geo_id, state_code, county_code, name, population, geom)
+        SELECT geo_id, state_code, county_code, name, population, geom
+        FROM tracts_stage
         ON CONFLICT (geo_id) DO UPDATE
           SET state_code = EXCLUDED.state_code,
               county_code = EXCLUDED.county_code,
               name = EXCLUDED.name,
               population = EXCLUDED.population,
               geom = EXCLUDED.geom
-    """
-    template = "(%s,%s,%s,%s,%s,%s,%s,%s,%s, ST_SetSRID(ST_GeomFromText(%s),4326))"
-    psycopg2.extras.execute_values(cur, sql, records, template=template, page_size=1000)
-    print(f"inserted {len(records)} tracts from {path}")
+        """
+    )
+    print(f"inserted {n} tracts from {path}")
 def run():
     with get_conn() as conn:
         with conn.cursor() as cur:
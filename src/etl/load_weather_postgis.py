@@ -1,8 +1,8 @@
 import os
 import pandas as pd
 import psycopg2
-import psycopg2.extras
 from dotenv import load_dotenv
+from pgload import copy_frame, create_stage
 load_dotenv()
 CSV_PATH = "data/raw/weather/daily_covariates.csv"
 def get_conn():
@@ -25,31 +25,25 @@ def run():
     df = pd.read_csv(CSV_PATH)
     if "smoke_surge" in df.columns:
         df["smoke_surge"] = df["smoke_surge"].astype(bool)
-    records = []
-    for _, row in df.iterrows():
-        records.append(
-            (
-                row["date"],
-                row["avg_temp_celsius"],
-                row["avg_humidity"],
-                row["pollen_level"],
-                row["smoke_surge"],
-            )
-        )
-    sql = """
-        INSERT INTO daily_covariates
-        (date, avg_temp_celsius, avg_humidity, pollen_level, smoke_surge)
-        VALUES %s
-        ON CONFLICT (date) DO UPDATE SET
-            avg_temp_celsius = EXCLUDED.avg_temp_celsius,
-            avg_humidity = EXCLUDED.avg_humidity,
-            pollen_level = EXCLUDED.pollen_level,
-            smoke_surge = EXCLUDED.smoke_surge;
-    """
+    columns = ["date", "avg_temp_celsius", "avg_humidity", "pollen_level", "smoke_surge"]
     with get_conn() as conn:
         with conn.cursor() as cur:
-            psycopg2.extras.execute_values(cur, sql, records, page_size=1000)
+            create_stage(cur, "daily_covariates_stage", "(LIKE daily_covariates)")
+            n = copy_frame(cur, df, "daily_covariates_stage", columns)
+            cur.execute(
+                """
+                INSERT INTO daily_covariates
+                (date, avg_temp_celsius, avg_humidity, pollen_level, smoke_surge)
+                SELECT date, avg_temp_celsius, avg_humidity, pollen_level, smoke_surge
+                FROM daily_covariates_stage
+                ON CONFLICT (date) DO UPDATE SET
+                    avg_temp_celsius = EXCLUDED.avg_temp_celsius,
+                    avg_humidity = EXCLUDED.avg_humidity,
+                    pollen_level = EXCLUDED.pollen_level,
+                    smoke_surge = EXCLUDED.smoke_surge;
+                """
+            )
         conn.commit()
-    print(f"successfully loaded {len(records)} daily weather records")
+    print(f"successfully loaded {n} daily weather records")
 if __name__ == "__main__":
     run()
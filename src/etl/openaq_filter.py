@@ -0,0 +1,125 @@
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+import pyarrow as pa
+import pyarrow.compute as pc
+COLUMN_ALIASES = {
+    "parameter": ["parameter", "pollutant"],
+    "value": ["value"],
+    "unit": ["unit"],
+    "country": ["country"],
+    "latitude": ["latitude", "coordinates.latitude", "lat"],
+    "longitude": ["longitude", "coordinates.longitude", "lon", "lng"],
+    "timestamp_utc": ["date_utc", "utc", "timestamp", "datetime", "date.utc"],
+    "location": ["location"],
+    "city": ["city"],
+    "sourceName": ["sourceName", "source"],
+}
+REQUIRED = ("parameter", "latitude", "longitude", "timestamp_utc")
+NUMERIC_COLUMNS = {"value", "latitude", "longitude"}
+OUTPUT_SCHEMA = pa.schema(
+    [
+        ("parameter", pa.string()),
+        ("value", pa.float64()),
+        ("unit", pa.string()),
+        ("country", pa.string()),
+        ("latitude", pa.float64()),
+        ("longitude", pa.float64()),
+        ("timestamp_utc", pa.timestamp("ns", tz="UTC")),
+        ("location", pa.string()),
+        ("city", pa.string()),
+        ("sourceName", pa.string()),
+    ]
+)
+NUMBER_RE = r"^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$"
+TS_FORMATS = ["%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%d %H:%M:%S%z"]
+def alias_columns():
+    return {c for aliases in COLUMN_ALIASES.values() for c in aliases}
+@lru_cache(maxsize=64)
+def resolve_columns(names: Tuple[str, ...]) -> Optional[Dict[str, str]]:
+    present = set(names)
+    resolved = {}
+    for out, aliases in COLUMN_ALIASES.items():
+        for c in aliases:
+            if c in present:
+                resolved[out] = c
+                break
+    if any(k not in resolved for k in REQUIRED):
+        return None
+    return resolved
+def _to_float(arr):
+    if pa.types.is_floating(arr.type) or pa.types.is_integer(arr.type):
+        return pc.cast(arr, pa.float64())
+    arr = pc.cast(arr, pa.string())
+    try:
+        return pc.cast(arr, pa.float64())
+    except pa.ArrowInvalid:
+        numeric = pc.match_substring_regex(arr, NUMBER_RE)
+        return pc.cast(pc.if_else(numeric, arr, pa.scalar(None, pa.string())), pa.float64())
+def _to_utc_timestamp(arr):
+    target = OUTPUT_SCHEMA.field("timestamp_utc").type
+    if pa.types.is_timestamp(arr.type):
+        if arr.type.tz is None:
+            return pc.cast(pc.cast(arr, pa.timestamp(target.unit)), target)
+        return pc.cast(arr, target)
+    if pa.types.is_date(arr.type):
+        return pc.cast(pc.cast(arr, pa.timestamp(target.unit)), target)
+    arr = pc.cast(arr, pa.string())
+    for naive in (False, True):
+        try:
+            if naive:
+                return pc.cast(pc.cast(arr, pa.timestamp(target.unit)), target)
+            return pc.cast(arr, target)
+        except pa.ArrowInvalid:
+            pass
+    parsed = None
+    for fmt in TS_FORMATS:
+        attempt = pc.strptime(arr, format=fmt, unit=target.unit, error_is_null=True)
+        parsed = attempt if parsed is None else pc.coalesce(parsed, attempt)
+    return pc.cast(parsed, target)
+def _bounds(config):
+    unit = OUTPUT_SCHEMA.field("timestamp_utc").type
+    start = pa.scalar(f"{config.START_DATE}T00:00:00+00:00").cast(unit)
+    end = pa.scalar(f"{config.END_DATE}T23:59:59+00:00").cast(unit)
+    return start, end
+def filter_batch(batch, config) -> Optional[pa.RecordBatch]:
+    cols = resolve_columns(tuple(batch.schema.names))
+    if cols is None or batch.num_rows == 0:
+        return None
+    param = pc.utf8_lower(pc.cast(batch.column(cols["parameter"]), pa.string()))
+    lat = _to_float(batch.column(cols["latitude"]))
+    lon = _to_float(batch.column(cols["longitude"]))
+    ts = _to_utc_timestamp(batch.column(cols["timestamp_utc"]))
+    start, end = _bounds(config)
+    bbox = config.BBOX
+    mask = pc.and_kleene(
+        pc.is_in(param, value_set=pa.array(sorted(config.POLLUTANTS), pa.string())),
+        pc.and_kleene(
+            pc.and_kleene(pc.greater_equal(ts, start), pc.less_equal(ts, end)),
+            pc.and_kleene(
+                pc.and_kleene(
+                    pc.greater_equal(lat, bbox["lat_min"]), pc.less_equal(lat, bbox["lat_max"])
+                ),
+                pc.and_kleene(
+                    pc.greater_equal(lon, bbox["lon_min"]), pc.less_equal(lon, bbox["lon_max"])
+                ),
+            ),
+        ),
+    )
+    if "country" in cols:
+        country = pc.utf8_upper(pc.cast(batch.column(cols["country"]), pa.string()))
+        mask = pc.and_kleene(mask, pc.equal(country, config.COUNTRY))
+    mask = pc.fill_null(mask, False)
+    if not pc.any(mask).as_py():
+        return None
+    computed = {"parameter": param, "latitude": lat, "longitude": lon, "timestamp_utc": ts}
+    arrays = []
+    for field in OUTPUT_SCHEMA:
+        if field.name in computed:
+            arr = computed[field.name]
+        elif field.name in cols:
+            arr = batch.column(cols[field.name])
+            arr = _to_float(arr) if field.name in NUMERIC_COLUMNS else pc.cast(arr, field.type)
+        else:
+            arr = pa.nulls(batch.num_rows, field.type)
+        arrays.append(pc.filter(arr, mask))
+    return pa.RecordBatch.from_arrays(arrays, schema=OUTPUT_SCHEMA)
@@ -0,0 +1,161 @@
+import argparse
+import glob
+import os
+import shutil
+import time
+from typing import Iterable, List, Optional
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from openaq_filter import OUTPUT_SCHEMA
+LAKE_DIR = "data/raw/openaq_bulk_filtered/dataset"
+GEOHASH_BITS = 30
+ROW_GROUP_ROWS = 32_768
+DATA_PAGE_SIZE = 64 << 10
+PARTITION_SCHEMA = pa.schema([("pollutant", pa.string()), ("year", pa.int16()), ("month", pa.int8())])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor="hive")
+LAKE_SCHEMA = OUTPUT_SCHEMA.append(pa.field("geohash", pa.int64()))
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    v = v.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in (
+        (16, 0x0000FFFF0000FFFF),
+        (8, 0x00FF00FF00FF00FF),
+        (4, 0x0F0F0F0F0F0F0F0F),
+        (2, 0x3333333333333333),
+        (1, 0x5555555555555555),
+    ):
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+def geohash_cells(lat, lon, bits: int = GEOHASH_BITS) -> np.ndarray:
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    lon_q = np.clip((lon + 180.0) / 360.0 * (1 << lon_bits), 0, (1 << lon_bits) - 1)
+    lat_q = np.clip((lat + 90.0) / 180.0 * (1 << lat_bits), 0, (1 << lat_bits) - 1)
+    lon_q = np.nan_to_num(lon_q).astype(np.uint64)
+    lat_q = np.nan_to_num(lat_q).astype(np.uint64)
+    if lon_bits == lat_bits:
+        cells = (_spread_bits(lon_q) << np.uint64(1)) | _spread_bits(lat_q)
+    else:
+        cells = _spread_bits(lon_q) | (_spread_bits(lat_q) << np.uint64(1))
+    return cells.astype(np.int64)
+def _with_partition_keys(dataset: ds.Dataset) -> ds.Scanner:
+    columns = {name: ds.field(name) for name in OUTPUT_SCHEMA.names}
+    columns["pollutant"] = ds.field("parameter")
+    columns["year"] = pc.year(ds.field("timestamp_utc")).cast(pa.int16())
+    columns["month"] = pc.month(ds.field("timestamp_utc")).cast(pa.int8())
+    return dataset.scanner(columns=columns)
+def _sort_partition(path: str):
+    table = pq.read_table(path)
+    cells = geohash_cells(
+        table.column("latitude").to_numpy(zero_copy_only=False),
+        table.column("longitude").to_numpy(zero_copy_only=False),
+    )
+    table = table.append_column("geohash", pa.array(cells, pa.int64()))
+    table = table.sort_by([("geohash", "ascending"), ("timestamp_utc", "ascending")])
+    table = table.select(LAKE_SCHEMA.names).cast(LAKE_SCHEMA)
+    tmp = path + ".sorted"
+    pq.write_table(
+        table,
+        tmp,
+        row_group_size=ROW_GROUP_ROWS,
+        data_page_size=DATA_PAGE_SIZE,
+        write_page_index=True,
+        write_statistics=True,
+        compression="zstd",
+    )
+    os.replace(tmp, path)
+    return table.num_rows
+def _expand(sources: Iterable[str]) -> List[str]:
+    files = []
+    for src in sources:
+        if os.path.isdir(src):
+            files.extend(sorted(glob.glob(os.path.join(src, "**", "*.parquet"), recursive=True)))
+        else:
+            files.append(src)
+    return files
+def build_lake(sources: Iterable[str], lake_dir: str = LAKE_DIR) -> int:
+    sources = _expand(sources)
+    staging = lake_dir + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    scanner = _with_partition_keys(ds.dataset(sources, format="parquet"))
+    ds.write_dataset(
+        scanner,
+        staging,
+        format="parquet",
+        partitioning=PARTITIONING,
+        basename_template="part-{i}.parquet",
+        max_partitions=4096,
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    rows = 0
+    for path in sorted(glob.glob(os.path.join(staging, "**", "*.parquet"), recursive=True)):
+        rows += _sort_partition(path)
+    old = lake_dir + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(lake_dir):
+        os.replace(lake_dir, old)
+    os.replace(staging, lake_dir)
+    shutil.rmtree(old, ignore_errors=True)
+    return rows
+def open_lake(lake_dir: str = LAKE_DIR) -> ds.Dataset:
+    return ds.dataset(lake_dir, format="parquet", partitioning=PARTITIONING)
+def lake_filter(
+    bbox: Optional[dict] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    pollutants: Optional[Iterable[str]] = None,
+) -> Optional[ds.Expression]:
+    terms = []
+    if pollutants:
+        terms.append(ds.field("pollutant").isin(sorted(pollutants)))
+    unit = OUTPUT_SCHEMA.field("timestamp_utc").type
+    if start:
+        start_ts = pa.scalar(f"{start}T00:00:00+00:00").cast(unit)
+        year, month = int(start[:4]), int(start[5:7])
+        terms.append(
+            (ds.field("year") > year) | ((ds.field("year") == year) & (ds.field("month") >= month))
+        )
+        terms.append(ds.field("timestamp_utc") >= start_ts)
+    if end:
+        end_ts = pa.scalar(f"{end}T23:59:59+00:00").cast(unit)
+        year, month = int(end[:4]), int(end[5:7])
+        terms.append(
+            (ds.field("year") < year) | ((ds.field("year") == year) & (ds.field("month") <= month))
+        )
+        terms.append(ds.field("timestamp_utc") <= end_ts)
+    if bbox:
+        terms.append(ds.field("latitude") >= bbox["lat_min"])
+        terms.append(ds.field("latitude") <= bbox["lat_max"])
+        terms.append(ds.field("longitude") >= bbox["lon_min"])
+        terms.append(ds.field("longitude") <= bbox["lon_max"])
+    if not terms:
+        return None
+    expr = terms[0]
+    for term in terms[1:]:
+        expr = expr & term
+    return expr
+def read_lake(
+    columns: Optional[List[str]] = None,
+    bbox: Optional[dict] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    pollutants: Optional[Iterable[str]] = None,
+    lake_dir: str = LAKE_DIR,
+) -> pa.Table:
+    return open_lake(lake_dir).to_table(
+        columns=columns, filter=lake_filter(bbox, start, end, pollutants)
+    )
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="rebuild the partitioned OpenAQ dataset from filtered parquet files"
+    )
+    parser.add_argument("sources", nargs="+", help="filtered parquet files or directories")
+    parser.add_argument("--lake-dir", default=LAKE_DIR)
+    args = parser.parse_args()
+    t0 = time.perf_counter()
+    rows = build_lake(args.sources, args.lake_dir)
+    print(f"wrote {rows} rows to {args.lake_dir} in {time.perf_counter() - t0:.1f}s")
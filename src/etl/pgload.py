@@ -0,0 +1,179 @@
+import io
+import struct
+from typing import Iterable, Optional
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import shapely
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+PGCOPY_TRAILER = struct.pack("!h", -1)
+PG_EPOCH_US = 946_684_800_000_000
+NULL_TEXT = "\\N"
+TEXT_ESCAPES = [("\\", "\\\\"), ("\t", "\\t"), ("\n", "\\n"), ("\r", "\\r")]
+HEX_DIGITS = np.frombuffer(
+    b"".join(f"{i:02X}".encode() for i in range(256)), dtype=np.uint16
+)
+MULTI_TYPES = {
+    shapely.GeometryType.POINT: shapely.multipoints,
+    shapely.GeometryType.LINESTRING: shapely.multilinestrings,
+    shapely.GeometryType.POLYGON: shapely.multipolygons,
+    shapely.GeometryType.MULTIPOINT: shapely.multipoints,
+    shapely.GeometryType.MULTILINESTRING: shapely.multilinestrings,
+    shapely.GeometryType.MULTIPOLYGON: shapely.multipolygons,
+}
+def to_multi(geoms) -> np.ndarray:
+    geoms = np.asarray(geoms, dtype=object)
+    if len(geoms) == 0:
+        return geoms
+    types = shapely.get_type_id(geoms)
+    kinds = np.unique(types[types >= 0])
+    if len(kinds) == 0:
+        return geoms
+    if len(kinds) > 1 and len({MULTI_TYPES[k] for k in kinds}) > 1:
+        raise ValueError(f"mixed geometry types: {sorted(kinds)}")
+    valid = ~shapely.is_missing(geoms)
+    parts, index = shapely.get_parts(geoms[valid], return_index=True)
+    multi = np.full(int(valid.sum()), None, dtype=object)
+    MULTI_TYPES[kinds[0]](parts, indices=index, out=multi)
+    out = np.full(len(geoms), None, dtype=object)
+    out[valid] = multi
+    return out
+def geometry_to_ewkb_hex(geoms, srid: int = 4326, multi: bool = False) -> pa.Array:
+    geoms = np.asarray(geoms, dtype=object)
+    if multi:
+        geoms = to_multi(geoms)
+    geoms = shapely.set_srid(geoms, srid)
+    missing = shapely.is_missing(geoms)
+    wkb = shapely.to_wkb(geoms, include_srid=True)
+    wkb[missing] = b""
+    lengths = np.fromiter((len(w) for w in wkb), dtype=np.int64, count=len(wkb))
+    raw = np.frombuffer(b"".join(wkb), dtype=np.uint8)
+    hexed = HEX_DIGITS[raw].view(np.uint8)
+    offsets = np.concatenate(([0], np.cumsum(lengths * 2))).astype(np.int32)
+    validity = pa.array(~missing).buffers()[1] if missing.any() else None
+    return pa.StringArray.from_buffers(
+        len(wkb), pa.py_buffer(offsets), pa.py_buffer(hexed), validity, int(missing.sum())
+    )
+def column_to_arrow(values) -> pa.Array:
+    if isinstance(values, pa.Array):
+        return values
+    if isinstance(values, pd.Series) and not isinstance(values.dtype, np.dtype):
+        return pa.array(values, from_pandas=True)
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        return pa.array(values, mask=np.isnan(values))
+    if values.dtype.kind in "iub":
+        return pa.array(values)
+    if values.dtype.kind == "M":
+        return pa.array(values, mask=np.isnat(values))
+    return pa.array(values, from_pandas=True)
+def _copy_text_column(arr: pa.Array, escape: bool = True) -> pa.Array:
+    if pa.types.is_boolean(arr.type):
+        arr = pc.if_else(arr, "t", "f")
+    elif escape and (pa.types.is_string(arr.type) or pa.types.is_large_string(arr.type)):
+        for needle, repl in TEXT_ESCAPES:
+            arr = pc.replace_substring(arr, needle, repl)
+    arr = pc.cast(arr, pa.string())
+    return pc.fill_null(arr, NULL_TEXT)
+def frame_to_copy(
+    df: pd.DataFrame,
+    columns: Iterable[str],
+    geometry: Optional[str] = None,
+    srid: int = 4326,
+    multi: bool = False,
+) -> bytes:
+    columns = list(columns)
+    if len(df) == 0:
+        return b""
+    text = []
+    for col in columns:
+        if col == geometry:
+            wkb = geometry_to_ewkb_hex(df[col].values, srid=srid, multi=multi)
+            text.append(_copy_text_column(wkb, escape=False))
+        else:
+            text.append(_copy_text_column(column_to_arrow(df[col])))
+    rows = pc.binary_join_element_wise(*text, "\t")
+    lines = pc.binary_join_element_wise(rows, "", "\n")
+    offsets = lines.buffers()[1]
+    start, end = np.frombuffer(offsets, dtype=np.int32)[[lines.offset, lines.offset + len(lines)]]
+    return lines.buffers()[2].to_pybytes()[start:end]
+def create_stage(cur, name: str, definition: str):
+    cur.execute(f"DROP TABLE IF EXISTS {name}")
+    cur.execute(f"CREATE TEMP TABLE {name} {definition} ON COMMIT DROP")
+def copy_frame(
+    cur,
+    df: pd.DataFrame,
+    table: str,
+    columns: Iterable[str],
+    geometry: Optional[str] = None,
+    srid: int = 4326,
+    multi: bool = False,
+) -> int:
+    columns = list(columns)
+    payload = frame_to_copy(df, columns, geometry=geometry, srid=srid, multi=multi)
+    if not payload:
+        return 0
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN", io.BytesIO(payload)
+    )
+    return len(df)
+def text_field(arr: pa.Array):
+    arr = pc.cast(arr, pa.string())
+    bufs = arr.buffers()
+    offsets = np.frombuffer(bufs[1], dtype=np.int32)[arr.offset : arr.offset + len(arr) + 1]
+    data = np.frombuffer(bufs[2], dtype=np.uint8) if bufs[2] is not None else np.empty(0, np.uint8)
+    valid = arr.is_valid().to_numpy(zero_copy_only=False)
+    lengths = np.where(valid, np.diff(offsets), -1).astype(np.int64)
+    return lengths, (offsets[:-1].astype(np.int64), data)
+def fixed_field(values: np.ndarray, valid: Optional[np.ndarray] = None):
+    raw = np.ascontiguousarray(values).view(np.uint8).reshape(len(values), -1)
+    if valid is None:
+        valid = np.ones(len(values), dtype=bool)
+    lengths = np.where(valid, raw.shape[1], -1).astype(np.int64)
+    return lengths, raw
+def timestamp_field(arr: pa.Array):
+    ts = pc.cast(arr, pa.timestamp("us", tz="UTC"))
+    us = pc.cast(ts, pa.int64()).to_numpy(zero_copy_only=False)
+    return fixed_field((us - PG_EPOCH_US).astype(">i8"), arr.is_valid().to_numpy(zero_copy_only=False))
+def float8_field(arr: pa.Array):
+    arr = pc.cast(arr, pa.float64())
+    return fixed_field(
+        arr.to_numpy(zero_copy_only=False).astype(">f8"),
+        arr.is_valid().to_numpy(zero_copy_only=False),
+    )
+def encode_copy_binary(fields) -> bytes:
+    n = len(fields[0][0])
+    row_sizes = np.full(n, 2, dtype=np.int64)
+    for lengths, _ in fields:
+        row_sizes += 4 + np.maximum(lengths, 0)
+    row_starts = np.concatenate(([0], np.cumsum(row_sizes)[:-1])) + len(PGCOPY_HEADER)
+    buf = np.empty(len(PGCOPY_HEADER) + int(row_sizes.sum()) + len(PGCOPY_TRAILER), dtype=np.uint8)
+    buf[: len(PGCOPY_HEADER)] = np.frombuffer(PGCOPY_HEADER, dtype=np.uint8)
+    buf[-len(PGCOPY_TRAILER) :] = np.frombuffer(PGCOPY_TRAILER, dtype=np.uint8)
+    field_count = np.full(n, len(fields), dtype=">i2").view(np.uint8).reshape(n, 2)
+    buf[row_starts[:, None] + np.arange(2)] = field_count
+    pos = row_starts + 2
+    for lengths, payload in fields:
+        buf[pos[:, None] + np.arange(4)] = lengths.astype(">i4").view(np.uint8).reshape(n, 4)
+        pos = pos + 4
+        present = lengths > 0
+        if isinstance(payload, tuple):
+            src_starts, data = payload
+            counts = np.where(present, lengths, 0)
+            total = int(counts.sum())
+            within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            buf[np.repeat(pos, counts) + within] = data[np.repeat(src_starts, counts) + within]
+        else:
+            width = payload.shape[1]
+            buf[pos[present][:, None] + np.arange(width)] = payload[present]
+        pos = pos + np.maximum(lengths, 0)
+    return buf.tobytes()
+def copy_binary(cur, table: str, columns: Iterable[str], fields) -> int:
+    if not fields or len(fields[0][0]) == 0:
+        return 0
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN (FORMAT binary)",
+        io.BytesIO(encode_copy_binary(fields)),
+    )
+    return len(fields[0][0])
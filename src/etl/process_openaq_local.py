@@ -1,98 +1,140 @@
+import argparse
+import csv
 import glob
+import gzip
 import os
-from typing import Iterable, Optional
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List
 import pandas as pd
 import pyarrow as pa
+import pyarrow.csv as pacsv
 import pyarrow.parquet as pq
+from openaq_filter import COLUMN_ALIASES, NUMERIC_COLUMNS, OUTPUT_SCHEMA, alias_columns, filter_batch
+from openaq_lake import LAKE_DIR, build_lake
 class Config:
     INPUT_ROOT = "data/raw/openaq_bulk"
     OUTPUT_DIR = "data/raw/openaq_bulk_filtered"
-    OUTPUT_FILE = os.path.join(OUTPUT_DIR, "filtered_openaq.parquet")
+    LAKE_DIR = LAKE_DIR
+    SHARD_DIR = os.path.join(OUTPUT_DIR, "_shards")
     POLLUTANTS = {"pm25", "no2"}
     COUNTRY = "US"
     BBOX = {"lat_min": 38.5, "lat_max": 42.3, "lon_min": -75.5, "lon_max": -71.5}
     START_DATE = "2019-01-01"
     END_DATE = "2024-12-31"
-    CHUNK_ROWS = 200_000
-def _first_present(df: pd.DataFrame, candidates: Iterable[str]) -> Optional[str]:
-    for c in candidates:
-        if c in df.columns:
-            return c
-    return None
-def _filter_chunk(df: pd.DataFrame) -> pd.DataFrame:
-    param_col = _first_present(df, ["parameter", "pollutant"])
-    country_col = _first_present(df, ["country"])
-    lat_col = _first_present(df, ["latitude", "coordinates.latitude", "lat"])
-    lon_col = _first_present(df, ["longitude", "coordinates.longitude", "lon", "lng"])
-    ts_col = _first_present(
-        df, ["date_utc", "utc", "timestamp", "datetime", "date.utc"]
+    BLOCK_SIZE = 16 << 20
+    WORKERS = os.cpu_count() or 1
+    TASKS_PER_WORKER = 4
+PARTITION_RE = re.compile(r"year=(\d{4}).*month=(\d{1,2})")
+def _month_in_range(year: int, month: int) -> bool:
+    start = pd.Timestamp(Config.START_DATE)
+    end = pd.Timestamp(Config.END_DATE)
+    return (start.year, start.month) <= (year, month) <= (end.year, end.month)
+def list_files() -> List[str]:
+    pattern = os.path.join(Config.INPUT_ROOT, "locationid=*", "year=*", "month=*")
+    dirs = glob.glob(pattern)
+    kept = []
+    for d in dirs:
+        m = PARTITION_RE.search(d)
+        if m is None or _month_in_range(int(m.group(1)), int(m.group(2))):
+            kept.append(d)
+    print(
+        f"kept {len(kept)} of {len(dirs)} year/month partitions "
+        f"in {Config.START_DATE}..{Config.END_DATE}"
     )
-    if param_col is None or lat_col is None or lon_col is None or ts_col is None:
-        return pd.DataFrame()
-    df = df.copy()
-    df[param_col] = df[param_col].astype(str).str.lower()
-    df = df[df[param_col].isin(Config.POLLUTANTS)]
-    if country_col:
-        df = df[df[country_col].astype(str).str.upper() == Config.COUNTRY]
-    if df.empty:
-        return df
-    df[ts_col] = pd.to_datetime(df[ts_col], errors="coerce", utc=True)
-    start = pd.to_datetime(Config.START_DATE, utc=True)
-    end = (
-        pd.to_datetime(Config.END_DATE, utc=True)
-        + pd.Timedelta(days=1)
-        - pd.Timedelta(seconds=1)
+    files = []
+    for d in kept:
+        files.extend(glob.glob(os.path.join(d, "*.csv.gz")))
+    return sorted(files)
+def _csv_header(path: str) -> List[str]:
+    with gzip.open(path, "rt", newline="") as f:
+        return next(csv.reader(f), [])
+def _read_options(path: str):
+    header = _csv_header(path)
+    wanted = alias_columns()
+    include = [c for c in header if c in wanted]
+    numeric = {c for key in NUMERIC_COLUMNS for c in COLUMN_ALIASES[key]}
+    column_types = {c: (pa.float64() if c in numeric else pa.string()) for c in include}
+    return (
+        include,
+        pacsv.ReadOptions(block_size=Config.BLOCK_SIZE),
+        pacsv.ConvertOptions(
+            include_columns=include, column_types=column_types, strings_can_be_null=True
+        ),
     )
-    df = df[(df[ts_col] >= start) & (df[ts_col] <= end)]
-    df[lat_col] = pd.to_numeric(df[lat_col], errors="coerce")
-    df[lon_col] = pd.to_numeric(df[lon_col], errors="coerce")
-    bbox = Config.BBOX
-    df = df[
-        (df[lat_col] >= bbox["lat_min"])
-        & (df[lat_col] <= bbox["lat_max"])
-        & (df[lon_col] >= bbox["lon_min"])
-        & (df[lon_col] <= bbox["lon_max"])
-    ]
-    if df.empty:
-        return df
-    output_cols = {
-        "parameter": param_col,
-        "value": _first_present(df, ["value"]),
-        "unit": _first_present(df, ["unit"]),
-        "country": country_col,
-        "latitude": lat_col,
-        "longitude": lon_col,
-        "timestamp_utc": ts_col,
-        "location": _first_present(df, ["location"]),
-        "city": _first_present(df, ["city"]),
-        "sourceName": _first_present(df, ["sourceName", "source"]),
-    }
-    selected = {k: df[v] for k, v in output_cols.items() if v}
-    return pd.DataFrame(selected)
-def process_all():
-    pattern = os.path.join(
-        Config.INPUT_ROOT, "locationid=*", "year=*", "month=*", "*.csv.gz"
-    )
-    files = sorted(glob.glob(pattern))
+def iter_filtered(path: str):
+    include, read_opts, convert_opts = _read_options(path)
+    if not include:
+        return
+    reader = pacsv.open_csv(path, read_options=read_opts, convert_options=convert_opts)
+    for batch in reader:
+        filtered = filter_batch(batch, Config)
+        if filtered is not None:
+            yield filtered
+def filter_files(paths: List[str], shard_path: str) -> int:
+    rows = 0
+    writer = None
+    try:
+        for path in paths:
+            for batch in iter_filtered(path):
+                if writer is None:
+                    writer = pq.ParquetWriter(shard_path, OUTPUT_SCHEMA)
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+def _balanced_tasks(files: List[str], n_tasks: int) -> List[List[str]]:
+    n_tasks = max(1, min(n_tasks, len(files)))
+    tasks = [[] for _ in range(n_tasks)]
+    loads = [0] * n_tasks
+    for path in sorted(files, key=os.path.getsize, reverse=True):
+        i = loads.index(min(loads))
+        tasks[i].append(path)
+        loads[i] += os.path.getsize(path)
+    return [t for t in tasks if t]
+def process_all(workers: int = Config.WORKERS):
+    start = time.perf_counter()
+    files = list_files()
     if not files:
         print(f"no files found under {Config.INPUT_ROOT}, check if you synced from S3")
         return
-    writer = None
     os.makedirs(Config.OUTPUT_DIR, exist_ok=True)
-    for path in files:
-        print(f"processing {path}")
-        for chunk in pd.read_csv(path, compression="gzip", chunksize=Config.CHUNK_ROWS):
-            filtered = _filter_chunk(chunk)
-            if filtered.empty:
-                continue
-            table = pa.Table.from_pandas(filtered, preserve_index=False)
-            if writer is None:
-                writer = pq.ParquetWriter(Config.OUTPUT_FILE, table.schema)
-            writer.write_table(table)
-    if writer:
-        writer.close()
-        print(f"wrote filtered parquet to {Config.OUTPUT_FILE}")
+    shutil.rmtree(Config.SHARD_DIR, ignore_errors=True)
+    os.makedirs(Config.SHARD_DIR)
+    tasks = _balanced_tasks(files, workers * Config.TASKS_PER_WORKER)
+    print(f"filtering {len(files)} files in {len(tasks)} tasks on {workers} workers")
+    shards = []
+    if workers <= 1:
+        for i, paths in enumerate(tasks):
+            shard = os.path.join(Config.SHARD_DIR, f"part-{i:05d}.parquet")
+            if filter_files(paths, shard):
+                shards.append(shard)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for i, paths in enumerate(tasks):
+                shard = os.path.join(Config.SHARD_DIR, f"part-{i:05d}.parquet")
+                futures[pool.submit(filter_files, paths, shard)] = shard
+            for fut in as_completed(futures):
+                if fut.result():
+                    shards.append(futures[fut])
+    filtered_at = time.perf_counter()
+    print(f"filtered {len(files)} files in {filtered_at - start:.1f}s")
+    if shards:
+        rows = build_lake(sorted(shards), Config.LAKE_DIR)
+        print(
+            f"wrote {rows} filtered rows to {Config.LAKE_DIR} "
+            f"({time.perf_counter() - filtered_at:.1f}s partitioning and sorting)"
+        )
     else:
         print("no data matched filters, parquet not written")
+    shutil.rmtree(Config.SHARD_DIR, ignore_errors=True)
 if __name__ == "__main__":
-    process_all()
+    parser = argparse.ArgumentParser(description="filter the local OpenAQ archive to the study area")
+    parser.add_argument("--workers", type=int, default=Config.WORKERS)
+    args = parser.parse_args()
+    process_all(args.workers)
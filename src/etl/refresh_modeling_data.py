@@ -0,0 +1,208 @@
+import argparse
+import os
+import time
+import psycopg2
+from dotenv import load_dotenv
+load_dotenv()
+WATERMARK = "modeling_data.change_seq"
+SOURCE_WATERMARK = "modeling_data.source"
+ANALYSIS_CACHE_STAMP = "data/cache/modeling_data/current.json"
+def get_conn():
+    required = ["PGHOST", "PGPORT", "PGDATABASE", "PGUSER", "PGPASSWORD"]
+    missing = [v for v in required if not os.getenv(v)]
+    if missing:
+        raise SystemExit(f"missing env vars: {', '.join(missing)}")
+    return psycopg2.connect(
+        host=os.getenv("PGHOST"),
+        port=os.getenv("PGPORT"),
+        dbname=os.getenv("PGDATABASE"),
+        user=os.getenv("PGUSER"),
+        password=os.getenv("PGPASSWORD"),
+    )
+def get_watermark(cur, name: str, default=None):
+    cur.execute("SELECT value FROM etl_watermarks WHERE name = %s", (name,))
+    row = cur.fetchone()
+    return row[0] if row else default
+def set_watermark(cur, name: str, value):
+    cur.execute(
+        """
+        INSERT INTO etl_watermarks (name, value, updated_at) VALUES (%s, %s, now())
+        ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value, updated_at = EXCLUDED.updated_at
+        """,
+        (name, str(value)),
+    )
+AFFECTED_SQL = """
+    CREATE TEMP TABLE affected ON COMMIT DROP AS
+    SELECT DISTINCT t.geo_id, a.year
+    FROM (
+        SELECT DISTINCT monitor_id, year
+        FROM monitor_year_agg
+        WHERE change_seq > %(since)s AND change_seq <= %(until)s
+    ) a
+    JOIN pollution_monitors m ON m.monitor_id = a.monitor_id
+    JOIN tracts t ON ST_Contains(t.geom, m.geom)
+    UNION
+    SELECT DISTINCT t.geo_id, a.year
+    FROM tracts t
+    JOIN pollution_monitors m ON ST_Contains(t.geom, m.geom)
+    JOIN monitor_year_agg a ON a.monitor_id = m.monitor_id
+    WHERE NOT EXISTS (SELECT 1 FROM modeling_data d WHERE d.geo_id = t.geo_id)
+    UNION
+    SELECT DISTINCT t.geo_id, y.year
+    FROM tracts t
+    JOIN LATERAL (
+        SELECT a.year
+        FROM pollution_monitors m
+        JOIN monitor_year_agg a ON a.monitor_id = m.monitor_id
+        WHERE ST_Contains(t.geom, m.geom)
+        UNION
+        SELECT d2.year FROM modeling_data d2 WHERE d2.geo_id = t.geo_id AND d2.year IS NOT NULL
+    ) y ON true
+    WHERE EXISTS (
+        SELECT 1 FROM modeling_data d
+        WHERE d.geo_id = t.geo_id AND d.geom_md5 IS DISTINCT FROM md5(ST_AsEWKB(t.geom))
+    );
+    CREATE INDEX ON affected (geo_id, year);
+    ANALYZE affected;
+"""
+RECOMPUTE_SQL = """
+    DELETE FROM modeling_data d
+    USING affected a
+    WHERE d.geo_id = a.geo_id AND (d.year = a.year OR d.year IS NULL);
+    WITH tract_pollution AS (
+        SELECT
+            a.geo_id,
+            a.year,
+            AVG(p.pm25_mean) as pm25_mean,
+            AVG(p.no2_mean) as no2_mean
+        FROM affected a
+        JOIN tracts t ON t.geo_id = a.geo_id
+        JOIN pollution_monitors m ON ST_Contains(t.geom, m.geom)
+        JOIN monitor_year_means p ON p.monitor_id = m.monitor_id AND p.year = a.year
+        GROUP BY a.geo_id, a.year
+    )
+    INSERT INTO modeling_data (
+        geo_id, state_code, county_code, asthma_prev, poverty_rate, population_density,
+        svi_ranking, year, pm25_mean, no2_mean, dist_primary_road_meters, population,
+        pm25_popweighted, no2_popweighted, geom_md5
+    )
+    SELECT
+        t.geo_id, t.state_code, t.county_code, t.asthma_prev, t.poverty_rate,
+        t.population_density, t.svi_ranking, tp.year, tp.pm25_mean, tp.no2_mean,
+        nr.dist_primary_road_meters, t.population, pw.pm25_mean, pw.no2_mean, md5(ST_AsEWKB(t.geom))
+    FROM tract_pollution tp
+    JOIN tracts t ON t.geo_id = tp.geo_id
+    LEFT JOIN tract_road_distance nr ON nr.geo_id = t.geo_id
+    LEFT JOIN tract_exposure_popweighted pw ON pw.geo_id = tp.geo_id AND pw.year = tp.year;
+"""
+EXPOSURE_SQL = """
+    INSERT INTO modeling_data (
+        geo_id, state_code, county_code, asthma_prev, poverty_rate, population_density,
+        svi_ranking, year, pm25_mean, no2_mean, dist_primary_road_meters, population,
+        pm25_popweighted, no2_popweighted, geom_md5
+    )
+    SELECT
+        t.geo_id, t.state_code, t.county_code, t.asthma_prev, t.poverty_rate,
+        t.population_density, t.svi_ranking, e.year, e.pm25_mean, e.no2_mean,
+        nr.dist_primary_road_meters, t.population, pw.pm25_mean, pw.no2_mean, md5(ST_AsEWKB(t.geom))
+    FROM tract_exposure e
+    JOIN tracts t ON t.geo_id = e.geo_id
+    LEFT JOIN tract_road_distance nr ON nr.geo_id = t.geo_id
+    LEFT JOIN tract_exposure_popweighted pw ON pw.geo_id = e.geo_id AND pw.year = e.year
+    WHERE e.pm25_mean IS NOT NULL OR e.no2_mean IS NOT NULL;
+"""
+SYNC_TRACTS_SQL = """
+    DELETE FROM modeling_data d
+    WHERE NOT EXISTS (SELECT 1 FROM tracts t WHERE t.geo_id = d.geo_id);
+    INSERT INTO modeling_data (
+        geo_id, state_code, county_code, asthma_prev, poverty_rate, population_density,
+        svi_ranking, year, pm25_mean, no2_mean, dist_primary_road_meters, population, geom_md5
+    )
+    SELECT
+        t.geo_id, t.state_code, t.county_code, t.asthma_prev, t.poverty_rate,
+        t.population_density, t.svi_ranking, NULL, NULL, NULL,
+        nr.dist_primary_road_meters, t.population, md5(ST_AsEWKB(t.geom))
+    FROM tracts t
+    LEFT JOIN tract_road_distance nr ON nr.geo_id = t.geo_id
+    WHERE NOT EXISTS (SELECT 1 FROM modeling_data d WHERE d.geo_id = t.geo_id);
+    UPDATE modeling_data d
+    SET state_code = t.state_code,
+        county_code = t.county_code,
+        asthma_prev = t.asthma_prev,
+        poverty_rate = t.poverty_rate,
+        population_density = t.population_density,
+        svi_ranking = t.svi_ranking,
+        dist_primary_road_meters = nr.dist_primary_road_meters,
+        population = t.population,
+        geom_md5 = md5(ST_AsEWKB(t.geom))
+    FROM tracts t
+    LEFT JOIN tract_road_distance nr ON nr.geo_id = t.geo_id
+    WHERE d.geo_id = t.geo_id
+      AND (d.state_code, d.county_code, d.asthma_prev, d.poverty_rate, d.population_density,
+           d.svi_ranking, d.dist_primary_road_meters, d.population, d.geom_md5)
+          IS DISTINCT FROM
+          (t.state_code, t.county_code, t.asthma_prev, t.poverty_rate, t.population_density,
+           t.svi_ranking, nr.dist_primary_road_meters, t.population, md5(ST_AsEWKB(t.geom)));
+    WITH popweighted AS (
+        SELECT d.geo_id, d.year, pw.pm25_mean, pw.no2_mean
+        FROM modeling_data d
+        LEFT JOIN tract_exposure_popweighted pw ON pw.geo_id = d.geo_id AND pw.year = d.year
+        WHERE d.year IS NOT NULL
+          AND (d.pm25_popweighted, d.no2_popweighted) IS DISTINCT FROM (pw.pm25_mean, pw.no2_mean)
+    )
+    UPDATE modeling_data d
+    SET pm25_popweighted = p.pm25_mean,
+        no2_popweighted = p.no2_mean
+    FROM popweighted p
+    WHERE d.geo_id = p.geo_id AND d.year = p.year;
+"""
+def run(full: bool = False, source: str = "contains"):
+    start = time.perf_counter()
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("LOCK TABLE modeling_data IN EXCLUSIVE MODE")
+            previous = get_watermark(cur, SOURCE_WATERMARK, "contains")
+            if source != previous:
+                print(f"pollution source changed from {previous} to {source}, rebuilding every row")
+                full = True
+            if full or source == "exposure":
+                cur.execute("TRUNCATE modeling_data")
+            since = -1 if full else int(get_watermark(cur, WATERMARK, -1))
+            cur.execute("LOCK TABLE monitor_year_agg IN SHARE MODE")
+            cur.execute("SELECT COALESCE(MAX(change_seq), 0) FROM monitor_year_agg")
+            until = cur.fetchone()[0]
+            t0 = time.perf_counter()
+            if source == "exposure":
+                cur.execute(EXPOSURE_SQL)
+                print(f"loaded {cur.rowcount} interpolated (geo_id, year) rows from tract_exposure ({time.perf_counter() - t0:.2f}s)")
+            else:
+                cur.execute(AFFECTED_SQL, {"since": since, "until": until})
+                cur.execute("SELECT COUNT(*) FROM affected")
+                n_affected = cur.fetchone()[0]
+                print(
+                    f"{n_affected} (geo_id, year) rows affected since change_seq {since} "
+                    f"({time.perf_counter() - t0:.2f}s)"
+                )
+                t0 = time.perf_counter()
+                cur.execute(RECOMPUTE_SQL)
+                print(f"recomputed pollution rows in {time.perf_counter() - t0:.2f}s")
+            t0 = time.perf_counter()
+            cur.execute(SYNC_TRACTS_SQL)
+            print(f"synced tract attributes in {time.perf_counter() - t0:.2f}s")
+            set_watermark(cur, WATERMARK, until)
+            set_watermark(cur, SOURCE_WATERMARK, source)
+        conn.commit()
+    if os.path.exists(ANALYSIS_CACHE_STAMP):
+        os.remove(ANALYSIS_CACHE_STAMP)
+    print(f"modeling_data refreshed from {source} up to change_seq {until} in {time.perf_counter() - start:.1f}s")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="incrementally refresh modeling_data")
+    parser.add_argument("--full", action="store_true", help="rebuild every (geo_id, year) row")
+    parser.add_argument(
+        "--source",
+        choices=["contains", "exposure"],
+        default="contains",
+        help="monitors inside each tract, or interpolated tract_exposure from compute_tract_exposure.py",
+    )
+    args = parser.parse_args()
+    run(full=args.full, source=args.source)
@@ -0,0 +1,502 @@
+import argparse
+import ast
+import csv
+import fnmatch
+import glob
+import hashlib
+import importlib
+import json
+import multiprocessing as mp
+import os
+import resource
+import runpy
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import wait
+class Config:
+    STATE_DIR = "data/pipeline"
+    STATE_FILE = os.path.join(STATE_DIR, "state.json")
+    HASH_CACHE_FILE = os.path.join(STATE_DIR, "file_hashes.json")
+    LOG_DIR = os.path.join(STATE_DIR, "logs")
+    RUNS_FILE = "reports/pipeline_runs.csv"
+    WORKERS = min(4, os.cpu_count() or 1)
+    HASH_WORKERS = 8
+    PRELOAD = ["numpy", "pandas", "pyarrow", "pyarrow.parquet", "psycopg2", "matplotlib.pyplot", "seaborn", "pygam"]
+STAGES = [
+    {"name": "fetch_highways", "group": "etl", "script": "src/etl/fetch_highways.py", "outputs": ["data/raw/highways"]},
+    {
+        "name": "load_highways",
+        "group": "etl",
+        "script": "src/etl/load_highways_to_postgis.py",
+        "inputs": ["data/raw/highways/tl_2023_*_prisecroads.*"],
+        "outputs": ["table:highways"],
+    },
+    {"name": "fetch_tracts", "group": "etl", "script": "src/etl/fetch_tracts.py", "outputs": ["data/raw/tracts"]},
+    {
+        "name": "load_tracts",
+        "group": "etl",
+        "script": "src/etl/load_tracts_to_postgis.py",
+        "inputs": ["data/raw/tracts"],
+        "outputs": ["table:tracts"],
+        "locks": ["tracts"],
+    },
+    {
+        "name": "fetch_blocks",
+        "group": "etl",
+        "script": "src/etl/fetch_blocks.py",
+        "outputs": ["data/processed/block_population.parquet"],
+    },
+    {"name": "fetch_acs", "group": "etl", "script": "src/etl/fetch_acs.py", "outputs": ["data/raw/acs/acs_2022.csv"]},
+    {
+        "name": "load_acs",
+        "group": "etl",
+        "script": "src/etl/load_acs_to_postgis.py",
+        "inputs": ["data/raw/acs/acs_2022.csv", "table:tracts"],
+        "outputs": ["table:tracts.acs"],
+        "locks": ["tracts"],
+    },
+    {"name": "fetch_svi", "group": "etl", "script": "src/etl/fetch_svi.py", "outputs": ["data/raw/svi"]},
+    {
+        "name": "load_svi",
+        "group": "etl",
+        "script": "src/etl/load_svi_to_postgis.py",
+        "inputs": ["data/raw/svi/SVI2020_US_tract.csv", "table:tracts"],
+        "outputs": ["table:tracts.svi"],
+        "locks": ["tracts"],
+    },
+    {
+        "name": "fetch_cdc_places",
+        "group": "etl",
+        "script": "src/etl/fetch_cdc_places.py",
+        "outputs": ["data/raw/cdc/places_tracts.csv"],
+    },
+    {
+        "name": "load_cdc_places",
+        "group": "etl",
+        "script": "src/etl/load_cdc_places_asthma.py",
+        "inputs": ["data/raw/cdc/places_tracts.csv", "table:tracts"],
+        "outputs": ["table:tracts.asthma"],
+        "locks": ["tracts"],
+    },
+    {
+        "name": "fetch_weather",
+        "group": "etl",
+        "script": "src/etl/fetch_weather.py",
+        "outputs": ["data/raw/weather/daily_covariates.csv"],
+    },
+    {
+        "name": "load_weather",
+        "group": "etl",
+        "script": "src/etl/load_weather_postgis.py",
+        "inputs": ["data/raw/weather/daily_covariates.csv"],
+        "outputs": ["table:daily_covariates"],
+    },
+    {
+        "name": "process_openaq",
+        "group": "etl",
+        "script": "src/etl/process_openaq_local.py",
+        "inputs": ["data/raw/openaq_bulk"],
+        "outputs": ["data/raw/openaq_bulk_filtered/dataset"],
+    },
+    {
+        "name": "load_openaq",
+        "group": "etl",
+        "script": "src/etl/load_openaq_to_postgis.py",
+        "args": ["--restart"],
+        "inputs": ["data/raw/openaq_bulk_filtered/dataset"],
+        "outputs": ["table:pollution_readings", "table:monitor_year_agg"],
+    },
+    {
+        "name": "compute_road_distance",
+        "group": "etl",
+        "script": "src/etl/compute_road_distance.py",
+        "inputs": ["table:tracts", "table:highways"],
+        "outputs": ["table:tract_road_distance"],
+    },
+    {
+        "name": "compute_tract_exposure",
+        "group": "etl",
+        "script": "src/etl/compute_tract_exposure.py",
+        "inputs": ["table:tracts", "table:monitor_year_agg"],
+        "outputs": ["table:tract_exposure"],
+    },
+    {
+        "name": "compute_population_exposure",
+        "group": "etl",
+        "script": "src/etl/compute_population_exposure.py",
+        "inputs": ["data/processed/block_population.parquet", "table:tracts", "table:monitor_year_agg"],
+        "outputs": ["table:tract_exposure_popweighted"],
+    },
+    {
+        "name": "compute_daily_features",
+        "group": "etl",
+        "script": "src/etl/compute_daily_features.py",
+        "inputs": ["data/raw/openaq_bulk_filtered/dataset", "table:tracts", "table:daily_covariates"],
+        "outputs": ["data/processed/daily_features"],
+    },
+    {
+        "name": "refresh_modeling_data",
+        "group": "etl",
+        "script": "src/etl/refresh_modeling_data.py",
+        "args": ["--source", "exposure"],
+        "inputs": [
+            "table:tracts",
+            "table:tracts.acs",
+            "table:tracts.svi",
+            "table:tracts.asthma",
+            "table:tract_road_distance",
+            "table:monitor_year_agg",
+            "table:tract_exposure",
+            "table:tract_exposure_popweighted",
+        ],
+        "outputs": ["table:modeling_data"],
+    },
+    {
+        "name": "sync_data",
+        "group": "analysis",
+        "script": "src/analysis/data.py",
+        "args": ["--check"],
+        "inputs": ["table:modeling_data"],
+        "outputs": ["data/cache/modeling_data/modeling_data-*.parquet"],
+    },
+    {
+        "name": "eda",
+        "group": "analysis",
+        "script": "src/analysis/eda.py",
+        "inputs": ["data/cache/modeling_data/modeling_data-*.parquet"],
+        "outputs": [
+            "reports/summary_stats.csv",
+            "reports/figures/hist_*.png",
+            "reports/figures/correlation_matrix.png",
+            "reports/figures/scatter_*.png",
+        ],
+    },
+    {
+        "name": "model_gam",
+        "group": "analysis",
+        "script": "src/analysis/model_gam.py",
+        "inputs": ["data/cache/modeling_data/modeling_data-*.parquet"],
+        "outputs": ["models/gam_asthma.pkl", "models/gam_asthma.npz", "reports/figures/gam_partial_dependence.png"],
+    },
+    {
+        "name": "intervention",
+        "group": "analysis",
+        "script": "src/analysis/intervention.py",
+        "inputs": ["data/cache/modeling_data/modeling_data-*.parquet", "models/gam_asthma.npz"],
+        "outputs": ["reports/intervention_impact.csv"],
+    },
+]
+GLOB_CHARS = "*?["
+def is_table(resource_name):
+    return resource_name.startswith("table:")
+def _root(pattern):
+    cut = min([pattern.find(c) for c in GLOB_CHARS if c in pattern] or [len(pattern)])
+    return pattern[:cut]
+def _within(path, parent):
+    return path == parent or path.startswith(parent.rstrip("/") + "/")
+def feeds(output, inp):
+    if is_table(output) or is_table(inp):
+        return output == inp
+    out_root, in_root = _root(output), _root(inp)
+    if output != out_root or inp != in_root:
+        return _within(out_root, in_root) or _within(in_root, out_root) or fnmatch.fnmatch(output, inp)
+    return _within(output, inp) or _within(inp, output)
+def build_graph(stages):
+    by_name = {s["name"]: s for s in stages}
+    deps = {name: set() for name in by_name}
+    for stage in stages:
+        for inp in stage.get("inputs", []):
+            for other in stages:
+                if other is not stage and any(feeds(out, inp) for out in other.get("outputs", [])):
+                    deps[stage["name"]].add(other["name"])
+    order, seen, visiting = [], set(), set()
+    def visit(name):
+        if name in seen:
+            return
+        if name in visiting:
+            raise SystemExit(f"dependency cycle through {name}")
+        visiting.add(name)
+        for dep in sorted(deps[name]):
+            visit(dep)
+        visiting.discard(name)
+        seen.add(name)
+        order.append(name)
+    for stage in stages:
+        visit(stage["name"])
+    return by_name, deps, order
+def select(stages, deps, targets, upstream):
+    if not targets:
+        return {s["name"] for s in stages}
+    names = set()
+    for target in targets:
+        matched = {s["name"] for s in stages if target in (s["name"], s.get("group"))}
+        if not matched:
+            raise SystemExit(f"unknown stage or group: {target}")
+        names |= matched
+    if upstream:
+        frontier = list(names)
+        while frontier:
+            for dep in deps[frontier.pop()]:
+                if dep not in names:
+                    names.add(dep)
+                    frontier.append(dep)
+    return names
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+def save_json(path, obj):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+class Hasher:
+    def __init__(self, cache):
+        self.cache = cache
+    def _file(self, path):
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+        hit = self.cache.get(path)
+        if hit and hit[:2] == stamp:
+            return hit[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        self.cache[path] = stamp + [digest]
+        return digest
+    def files(self, pattern):
+        root = _root(pattern)
+        paths = glob.glob(pattern) if root != pattern else [pattern]
+        found = []
+        for path in paths:
+            if os.path.isdir(path):
+                for dirpath, dirnames, filenames in os.walk(path):
+                    dirnames[:] = sorted(d for d in dirnames if not d.startswith((".", "_")))
+                    found.extend(os.path.join(dirpath, f) for f in filenames if not f.startswith((".", "_")))
+            elif os.path.exists(path):
+                found.append(path)
+        return sorted(found)
+    def resource(self, pattern, pool):
+        paths = self.files(pattern)
+        if not paths:
+            return None
+        digests = list(pool.map(self._file, paths))
+        h = hashlib.sha256()
+        for path, digest in zip(paths, digests):
+            h.update(f"{path}\0{digest}\n".encode())
+        return h.hexdigest()
+def local_imports(script):
+    folder = os.path.dirname(script)
+    todo, seen = [script], []
+    while todo:
+        path = todo.pop()
+        if path in seen or not os.path.exists(path):
+            continue
+        seen.append(path)
+        with open(path) as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            names = []
+            if isinstance(node, ast.Import):
+                names = [a.name for a in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+                names = [node.module]
+            for name in names:
+                todo.append(os.path.join(folder, name.split(".")[0] + ".py"))
+    return sorted(seen)
+def stage_key(stage, hasher, state, pool):
+    h = hashlib.sha256()
+    h.update(json.dumps([stage["script"], stage.get("args", [])]).encode())
+    for path in local_imports(stage["script"]):
+        h.update(f"{path}\0{hasher._file(path)}\n".encode())
+    for inp in stage.get("inputs", []):
+        if is_table(inp):
+            digest = next(
+                (s["outputs"].get(inp) for s in state.values() if inp in s.get("outputs", {})),
+                "external",
+            )
+        else:
+            digest = hasher.resource(inp, pool) or "missing"
+        h.update(f"{inp}\0{digest}\n".encode())
+    return h.hexdigest()[:16]
+def output_hashes(stage, key, hasher, pool):
+    out = {}
+    for o in stage.get("outputs", []):
+        out[o] = key if is_table(o) else hasher.resource(o, pool)
+    return out
+def up_to_date(stage, key, record, hasher, pool):
+    if not record or record.get("key") != key:
+        return False
+    current = output_hashes(stage, key, hasher, pool)
+    return all(current[o] is not None and current[o] == record["outputs"].get(o) for o in current)
+def _peak_rss_mb():
+    peak_kb = 0
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    peak_kb = int(line.split()[1])
+    except OSError:
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(peak_kb, children_kb) / 1024
+def _reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+def _run_stage(stage, log_path, conn):
+    _reset_peak_rss()
+    with open(log_path, "w") as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+    sys.stdout = os.fdopen(1, "w", buffering=1)
+    sys.stderr = os.fdopen(2, "w", buffering=1)
+    start = time.perf_counter()
+    error = None
+    script = stage["script"]
+    sys.path.insert(0, os.path.abspath(os.path.dirname(script)))
+    sys.argv = [script, *stage.get("args", [])]
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            error = str(e.code)
+    except BaseException:
+        traceback.print_exc()
+        error = traceback.format_exc().strip().splitlines()[-1]
+    sys.stdout.flush()
+    sys.stderr.flush()
+    conn.send({"error": error, "seconds": time.perf_counter() - start, "peak_rss_mb": _peak_rss_mb()})
+    conn.close()
+def preload(modules):
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    start = time.perf_counter()
+    loaded = []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except ImportError:
+            pass
+    print(f"preloaded {', '.join(loaded) or 'nothing'} in {time.perf_counter() - start:.1f}s")
+def record_runs(rows):
+    os.makedirs(os.path.dirname(Config.RUNS_FILE), exist_ok=True)
+    new = not os.path.exists(Config.RUNS_FILE)
+    with open(Config.RUNS_FILE, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["run_at", "stage", "status", "seconds", "peak_rss_mb", "key"])
+        if new:
+            writer.writeheader()
+        writer.writerows(rows)
+def run(targets=None, workers=Config.WORKERS, upstream=False, force=(), dry_run=False):
+    by_name, deps, order = build_graph(STAGES)
+    selected = select(STAGES, deps, targets, upstream)
+    force = set(force)
+    state = load_json(Config.STATE_FILE, {})
+    hasher = Hasher(load_json(Config.HASH_CACHE_FILE, {}))
+    pending = [n for n in order if n in selected]
+    done, failed, running, rows = set(), set(), {}, []
+    run_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+    start = time.perf_counter()
+    ctx = mp.get_context("fork")
+    os.makedirs(Config.LOG_DIR, exist_ok=True)
+    if not dry_run:
+        preload(Config.PRELOAD)
+    with ThreadPoolExecutor(Config.HASH_WORKERS) as pool:
+        while pending or running:
+            locked = {lock for name in running for lock in by_name[name].get("locks", [])}
+            for name in list(pending):
+                stage = by_name[name]
+                waiting_on = [d for d in deps[name] if d in selected and d not in done]
+                if any(d in failed for d in waiting_on):
+                    pending.remove(name)
+                    failed.add(name)
+                    print(f"{name:24s} blocked by a failed upstream stage")
+                    rows.append({"run_at": run_at, "stage": name, "status": "blocked"})
+                    continue
+                if waiting_on or len(running) >= workers or locked & set(stage.get("locks", [])):
+                    continue
+                pending.remove(name)
+                key = stage_key(stage, hasher, state, pool)
+                if name not in force and up_to_date(stage, key, state.get(name), hasher, pool):
+                    done.add(name)
+                    print(f"{name:24s} up to date ({key})")
+                    rows.append({"run_at": run_at, "stage": name, "status": "skipped", "key": key})
+                    continue
+                if dry_run:
+                    done.add(name)
+                    print(f"{name:24s} would run ({key})")
+                    continue
+                parent_conn, child_conn = ctx.Pipe(duplex=False)
+                log_path = os.path.join(Config.LOG_DIR, f"{name}.log")
+                proc = ctx.Process(target=_run_stage, args=(stage, log_path, child_conn), name=name)
+                proc.start()
+                child_conn.close()
+                running[name] = (proc, parent_conn, key, log_path)
+                locked |= set(stage.get("locks", []))
+                print(f"{name:24s} started (log {log_path})")
+            if not running:
+                continue
+            ready = wait([proc.sentinel for proc, *_ in running.values()])
+            for name in [n for n, (proc, *_) in running.items() if proc.sentinel in ready]:
+                proc, conn, key, log_path = running.pop(name)
+                result = conn.recv() if conn.poll() else {"error": f"exited with code {proc.exitcode}"}
+                proc.join()
+                conn.close()
+                row = {
+                    "run_at": run_at,
+                    "stage": name,
+                    "seconds": round(result.get("seconds", 0.0), 2),
+                    "peak_rss_mb": round(result.get("peak_rss_mb", 0.0), 1),
+                    "key": key,
+                }
+                if result["error"] is None:
+                    done.add(name)
+                    state[name] = {
+                        "key": key,
+                        "outputs": output_hashes(by_name[name], key, hasher, pool),
+                        "finished_at": time.time(),
+                        "seconds": row["seconds"],
+                        "peak_rss_mb": row["peak_rss_mb"],
+                    }
+                    save_json(Config.STATE_FILE, state)
+                    row["status"] = "ok"
+                    print(f"{name:24s} ok in {row['seconds']:.1f}s, peak rss {row['peak_rss_mb']:.0f}MB")
+                else:
+                    failed.add(name)
+                    row["status"] = "failed"
+                    print(f"{name:24s} failed after {row['seconds']:.1f}s: {result['error']} (see {log_path})")
+                rows.append(row)
+    save_json(Config.HASH_CACHE_FILE, hasher.cache)
+    if not dry_run:
+        record_runs(rows)
+    counts = {status: sum(r["status"] == status for r in rows) for status in ("ok", "skipped", "failed", "blocked")}
+    print(
+        f"pipeline finished in {time.perf_counter() - start:.1f}s: {counts['ok']} ran, {counts['skipped']} up to date, "
+        f"{counts['failed']} failed, {counts['blocked']} blocked"
+    )
+    return not failed
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="run the ETL and analysis stages as a cached DAG")
+    parser.add_argument("targets", nargs="*", help="stage or group names (etl, analysis); default is every stage")
+    parser.add_argument("--workers", type=int, default=Config.WORKERS, help="stages run at the same time")
+    parser.add_argument("--upstream", action="store_true", help="also run what the targets depend on")
+    parser.add_argument("--force", nargs="*", default=[], help="stages to rerun even if up to date")
+    parser.add_argument("--dry-run", action="store_true", help="only print which stages would run")
+    parser.add_argument("--list", action="store_true", help="print the stages and their dependencies")
+    args = parser.parse_args()
+    if args.list:
+        by_name, deps, order = build_graph(STAGES)
+        width = max(len(name) for name in order)
+        for name in order:
+            print(f"{name:{width}s} <- {', '.join(sorted(deps[name])) or '-'}")
+        raise SystemExit(0)
+    ok = run(args.targets, args.workers, args.upstream, args.force, args.dry_run)
+    raise SystemExit(0 if ok else 1)